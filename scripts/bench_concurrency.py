@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Flow2API Concurrency Manager Benchmark
+
+Compares the previous ConcurrencyManager (two counter dicts behind one
+global asyncio.Lock, a debug log call per acquire/release) with the
+per-token semaphores, under a paced load of acquire/release pairs.
+
+Each pair takes an image slot on a random token, holds it for --hold-ms
+and gives it back. Pairs are started in 1 ms ticks at --rate per second.
+Reported per implementation:
+- pairs completed per second, and pairs that found no free slot
+- acquire latency (call -> slot taken or refused): p50, p99, max
+- event loop lag (how late the 1 ms ticks ran): p99, max
+- CPU time per pair
+
+"semaphore, wait" uses acquire(timeout=) instead of failing when the
+token is full. --debug-log turns the debug log on (written to the log
+file) to include its per-call cost.
+
+Usage:
+    python scripts/bench_concurrency.py                        # 10k pairs/s for 5 s
+    python scripts/bench_concurrency.py --rate 20000 --tokens 20
+    python scripts/bench_concurrency.py --debug-log
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.core.config import config  # noqa: E402
+from src.core.logger import debug_logger  # noqa: E402
+from src.services.concurrency_manager import ConcurrencyManager  # noqa: E402
+
+
+class LegacyConcurrencyManager:
+    """Previous ConcurrencyManager (image path only)"""
+
+    def __init__(self):
+        self._image_concurrency: Dict[int, int] = {}
+        self._lock = asyncio.Lock()
+
+    async def initialize(self, tokens: list):
+        async with self._lock:
+            for token in tokens:
+                if token.image_concurrency and token.image_concurrency > 0:
+                    self._image_concurrency[token.id] = token.image_concurrency
+
+    async def acquire_image(self, token_id: int) -> bool:
+        async with self._lock:
+            if token_id not in self._image_concurrency:
+                return True
+            if self._image_concurrency[token_id] <= 0:
+                return False
+            self._image_concurrency[token_id] -= 1
+            debug_logger.log_info(f"Token {token_id} acquired image slot (remaining: {self._image_concurrency[token_id]})")
+            return True
+
+    async def release_image(self, token_id: int):
+        async with self._lock:
+            if token_id in self._image_concurrency:
+                self._image_concurrency[token_id] += 1
+                debug_logger.log_info(f"Token {token_id} released image slot (remaining: {self._image_concurrency[token_id]})")
+
+
+def percentile(samples: list, q: float) -> float:
+    return samples[min(int(len(samples) * q), len(samples) - 1)] if samples else 0.0
+
+
+async def run(acquire, release, args) -> dict:
+    rng = random.Random(args.seed)
+    hold = args.hold_ms / 1000
+    latencies, lags = [], []
+    counts = {"done": 0, "refused": 0}
+    tasks = set()
+
+    async def pair(token_id: int):
+        start = time.perf_counter()
+        acquired = await acquire(token_id)
+        latencies.append(time.perf_counter() - start)
+        if not acquired:
+            counts["refused"] += 1
+            return
+        try:
+            if hold:
+                await asyncio.sleep(hold)
+        finally:
+            await release(token_id)
+        counts["done"] += 1
+
+    cpu_start = time.process_time()
+    started = time.perf_counter()
+    launched = 0
+    tick = started
+    while True:
+        now = time.perf_counter()
+        lags.append(max(now - tick, 0))
+        elapsed = now - started
+        if elapsed >= args.seconds:
+            break
+        for _ in range(int(elapsed * args.rate) - launched):
+            task = asyncio.create_task(pair(rng.randint(1, args.tokens)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            launched += 1
+        tick = now + 0.001
+        await asyncio.sleep(0.001)
+    if tasks:
+        await asyncio.gather(*tasks)
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_start
+
+    latencies.sort()
+    lags.sort()
+    return {
+        "rate": counts["done"] / wall,
+        "refused": counts["refused"],
+        "p50": percentile(latencies, 0.5) * 1e6,
+        "p99": percentile(latencies, 0.99) * 1e6,
+        "max": latencies[-1] * 1e6 if latencies else 0.0,
+        "lag_p99": percentile(lags, 0.99) * 1000,
+        "lag_max": lags[-1] * 1000 if lags else 0.0,
+        "cpu_per_pair": cpu / max(launched, 1) * 1e6,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Flow2API concurrency manager")
+    parser.add_argument("--rate", type=int, default=10000, help="Acquire/release pairs started per second")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration per implementation")
+    parser.add_argument("--tokens", type=int, default=50, help="Number of tokens")
+    parser.add_argument("--limit", type=int, default=2, help="Image concurrency per token")
+    parser.add_argument("--hold-ms", type=float, default=5.0, help="Time a slot is held")
+    parser.add_argument("--wait-timeout", type=float, default=1.0, help="acquire(timeout=) of the wait run")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (same token sequence for all runs)")
+    parser.add_argument("--debug-log", action="store_true", help="Enable the debug log during the runs")
+    args = parser.parse_args()
+
+    config.set_debug_enabled(args.debug_log)
+    tokens = [SimpleNamespace(id=i + 1, image_concurrency=args.limit, video_concurrency=-1) for i in range(args.tokens)]
+
+    legacy = LegacyConcurrencyManager()
+    await legacy.initialize(tokens)
+    semaphores = ConcurrencyManager()
+    await semaphores.initialize(tokens)
+
+    async def try_acquire(token_id: int) -> bool:
+        return semaphores.try_acquire("image", token_id)
+
+    async def wait_acquire(token_id: int) -> bool:
+        return await semaphores.acquire("image", token_id, args.wait_timeout)
+
+    async def release(token_id: int):
+        semaphores.release("image", token_id)
+
+    cases = (
+        ("global lock (previous)", legacy.acquire_image, legacy.release_image),
+        ("semaphore, try_acquire", try_acquire, release),
+        ("semaphore, wait", wait_acquire, release),
+    )
+
+    print(f"Target: {args.rate} pairs/s for {args.seconds:.0f}s, {args.tokens} tokens x {args.limit} slots, "
+          f"hold {args.hold_ms:.0f} ms, debug log {'on' if args.debug_log else 'off'}")
+    print(f"\n  {'implementation':<24}{'pairs/s':>9}{'refused':>9}{'acq p50 (us)':>14}{'p99':>10}{'max':>10}"
+          f"{'lag p99 (ms)':>14}{'max':>8}{'cpu/pair (us)':>15}")
+    for name, acquire, release_slot in cases:
+        r = await run(acquire, release_slot, args)
+        print(f"  {name:<24}{r['rate']:>9.0f}{r['refused']:>9}{r['p50']:>14.1f}{r['p99']:>10.1f}{r['max']:>10.0f}"
+              f"{r['lag_p99']:>14.2f}{r['lag_max']:>8.1f}{r['cpu_per_pair']:>15.1f}")
+    print(f"\n  waiters left: {semaphores.get_stats()['image']['waiting']}, "
+          f"slots in use: {semaphores.get_stats()['image']['in_use']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Flow2API Database Micro-benchmark
+
+Compares the connect-per-call path (Database used without open()) with the
+persistent connection pool (Database.open()) on a token table of N rows.
+
+Usage:
+    python scripts/bench_db.py                  # 1000 tokens, 2000 ops per case
+    python scripts/bench_db.py --tokens 5000    # Larger token table
+    python scripts/bench_db.py --ops 500        # Fewer operations per case
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.core.database import Database  # noqa: E402
+from src.core.models import Token  # noqa: E402
+
+
+async def seed(db: Database, count: int):
+    """Create schema and insert `count` tokens"""
+    await db.init_db()
+    await db.init_config_from_toml({}, is_first_startup=True)
+    for i in range(count):
+        await db.add_token(Token(st=f"st-{i}", at=f"at-{i}", email=f"user{i}@example.com"))
+
+
+async def time_case(name: str, ops: int, func) -> dict:
+    """Run `func` `ops` times and collect per-call latency"""
+    samples = []
+    for _ in range(ops):
+        start = time.perf_counter()
+        await func()
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    samples.sort()
+    return {
+        "name": name,
+        "mean": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p99": samples[int(len(samples) * 0.99) - 1],
+    }
+
+
+async def run_cases(db: Database, token_count: int, ops: int) -> list:
+    """Benchmark the hot-path operations against `db`"""
+    ids = list(range(1, token_count + 1))
+
+    async def get_token():
+        await db.get_token(random.choice(ids))
+
+    async def update_token():
+        await db.update_token(random.choice(ids), credits=random.randint(0, 1000))
+
+    async def get_admin_config():
+        await db.get_admin_config()
+
+    return [
+        await time_case("get_token", ops, get_token),
+        await time_case("update_token", ops, update_token),
+        await time_case("get_admin_config", ops, get_admin_config),
+    ]
+
+
+def print_results(title: str, results: list):
+    print(f"\n{title}")
+    print(f"  {'operation':<20}{'mean (us)':>12}{'p50 (us)':>12}{'p99 (us)':>12}")
+    for r in results:
+        print(f"  {r['name']:<20}{r['mean']:>12.1f}{r['p50']:>12.1f}{r['p99']:>12.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark Flow2API database access paths")
+    parser.add_argument("--tokens", type=int, default=1000, help="Number of tokens to seed")
+    parser.add_argument("--ops", type=int, default=2000, help="Operations per case")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(str(Path(tmp) / "bench.db"))
+        print(f"Seeding {args.tokens} tokens...")
+        await seed(db, args.tokens)
+
+        # Old path: a fresh aiosqlite connection (and thread) per call
+        old_results = await run_cases(db, args.tokens, args.ops)
+
+        # New path: persistent pool
+        await db.open()
+        new_results = await run_cases(db, args.tokens, args.ops)
+        await db.close()
+
+    print_results("Connect-per-call", old_results)
+    print_results("Pooled connections", new_results)
+
+    print("\nSpeedup (mean)")
+    for old, new in zip(old_results, new_results):
+        print(f"  {old['name']:<20}{old['mean'] / new['mean']:>11.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
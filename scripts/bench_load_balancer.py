@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Flow2API Load Balancer Benchmark
+
+Compares the previous LoadBalancer.select_token (linear filter over every
+active token, awaiting the concurrency manager per token) with selection
+from the capability-indexed TokenPools.
+
+Tokens have mixed image/video flags, paygate tiers and concurrency limits;
+a share of the limited tokens has its slots taken so the filter has work
+to do.
+
+Usage:
+    python scripts/bench_load_balancer.py                 # 5000 tokens
+    python scripts/bench_load_balancer.py --tokens 20000  # Larger pool
+    python scripts/bench_load_balancer.py --ops 200       # Fewer selections
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.core.models import Token  # noqa: E402
+from src.services.concurrency_manager import ConcurrencyManager  # noqa: E402
+from src.services.load_balancer import LoadBalancer  # noqa: E402
+from src.services.token_manager import TokenManager  # noqa: E402
+
+
+async def linear_select(token_manager: TokenManager, concurrency_manager: ConcurrencyManager,
+                        for_image_generation: bool = False, for_video_generation: bool = False):
+    """Previous LoadBalancer.select_token (O(N) filter with awaits per token)"""
+    available_tokens = []
+    now = time.time()
+    for token in token_manager.get_active_runtime():
+        if not token.at_fresh(now) and not await token_manager.is_at_valid(token.id):
+            continue
+        if for_image_generation:
+            if not token.image_enabled:
+                continue
+            if not await concurrency_manager.can_use_image(token.id):
+                continue
+        if for_video_generation:
+            if not token.video_enabled:
+                continue
+            if not await concurrency_manager.can_use_video(token.id):
+                continue
+        available_tokens.append(token)
+    if not available_tokens:
+        return None
+    return await token_manager.get_token(random.choice(available_tokens).id)
+
+
+def make_tokens(count: int) -> list:
+    expires = datetime.now(timezone.utc) + timedelta(hours=12)
+    tiers = ["PAYGATE_TIER_ONE", "PAYGATE_TIER_TWO", "PAYGATE_TIER_NOT_PAID"]
+    return [
+        Token(
+            id=i + 1,
+            st=f"st-{i}",
+            at=f"at-{i}",
+            at_expires=expires,
+            email=f"user{i}@example.com",
+            is_active=i % 10 != 0,
+            user_paygate_tier=tiers[(i // 2) % len(tiers)],
+            image_enabled=i % 7 != 0,
+            video_enabled=i % 3 != 0,
+            image_concurrency=2 if i % 2 else -1,
+            video_concurrency=1 if i % 4 else -1
+        )
+        for i in range(count)
+    ]
+
+
+async def time_selection(select, ops: int) -> dict:
+    samples = []
+    for _ in range(ops):
+        start = time.perf_counter()
+        await select()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p99": samples[int(len(samples) * 0.99) - 1],
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark Flow2API token selection")
+    parser.add_argument("--tokens", type=int, default=5000, help="Number of tokens")
+    parser.add_argument("--ops", type=int, default=500, help="Selections per case")
+    args = parser.parse_args()
+
+    token_manager = TokenManager(None, None)
+    concurrency_manager = ConcurrencyManager()
+    load_balancer = LoadBalancer(token_manager, concurrency_manager)
+
+    tokens = make_tokens(args.tokens)
+    for token in tokens:
+        token_manager.registry.put(token)
+    await concurrency_manager.initialize(tokens)
+
+    # Take the slots of a quarter of the limited tokens
+    for token in tokens[::4]:
+        while await concurrency_manager.acquire_image(token.id) and token.image_concurrency > 0:
+            pass
+        while await concurrency_manager.acquire_video(token.id) and token.video_concurrency > 0:
+            pass
+
+    print(f"Tokens: {args.tokens}, ready pools: {load_balancer.pools.get_stats()}")
+    print(f"\nselect_token latency ({args.ops} selections each)")
+    print(f"  {'case':<28}{'mean (ms)':>12}{'p50 (ms)':>12}{'p99 (ms)':>12}")
+
+    for label, kwargs in (("image", {"for_image_generation": True}), ("video", {"for_video_generation": True})):
+        linear = await time_selection(
+            lambda: linear_select(token_manager, concurrency_manager, **kwargs), args.ops
+        )
+        indexed = await time_selection(lambda: load_balancer.select_token(**kwargs), args.ops)
+        for name, r in ((f"{label}: linear filter", linear), (f"{label}: indexed pools", indexed)):
+            print(f"  {name:<28}{r['mean']:>12.3f}{r['p50']:>12.3f}{r['p99']:>12.3f}")
+        print(f"  {label} speedup (mean): {linear['mean'] / indexed['mean']:.0f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
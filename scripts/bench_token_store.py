@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Flow2API Token Store Benchmark
+
+Compares the previous token store (one pydantic Token per token, selection
+walking Token models) with the compact TokenRegistry (row tuples plus
+__slots__ TokenRuntime records, Token models built lazily).
+
+Reports memory per 10k tokens and LoadBalancer.select_token latency.
+
+Usage:
+    python scripts/bench_token_store.py                 # 10000 tokens
+    python scripts/bench_token_store.py --tokens 2000   # Smaller pool
+    python scripts/bench_token_store.py --ops 200       # Fewer selections
+"""
+
+import argparse
+import asyncio
+import gc
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.core.models import Token  # noqa: E402
+from src.services.load_balancer import LoadBalancer  # noqa: E402
+from src.services.token_manager import TokenManager  # noqa: E402
+from src.services.token_registry import TokenRegistry  # noqa: E402
+
+
+class LegacyRegistry:
+    """Previous registry layout: one validated Token model per token"""
+
+    def __init__(self):
+        self._tokens = {}
+
+    def put(self, token: Token):
+        self._tokens[token.id] = token
+
+    def get(self, token_id: int):
+        return self._tokens.get(token_id)
+
+    def active(self):
+        return [t for t in self._tokens.values() if t.is_active]
+
+
+async def legacy_select(token_manager: TokenManager, for_image_generation: bool = True):
+    """Previous LoadBalancer.select_token (Token models, is_at_valid per token)"""
+    available_tokens = []
+    for token in token_manager.registry.active():
+        if not await token_manager.is_at_valid(token.id):
+            continue
+        if for_image_generation and not token.image_enabled:
+            continue
+        available_tokens.append(token)
+    return random.choice(available_tokens) if available_tokens else None
+
+
+def make_tokens(count: int) -> list:
+    """Build `count` validated tokens with realistic field sizes"""
+    expires = datetime.now(timezone.utc) + timedelta(hours=12)
+    tokens = []
+    for i in range(count):
+        tokens.append(Token(
+            id=i + 1,
+            st=f"st-{i:06d}-" + "s" * 900,
+            at=f"ya29.{i:06d}-" + "a" * 200,
+            at_expires=expires,
+            email=f"user{i}@example.com",
+            name=f"user{i}",
+            is_active=i % 10 != 0,
+            created_at=datetime.now(),
+            credits=random.randint(0, 1000),
+            user_paygate_tier="PAYGATE_TIER_ONE",
+            current_project_id=f"{i:08d}-0000-0000-0000-000000000000",
+            current_project_name="Oct 17 - 00:00",
+            image_enabled=i % 7 != 0,
+            video_enabled=True,
+            image_concurrency=2,
+            video_concurrency=1
+        ))
+    return tokens
+
+
+def measure_memory(build) -> int:
+    """Bytes retained by the object returned from build()"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+    return after - before
+
+
+async def time_selection(select, ops: int) -> dict:
+    samples = []
+    for _ in range(ops):
+        start = time.perf_counter()
+        await select()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p99": samples[int(len(samples) * 0.99) - 1],
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark Flow2API token store layouts")
+    parser.add_argument("--tokens", type=int, default=10000, help="Number of tokens")
+    parser.add_argument("--ops", type=int, default=500, help="Selections per case")
+    args = parser.parse_args()
+
+    print(f"Building {args.tokens} tokens...")
+
+    def build_legacy():
+        # Tokens are built inside the measurement: the previous store kept the
+        # validated models themselves
+        registry = LegacyRegistry()
+        for token in make_tokens(args.tokens):
+            registry.put(token)
+        return registry
+
+    def build_compact():
+        registry = TokenRegistry()
+        for token in make_tokens(args.tokens):
+            registry.put(token)
+        return registry
+
+    legacy_bytes = measure_memory(build_legacy)
+    compact_bytes = measure_memory(build_compact)
+
+    # Selection: TokenManager without database (all tokens have a fresh AT)
+    legacy_tm = TokenManager(None, None)
+    legacy_tm.registry = build_legacy()
+    compact_tm = TokenManager(None, None)
+    compact_tm.registry = build_compact()
+    load_balancer = LoadBalancer(compact_tm)
+
+    legacy_sel = await time_selection(lambda: legacy_select(legacy_tm), args.ops)
+    compact_sel = await time_selection(
+        lambda: load_balancer.select_token(for_image_generation=True), args.ops
+    )
+
+    per_10k = 10000 / args.tokens
+    print(f"\nMemory (scaled to 10k tokens)")
+    print(f"  {'Token models':<22}{legacy_bytes * per_10k / 1024 / 1024:>10.2f} MiB")
+    print(f"  {'Compact registry':<22}{compact_bytes * per_10k / 1024 / 1024:>10.2f} MiB")
+
+    print(f"\nselect_token latency ({args.tokens} tokens)")
+    print(f"  {'store':<22}{'mean (ms)':>12}{'p50 (ms)':>12}{'p99 (ms)':>12}")
+    for name, r in (("Token models", legacy_sel), ("Compact registry", compact_sel)):
+        print(f"  {name:<22}{r['mean']:>12.3f}{r['p50']:>12.3f}{r['p99']:>12.3f}")
+
+    print(f"\nSpeedup (mean): {legacy_sel['mean'] / compact_sel['mean']:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Flow2API AT Refresh Check
+
+Checks the single-flight AT refresh of TokenManager (_refresh_at) against
+a fake FlowClient that counts st_to_at calls per session token:
+- N concurrent callers per token trigger exactly one st_to_at call per
+  token, and every caller gets the shared result
+- no more than --parallel tokens refresh at the same time
+- a cancelled caller does not cancel the refresh the others await
+- once a refresh is done, the next call starts a new one
+
+Exits with status 1 if a check fails.
+
+Usage:
+    python scripts/check_at_refresh.py                          # 20 tokens x 50 callers
+    python scripts/check_at_refresh.py --tokens 100 --callers 200
+"""
+
+import argparse
+import asyncio
+import sys
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.core.database import Database  # noqa: E402
+from src.core.models import Token  # noqa: E402
+from src.services.token_manager import TokenManager  # noqa: E402
+
+
+class FakeFlowClient:
+    """Answers st_to_at / get_credits after a delay, counting the calls"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.st_to_at_calls: Counter = Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def st_to_at(self, st: str) -> dict:
+        self.st_to_at_calls[st] += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        expires = datetime.now(timezone.utc) + timedelta(hours=10)
+        return {
+            "access_token": f"at-{st}-{self.st_to_at_calls[st]}",
+            "expires": expires.isoformat(),
+            "user": {"email": f"{st}@example.com", "name": st}
+        }
+
+    async def get_credits(self, at: str) -> dict:
+        return {"credits": 100}
+
+
+def report(name: str, ok: bool, detail: str) -> bool:
+    print(f"  [{'PASS' if ok else 'FAIL'}] {name}: {detail}")
+    return ok
+
+
+async def run_checks(db: Database, args) -> bool:
+    await db.init_db()
+    await db.init_config_from_toml({}, is_first_startup=True)
+    for i in range(args.tokens):
+        # No AT yet: every is_at_valid() call needs a refresh
+        await db.add_token(Token(st=f"st-{i}", email=f"user{i}@example.com"))
+
+    flow = FakeFlowClient(args.delay)
+    manager = TokenManager(db, flow, max_refresh_parallel=args.parallel)
+    await manager.load_tokens()
+    token_ids = [token.id for token in await manager.get_all_tokens()]
+    ok = True
+
+    # Burst: every caller of every token at once
+    results = await asyncio.gather(*[
+        manager.is_at_valid(token_id) for token_id in token_ids for _ in range(args.callers)
+    ])
+    calls = [flow.st_to_at_calls[f"st-{i}"] for i in range(args.tokens)]
+    ok &= report(
+        "one st_to_at per token",
+        all(count == 1 for count in calls),
+        f"{len(results)} callers, {sum(calls)} st_to_at calls for {args.tokens} tokens"
+    )
+    ok &= report("shared result", all(results), f"{results.count(True)}/{len(results)} callers got True")
+    ok &= report(
+        "refresh parallelism",
+        flow.peak_in_flight <= args.parallel,
+        f"peak {flow.peak_in_flight} refreshes at once (limit {args.parallel})"
+    )
+    ok &= report("no refresh left in flight", not manager._refreshing, f"{len(manager._refreshing)} left")
+
+    # A caller cancelled mid-refresh
+    token_id = token_ids[0]
+    before = flow.st_to_at_calls["st-0"]
+    cancelled = asyncio.create_task(manager.refresh_at(token_id))
+    waiting = asyncio.create_task(manager.refresh_at(token_id))
+    await asyncio.sleep(args.delay / 2)
+    cancelled.cancel()
+    result = await waiting
+    ok &= report(
+        "cancelled caller",
+        result is True and cancelled.cancelled() and flow.st_to_at_calls["st-0"] == before + 1,
+        f"other caller got {result}, {flow.st_to_at_calls['st-0'] - before} st_to_at call"
+    )
+
+    # A later call is a new refresh, not the finished one
+    before = flow.st_to_at_calls["st-0"]
+    await manager.refresh_at(token_id)
+    ok &= report(
+        "next refresh",
+        flow.st_to_at_calls["st-0"] == before + 1,
+        f"{flow.st_to_at_calls['st-0'] - before} st_to_at call"
+    )
+    return ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Check the single-flight AT refresh of the token manager")
+    parser.add_argument("--tokens", type=int, default=20, help="Number of tokens")
+    parser.add_argument("--callers", type=int, default=50, help="Concurrent callers per token")
+    parser.add_argument("--parallel", type=int, default=8, help="max_refresh_parallel of the token manager")
+    parser.add_argument("--delay", type=float, default=0.05, help="Seconds a fake st_to_at call takes")
+    args = parser.parse_args()
+
+    print(f"{args.tokens} tokens x {args.callers} concurrent callers, max_refresh_parallel {args.parallel}")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(str(Path(tmp) / "check.db"))
+        await db.open()
+        try:
+            ok = await run_checks(db, args)
+        finally:
+            await db.close()
+
+    print("\nAll checks passed" if ok else "\nSome checks failed")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Flow2API Daily Stats Rollover Check
+
+Checks that the token counter upsert (TOKEN_STATS_UPDATE_SQL, used by
+Database.increment_stats and apply_token_stats) loses no increment when
+the day rolls over under concurrency.
+
+Every token starts with counters dated yesterday. --coroutines concurrent
+writers then add image / video / error counts through increment_stats and
+apply_token_stats. Expected afterwards, per token:
+- totals = yesterday's totals + every increment
+- today's counters = only the increments (yesterday's are dropped once)
+- today_date = today
+
+Both database paths are checked: connect-per-call (Database used without
+open()) and the persistent connection pool. Exits with status 1 if a
+check fails.
+
+Usage:
+    python scripts/check_stats_rollover.py                   # 200 coroutines, 5 tokens
+    python scripts/check_stats_rollover.py --coroutines 1000 --tokens 20
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.core.database import Database  # noqa: E402
+from src.core.models import Token  # noqa: E402
+from src.services.stats_aggregator import PendingTokenStats  # noqa: E402
+
+# Counters each token has from yesterday
+YESTERDAY = {"image": 7, "video": 5, "error": 3}
+
+
+async def seed(db: Database, count: int) -> list:
+    """Create schema and `count` tokens whose counters are dated yesterday"""
+    await db.init_db()
+    await db.init_config_from_toml({}, is_first_startup=True)
+    token_ids = [
+        await db.add_token(Token(st=f"st-{i}", at=f"at-{i}", email=f"user{i}@example.com"))
+        for i in range(count)
+    ]
+    yesterday = str(date.today() - timedelta(days=1))
+    async with db._write() as conn:
+        await conn.execute("""
+            UPDATE token_stats
+            SET image_count = ?, video_count = ?, error_count = ?,
+                today_image_count = ?, today_video_count = ?, today_error_count = ?,
+                today_date = ?
+        """, (
+            YESTERDAY["image"], YESTERDAY["video"], YESTERDAY["error"],
+            YESTERDAY["image"], YESTERDAY["video"], YESTERDAY["error"],
+            yesterday
+        ))
+    return token_ids
+
+
+async def run_writers(db: Database, token_ids: list, coroutines: int, rng: random.Random) -> dict:
+    """Start all writers at once, return the increments per token"""
+    expected = {token_id: {"image": 0, "video": 0, "error": 0} for token_id in token_ids}
+    start = asyncio.Event()
+
+    async def writer(token_id: int, image: int, video: int, error: int, batched: bool):
+        await start.wait()
+        if batched:
+            pending = PendingTokenStats()
+            pending.image, pending.video, pending.error = image, video, error
+            await db.apply_token_stats({token_id: pending})
+        else:
+            await db.increment_stats(token_id, image=image, video=video, error=error)
+
+    tasks = []
+    for _ in range(coroutines):
+        token_id = rng.choice(token_ids)
+        image, video, error = rng.randint(0, 2), rng.randint(0, 2), rng.randint(0, 1)
+        counts = expected[token_id]
+        counts["image"] += image
+        counts["video"] += video
+        counts["error"] += error
+        tasks.append(asyncio.create_task(writer(token_id, image, video, error, rng.random() < 0.5)))
+    start.set()
+    await asyncio.gather(*tasks)
+    return expected
+
+
+async def check(db: Database, title: str, args) -> bool:
+    token_ids = await seed(db, args.tokens)
+    expected = await run_writers(db, token_ids, args.coroutines, random.Random(args.seed))
+
+    today = str(date.today())
+    failures = []
+    for token_id in token_ids:
+        stats = await db.get_token_stats(token_id)
+        counts = expected[token_id]
+        got = {
+            "image_count": stats.image_count,
+            "video_count": stats.video_count,
+            "error_count": stats.error_count,
+            "today_image_count": stats.today_image_count,
+            "today_video_count": stats.today_video_count,
+            "today_error_count": stats.today_error_count,
+            "today_date": str(stats.today_date),
+        }
+        want = {
+            "image_count": YESTERDAY["image"] + counts["image"],
+            "video_count": YESTERDAY["video"] + counts["video"],
+            "error_count": YESTERDAY["error"] + counts["error"],
+            "today_image_count": counts["image"],
+            "today_video_count": counts["video"],
+            "today_error_count": counts["error"],
+            "today_date": today,
+        }
+        failures += [
+            f"token {token_id} {field}: {got[field]} != {want[field]}"
+            for field in want if got[field] != want[field]
+        ]
+
+    ok = not failures
+    print(f"  [{'PASS' if ok else 'FAIL'}] {title}: {args.coroutines} concurrent writers on {args.tokens} tokens")
+    for failure in failures:
+        print(f"      {failure}")
+    return ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Check the daily rollover of token counters under concurrency")
+    parser.add_argument("--coroutines", type=int, default=200, help="Concurrent writers")
+    parser.add_argument("--tokens", type=int, default=5, help="Number of tokens")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    args = parser.parse_args()
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        ok &= await check(Database(str(Path(tmp) / "per_call.db")), "connect-per-call", args)
+
+        db = Database(str(Path(tmp) / "pooled.db"))
+        await db.open()
+        try:
+            ok &= await check(db, "pooled connections", args)
+        finally:
+            await db.close()
+
+    print("\nAll checks passed" if ok else "\nSome checks failed")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Flow2API Token Selection Simulation
+
+Runs every selection strategy (src/services/selection_strategies.py) on the
+same synthetic workload in simulated time: Poisson arrivals against tokens
+with heterogeneous speed, concurrency limits and credits. Selection goes
+through the real TokenPools and TokenLoadTracker; only the generations and
+the concurrency slots are simulated.
+
+Requests that find no ready token wait in a FIFO queue until a slot frees.
+Reported per strategy:
+- queueing delay (arrival -> token assigned): mean, p95, p99
+- response time (arrival -> generation done): mean, p95
+- per-token utilization (busy slot time / available slot time):
+  min / mean / max, and the mean over fast and slow tokens
+
+Usage:
+    python scripts/simulate_strategies.py                   # 40 tokens, 80% load
+    python scripts/simulate_strategies.py --load 0.95       # Near saturation
+    python scripts/simulate_strategies.py --tokens 200 --requests 50000
+"""
+
+import argparse
+import heapq
+import random
+import statistics
+import sys
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.core.models import Token  # noqa: E402
+from src.services.selection_strategies import STRATEGIES, TokenLoadTracker  # noqa: E402
+from src.services.token_pools import TokenPools, KIND_IMAGE  # noqa: E402
+from src.services.token_registry import TokenRegistry  # noqa: E402
+
+
+class SimulatedSlots:
+    """Concurrency slots with the ConcurrencyManager interface TokenPools uses"""
+
+    def __init__(self, limits: dict):
+        self.limits = limits
+        self.in_use = {token_id: 0 for token_id in limits}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def has_capacity(self, kind: str, token_id: int) -> bool:
+        return kind == KIND_IMAGE and self.in_use[token_id] < self.limits[token_id]
+
+    def acquire(self, token_id: int):
+        self.in_use[token_id] += 1
+        for listener in self._listeners:
+            listener(token_id)
+
+    def release(self, token_id: int):
+        self.in_use[token_id] -= 1
+        for listener in self._listeners:
+            listener(token_id)
+
+
+def make_tokens(count: int, slow_share: float, rng: random.Random) -> list:
+    """(token, is_slow) pairs - slow tokens take 3x longer per generation"""
+    expires = datetime.now(timezone.utc) + timedelta(hours=12)
+    tokens = []
+    for i in range(count):
+        slow = rng.random() < slow_share
+        tokens.append((
+            Token(
+                id=i + 1,
+                st=f"st-{i}",
+                at=f"at-{i}",
+                at_expires=expires,
+                email=f"user{i}@example.com",
+                credits=rng.randint(0, 1000),
+                image_concurrency=rng.choice((1, 2, 4))
+            ),
+            slow
+        ))
+    return tokens
+
+
+def percentile(samples: list, q: float) -> float:
+    return samples[min(int(len(samples) * q), len(samples) - 1)] if samples else 0.0
+
+
+def simulate(strategy_name: str, args) -> dict:
+    rng = random.Random(args.seed)
+    tokens = make_tokens(args.tokens, args.slow_share, rng)
+
+    registry = TokenRegistry()
+    limits, latency = {}, {}
+    for token, slow in tokens:
+        registry.put(token)
+        limits[token.id] = token.image_concurrency
+        latency[token.id] = args.latency * (3 if slow else 1)
+    slow_ids = {token.id for token, slow in tokens if slow}
+
+    slots = SimulatedSlots(limits)
+    pools = TokenPools(registry, slots)
+    load = TokenLoadTracker(default_latency=args.latency)
+    strategy = STRATEGIES[strategy_name]
+
+    # Arrival rate: `load` times the total throughput of all slots
+    capacity = sum(limits[token_id] / latency[token_id] for token_id in limits)
+    arrival_rate = args.load * capacity
+
+    events = []  # (time, seq, kind, payload)
+    seq = 0
+    now = 0.0
+    for _ in range(args.requests):
+        now += rng.expovariate(arrival_rate)
+        seq += 1
+        events.append((now, seq, "arrive", now))
+    heapq.heapify(events)
+
+    waiting = deque()  # arrival times, FIFO
+    busy = {token_id: 0.0 for token_id in limits}
+    queue_delays, response_times = [], []
+
+    def dispatch(arrived: float, at: float) -> bool:
+        nonlocal seq
+        token_id = strategy.choose(pools, KIND_IMAGE, load, registry, rng=rng)
+        if token_id is None:
+            return False
+        slots.acquire(token_id)
+        load.started(token_id)
+        service = latency[token_id] * rng.lognormvariate(0, args.jitter)
+        busy[token_id] += service
+        queue_delays.append(at - arrived)
+        seq += 1
+        heapq.heappush(events, (at + service, seq, "finish", (token_id, arrived, service)))
+        return True
+
+    while events:
+        now, _, kind, payload = heapq.heappop(events)
+        if kind == "arrive":
+            if waiting or not dispatch(payload, now):
+                waiting.append(payload)
+            continue
+
+        token_id, arrived, service = payload
+        slots.release(token_id)
+        load.finished(token_id, service)
+        response_times.append(now - arrived)
+        while waiting and dispatch(waiting[0], now):
+            waiting.popleft()
+
+    utilization = {
+        token_id: busy[token_id] / (limits[token_id] * now) for token_id in limits
+    }
+    fast = [u for token_id, u in utilization.items() if token_id not in slow_ids]
+    slow = [u for token_id, u in utilization.items() if token_id in slow_ids]
+    queue_delays.sort()
+    response_times.sort()
+    return {
+        "queue_mean": statistics.mean(queue_delays),
+        "queue_p95": percentile(queue_delays, 0.95),
+        "queue_p99": percentile(queue_delays, 0.99),
+        "resp_mean": statistics.mean(response_times),
+        "resp_p95": percentile(response_times, 0.95),
+        "util_min": min(utilization.values()),
+        "util_mean": statistics.mean(utilization.values()),
+        "util_max": max(utilization.values()),
+        "util_fast": statistics.mean(fast) if fast else 0.0,
+        "util_slow": statistics.mean(slow) if slow else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate Flow2API token selection strategies")
+    parser.add_argument("--tokens", type=int, default=40, help="Number of tokens")
+    parser.add_argument("--requests", type=int, default=20000, help="Requests per strategy")
+    parser.add_argument("--load", type=float, default=0.8, help="Offered load as a share of total capacity")
+    parser.add_argument("--latency", type=float, default=10.0, help="Mean generation time of a fast token (s)")
+    parser.add_argument("--slow-share", type=float, default=0.3, help="Share of tokens that are 3x slower")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Lognormal sigma of generation times")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (same workload for all strategies)")
+    args = parser.parse_args()
+
+    print(f"Tokens: {args.tokens}, requests: {args.requests}, load: {args.load:.0%}, "
+          f"slow tokens: {args.slow_share:.0%}")
+    print(f"\n  {'strategy':<20}{'queue mean':>11}{'p95':>8}{'p99':>8}{'resp mean':>11}{'p95':>8}"
+          f"{'util min':>10}{'mean':>7}{'max':>7}{'fast':>7}{'slow':>7}")
+    for name in STRATEGIES:
+        r = simulate(name, args)
+        print(f"  {name:<20}{r['queue_mean']:>10.2f}s{r['queue_p95']:>7.1f}s{r['queue_p99']:>7.1f}s"
+              f"{r['resp_mean']:>10.2f}s{r['resp_p95']:>7.1f}s"
+              f"{r['util_min']:>10.0%}{r['util_mean']:>7.0%}{r['util_max']:>7.0%}"
+              f"{r['util_fast']:>7.0%}{r['util_slow']:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
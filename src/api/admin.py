@@ -1,14 +1,24 @@
 """Admin API routes"""
-from fastapi import APIRouter, Depends, HTTPException, Header, Request
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
+from datetime import datetime, timezone
+import base64
+import json
 import secrets
 from ..core.auth import AuthManager
 from ..core.database import Database
 from ..core.config import config
 from ..services.token_manager import TokenManager
 from ..services.proxy_manager import ProxyManager
+from ..services.request_log_writer import RequestLogWriter
+from ..services.at_refresh_scheduler import ATRefreshScheduler
+from ..services.token_importer import TokenImporter
+from ..services.credit_sync import CreditSyncService
+from ..services.load_balancer import LoadBalancer
+from ..services.client_quota import ClientQuotas
+from ..services.selection_strategies import STRATEGIES
 
 router = APIRouter()
 
@@ -16,17 +26,33 @@ router = APIRouter()
 token_manager: TokenManager = None
 proxy_manager: ProxyManager = None
 db: Database = None
+request_log_writer: Optional[RequestLogWriter] = None
+at_refresh_scheduler: Optional[ATRefreshScheduler] = None
+credit_sync: Optional[CreditSyncService] = None
+load_balancer: Optional[LoadBalancer] = None
+client_quotas: Optional[ClientQuotas] = None
 
 # Store active admin session tokens (in production, use Redis or database)
 active_admin_tokens = set()
 
 
-def set_dependencies(tm: TokenManager, pm: ProxyManager, database: Database):
+def set_dependencies(tm: TokenManager, pm: ProxyManager, database: Database,
+                     log_writer: Optional[RequestLogWriter] = None,
+                     at_refresher: Optional[ATRefreshScheduler] = None,
+                     credit_syncer: Optional[CreditSyncService] = None,
+                     balancer: Optional[LoadBalancer] = None,
+                     quotas: Optional[ClientQuotas] = None):
     """Set service instances"""
-    global token_manager, proxy_manager, db
+    global token_manager, proxy_manager, db, request_log_writer, at_refresh_scheduler, credit_sync, load_balancer
+    global client_quotas
     token_manager = tm
     proxy_manager = pm
     db = database
+    request_log_writer = log_writer
+    at_refresh_scheduler = at_refresher
+    credit_sync = credit_syncer
+    load_balancer = balancer
+    client_quotas = quotas
 
 
 # ========== Request Models ==========
@@ -66,6 +92,8 @@ class ProxyConfigRequest(BaseModel):
 class GenerationConfigRequest(BaseModel):
     image_timeout: int
     video_timeout: int
+    image_strategy: Optional[str] = None  # Token selection strategy, see STRATEGIES
+    video_strategy: Optional[str] = None
 
 
 class ChangePasswordRequest(BaseModel):
@@ -185,14 +213,35 @@ async def change_password(
 # ========== Token Management ==========
 
 @router.get("/api/tokens")
-async def get_tokens(token: str = Depends(verify_admin_token)):
-    """Get all tokens with statistics"""
-    tokens = await token_manager.get_all_tokens()
+async def get_tokens(
+    response: Response,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    sort: str = "created_at",
+    order: str = "desc",
+    is_active: Optional[bool] = None,
+    search: Optional[str] = None,
+    token: str = Depends(verify_admin_token)
+):
+    """Get tokens with statistics (one JOIN query)
+
+    Without parameters all tokens are returned, newest first. offset/limit
+    page the list, sort/order pick the sort column, is_active/search filter
+    it. The total number of matching tokens is in the `X-Total-Count` header.
+    """
+    rows, total = await db.get_tokens_with_stats(
+        offset=offset,
+        limit=limit,
+        sort=sort,
+        order=order,
+        is_active=is_active,
+        search=search
+    )
+    response.headers["X-Total-Count"] = str(total)
     result = []
 
-    for t in tokens:
-        stats = await db.get_token_stats(t.id)
-
+    concurrency_manager = load_balancer.concurrency_manager if load_balancer else None
+    for t, stats in rows:
         result.append({
             "id": t.id,
             "st": t.st,  # Session Token for editing
@@ -214,9 +263,12 @@ async def get_tokens(token: str = Depends(verify_admin_token)):
             "video_enabled": t.video_enabled,
             "image_concurrency": t.image_concurrency,
             "video_concurrency": t.video_concurrency,
-            "image_count": stats.image_count if stats else 0,
-            "video_count": stats.video_count if stats else 0,
-            "error_count": stats.error_count if stats else 0
+            # Limits in effect (adaptive: may be below the configured ones), None = no limit
+            "image_limit": concurrency_manager.effective_limit("image", t.id) if concurrency_manager else None,
+            "video_limit": concurrency_manager.effective_limit("video", t.id) if concurrency_manager else None,
+            "image_count": stats.image_count,
+            "video_count": stats.video_count,
+            "error_count": stats.error_count
         })
 
     return result  # 直接返回数组,兼容前端
@@ -349,6 +401,20 @@ async def refresh_credits(
         raise HTTPException(status_code=500, detail=f"刷新Credits失败: {str(e)}")
 
 
+@router.post("/api/tokens/refresh-credits")
+async def refresh_all_credits(token: str = Depends(verify_admin_token)):
+    """Refresh credits of all active tokens (bulk, bounded concurrency)"""
+    try:
+        result = await credit_sync.sync_all()
+        return {
+            "success": True,
+            "message": f"Credits刷新完成: {result['updated']} 成功, {result['failed']} 失败",
+            **result
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"刷新Credits失败: {str(e)}")
+
+
 @router.post("/api/tokens/{token_id}/refresh-at")
 async def refresh_at(
     token_id: int,
@@ -356,8 +422,7 @@ async def refresh_at(
 ):
     """Manually refresh token AT (using ST conversion) 🆕"""
     try:
-        # Call token_manager internal refresh method
-        success = await token_manager._refresh_at(token_id)
+        success = await token_manager.refresh_at(token_id)
 
         if success:
             # Get updated token info
@@ -399,93 +464,28 @@ async def st_to_at(
 @router.post("/api/tokens/import")
 async def import_tokens(
     request: ImportTokensRequest,
+    stream: bool = False,
     token: str = Depends(verify_admin_token)
 ):
-    """Batch import tokens"""
-    from datetime import datetime, timezone
+    """Batch import tokens
 
-    added = 0
-    updated = 0
-    errors = []
+    With ?stream=true the response is NDJSON: one line per item as its
+    upstream calls finish, then a final line with type "done".
+    """
+    importer = TokenImporter(token_manager, max_parallel=config.token_import_max_parallel)
 
-    for idx, item in enumerate(request.tokens):
-        try:
-            st = item.session_token
+    if stream:
+        async def event_lines():
+            async for event in importer.run(request.tokens):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
 
-            if not st:
-                errors.append(f"第{idx+1}项: Missing session_token")
-                continue
+        return StreamingResponse(event_lines(), media_type="application/x-ndjson")
 
-            # Use ST to AT conversion to get user info
-            try:
-                result = await token_manager.flow_client.st_to_at(st)
-                at = result["access_token"]
-                email = result.get("user", {}).get("email")
-                expires = result.get("expires")
-
-                if not email:
-                    errors.append(f"第{idx+1}项: Cannot get email info")
-                    continue
-
-                # Parse expiration time
-                at_expires = None
-                is_expired = False
-                if expires:
-                    try:
-                        at_expires = datetime.fromisoformat(expires.replace('Z', '+00:00'))
-                        # Check if expired
-                        now = datetime.now(timezone.utc)
-                        is_expired = at_expires <= now
-                    except:
-                        pass
-
-                # 使用邮箱检查是否已存在
-                existing_tokens = await token_manager.get_all_tokens()
-                existing = next((t for t in existing_tokens if t.email == email), None)
-
-                if existing:
-                    # Update existing token
-                    await token_manager.update_token(
-                        token_id=existing.id,
-                        st=st,
-                        at=at,
-                        at_expires=at_expires,
-                        image_enabled=item.image_enabled,
-                        video_enabled=item.video_enabled,
-                        image_concurrency=item.image_concurrency,
-                        video_concurrency=item.video_concurrency
-                    )
-                    # Disable if expired
-                    if is_expired:
-                        await token_manager.disable_token(existing.id)
-                    updated += 1
-                else:
-                    # Add new token
-                    new_token = await token_manager.add_token(
-                        st=st,
-                        image_enabled=item.image_enabled,
-                        video_enabled=item.video_enabled,
-                        image_concurrency=item.image_concurrency,
-                        video_concurrency=item.video_concurrency
-                    )
-                    # Disable if expired
-                    if is_expired:
-                        await token_manager.disable_token(new_token.id)
-                    added += 1
-
-            except Exception as e:
-                errors.append(f"第{idx+1}项: {str(e)}")
-
-        except Exception as e:
-            errors.append(f"第{idx+1}项: {str(e)}")
-
-    return {
-        "success": True,
-        "added": added,
-        "updated": updated,
-        "errors": errors if errors else None,
-        "message": f"Import completed: added {added} items, updated {updated} 个" + (f", {len(errors)} items failed" if errors else "")
-    }
+    result = None
+    async for event in importer.run(request.tokens):
+        result = event
+    result.pop("type")
+    return result
 
 
 # ========== Config Management ==========
@@ -520,6 +520,10 @@ async def update_proxy_config_alias(
 ):
     """Update proxy configuration (alias for frontend compatibility)"""
     await proxy_manager.update_proxy_config(request.proxy_enabled, request.proxy_url)
+
+    # 🔥 Hot reload: sync database config to memory
+    await db.reload_config_to_memory()
+
     return {"success": True, "message": "Proxy config updated successfully"}
 
 
@@ -530,6 +534,10 @@ async def update_proxy_config(
 ):
     """Update proxy configuration"""
     await proxy_manager.update_proxy_config(request.proxy_enabled, request.proxy_url)
+
+    # 🔥 Hot reload: sync database config to memory
+    await db.reload_config_to_memory()
+
     return {"success": True, "message": "Proxy config updated successfully"}
 
 
@@ -541,8 +549,11 @@ async def get_generation_config(token: str = Depends(verify_admin_token)):
         "success": True,
         "config": {
             "image_timeout": config.image_timeout,
-            "video_timeout": config.video_timeout
-        }
+            "video_timeout": config.video_timeout,
+            "image_strategy": config.image_strategy,
+            "video_strategy": config.video_strategy
+        },
+        "strategies": list(STRATEGIES)
     }
 
 
@@ -551,8 +562,20 @@ async def update_generation_config(
     request: GenerationConfigRequest,
     token: str = Depends(verify_admin_token)
 ):
-    """Update generation timeout configuration"""
-    await db.update_generation_config(request.image_timeout, request.video_timeout)
+    """Update generation timeout and token selection configuration"""
+    for strategy in (request.image_strategy, request.video_strategy):
+        if strategy is not None and strategy not in STRATEGIES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown selection strategy: {strategy} (available: {', '.join(STRATEGIES)})"
+            )
+
+    await db.update_generation_config(
+        request.image_timeout,
+        request.video_timeout,
+        request.image_strategy,
+        request.video_strategy
+    )
 
     # 🔥 Hot reload: sync database config to memory
     await db.reload_config_to_memory()
@@ -576,6 +599,14 @@ async def get_system_info(token: str = Depends(verify_admin_token)):
             "total_tokens": len(tokens),
             "active_tokens": len(active_tokens),
             "total_credits": total_credits,
+            "request_log": request_log_writer.get_stats() if request_log_writer else None,
+            "at_refresh": at_refresh_scheduler.get_stats() if at_refresh_scheduler else None,
+            "concurrency": load_balancer.concurrency_manager.get_stats() if load_balancer and load_balancer.concurrency_manager else None,
+            "admission": load_balancer.admission.get_stats() if load_balancer else None,
+            "quota": client_quotas.get_stats() if client_quotas else None,
+            "model_routing": load_balancer.router.get_stats() if load_balancer and load_balancer.router else None,
+            "circuit_breaker": load_balancer.breakers.get_stats() if load_balancer and load_balancer.breakers else None,
+            "config_version": db.config_snapshot.version if db.config_snapshot else 0,
             "version": "1.0.0"
         }
     }
@@ -597,47 +628,78 @@ async def logout(token: str = Depends(verify_admin_token)):
 
 @router.get("/api/stats")
 async def get_stats(token: str = Depends(verify_admin_token)):
-    """Get statistics for dashboard"""
-    tokens = await token_manager.get_all_tokens()
-    active_tokens = [t for t in tokens if t.is_active]
-
-    # Calculate totals
-    total_images = 0
-    total_videos = 0
-    total_errors = 0
-    today_images = 0
-    today_videos = 0
-    today_errors = 0
-
-    for t in tokens:
-        stats = await db.get_token_stats(t.id)
-        if stats:
-            total_images += stats.image_count
-            total_videos += stats.video_count
-            total_errors += stats.error_count  # Historical total errors
-            today_images += stats.today_image_count
-            today_videos += stats.today_video_count
-            today_errors += stats.today_error_count
+    """Get statistics for dashboard (one aggregate query)"""
+    stats = await db.aggregate_stats()
 
     return {
-        "total_tokens": len(tokens),
-        "active_tokens": len(active_tokens),
-        "total_images": total_images,
-        "total_videos": total_videos,
-        "total_errors": total_errors,
-        "today_images": today_images,
-        "today_videos": today_videos,
-        "today_errors": today_errors
+        "total_tokens": stats["total_tokens"],
+        "active_tokens": stats["active_tokens"],
+        "total_images": stats["total_images"],
+        "total_videos": stats["total_videos"],
+        "total_errors": stats["total_errors"],  # Historical total errors
+        "today_images": stats["today_images"],
+        "today_videos": stats["today_videos"],
+        "today_errors": stats["today_errors"]
     }
 
 
+def _encode_log_cursor(created_at: str, log_id: int) -> str:
+    """Encode a (created_at, id) keyset cursor as an opaque string"""
+    raw = json.dumps([created_at, log_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_log_cursor(cursor: str) -> tuple:
+    """Decode a cursor produced by _encode_log_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, log_id = json.loads(raw)
+        return str(created_at), int(log_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _to_db_timestamp(value: Optional[datetime]) -> Optional[str]:
+    """Format a datetime like SQLite CURRENT_TIMESTAMP (UTC)"""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
 @router.get("/api/logs")
 async def get_logs(
+    response: Response,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    token_id: Optional[int] = None,
+    status_code: Optional[int] = None,
+    operation: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
     token: str = Depends(verify_admin_token)
 ):
-    """Get request logs with token email"""
-    logs = await db.get_logs(limit=limit)
+    """Get request logs with token email
+
+    Keyset pagination: when more logs may follow, the `X-Next-Cursor`
+    response header holds the cursor for the next page (pass it back as
+    `cursor`). since/until without a timezone are interpreted as UTC.
+    """
+    limit = max(1, min(limit, 1000))
+    logs = await db.get_logs(
+        limit=limit,
+        token_id=token_id,
+        status_code=status_code,
+        operation=operation,
+        since=_to_db_timestamp(since),
+        until=_to_db_timestamp(until),
+        before=_decode_log_cursor(cursor) if cursor else None
+    )
+
+    if len(logs) == limit:
+        last = logs[-1]
+        response.headers["X-Next-Cursor"] = _encode_log_cursor(last["created_at"], last["id"])
 
     return [{
         "id": log.get("id"),
@@ -685,6 +747,9 @@ async def update_admin_config(
     # Update error_ban_threshold in database
     await db.update_admin_config(error_ban_threshold=request.error_ban_threshold)
 
+    # 🔥 Hot reload: sync database config to memory
+    await db.reload_config_to_memory()
+
     return {"success": True, "message": "Config updated successfully"}
 
 
@@ -741,12 +806,7 @@ async def update_generation_timeout(
     token: str = Depends(verify_admin_token)
 ):
     """Update generation timeout configuration"""
-    await db.update_generation_config(request.image_timeout, request.video_timeout)
-
-    # 🔥 Hot reload: sync database config to memory
-    await db.reload_config_to_memory()
-
-    return {"success": True, "message": "Generation config updated successfully"}
+    return await update_generation_config(request, token)
 
 
 # ========== AT Auto Refresh Config ==========
@@ -943,6 +1003,9 @@ async def update_plugin_config(
         auto_enable_on_update=auto_enable_on_update
     )
 
+    # 🔥 Hot reload: sync database config to memory
+    await db.reload_config_to_memory()
+
     return {
         "success": True,
         "message": "插件Config updated successfully",
@@ -955,7 +1018,7 @@ async def update_plugin_config(
 async def plugin_update_token(request: dict, authorization: Optional[str] = Header(None)):
     """Receive token update from Chrome extension (no admin auth required, uses connection_token)"""
     # Verify connection token
-    plugin_config = await db.get_plugin_config()
+    plugin_config = (await db.get_config_snapshot()).plugin
 
     # Extract token from Authorization header
     provided_token = None
@@ -999,7 +1062,7 @@ async def plugin_update_token(request: dict, authorization: Optional[str] = Head
         raise HTTPException(status_code=400, detail=f"Invalid session token: {str(e)}")
 
     # Step 2: Check if token with this email exists
-    existing_token = await db.get_token_by_email(email)
+    existing_token = await token_manager.get_token_by_email(email)
 
     if existing_token:
         # Update existing token
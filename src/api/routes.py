@@ -11,12 +11,15 @@ from curl_cffi.requests import AsyncSession
 from ..core.auth import verify_api_key_header
 from ..core.models import ChatCompletionRequest
 from ..services.generation_handler import GenerationHandler, MODEL_CONFIG
+from ..services.admission_queue import AdmissionRejected
+from ..services.client_quota import ClientQuotas, QuotaExceeded
 from ..core.logger import debug_logger
 
 router = APIRouter()
 
 # Dependency injection will be set up in main.py
 generation_handler: GenerationHandler = None
+client_quotas: Optional[ClientQuotas] = None
 
 
 def set_generation_handler(handler: GenerationHandler):
@@ -25,6 +28,12 @@ def set_generation_handler(handler: GenerationHandler):
     generation_handler = handler
 
 
+def set_client_quotas(quotas: ClientQuotas):
+    """Set per-API-key quota instance"""
+    global client_quotas
+    client_quotas = quotas
+
+
 async def retrieve_image_data(url: str) -> Optional[bytes]:
     """
     智能获取图片数据：
@@ -90,7 +99,19 @@ async def create_chat_completion(
     api_key: str = Depends(verify_api_key_header)
 ):
     """Create chat completion (unified endpoint for image and video generation)"""
+    quota = None
     try:
+        # Per-API-key quota, before any work or token selection
+        if client_quotas is not None:
+            try:
+                quota = client_quotas.acquire(api_key)
+            except QuotaExceeded as e:
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Quota exceeded ({e.reason}), retry later",
+                    headers={"Retry-After": str(e.retry_after)}
+                )
+
         # Extract prompt from messages
         if not request.messages:
             raise HTTPException(status_code=400, detail="Messages cannot be empty")
@@ -163,19 +184,42 @@ async def create_chat_completion(
 
         # Call generation handler
         if request.stream:
+            # Take a token slot before streaming starts, so a saturated pool can still answer 429
+            try:
+                lease = await generation_handler.reserve_token(request.model, client=api_key)
+            except AdmissionRejected as e:
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"All tokens are busy ({e.reason}), retry later",
+                    headers={"Retry-After": str(e.retry_after)}
+                )
+
             # Streaming response
             async def generate():
-                async for chunk in generation_handler.handle_generation(
+                chunks = generation_handler.handle_generation(
                     model=request.model,
                     prompt=prompt,
                     images=images if images else None,
-                    stream=True
-                ):
-                    yield chunk
+                    stream=True,
+                    lease=lease
+                )
+                try:
+                    async for chunk in chunks:
+                        yield chunk
 
-                # Send [DONE] signal
-                yield "data: [DONE]\n\n"
+                    # Send [DONE] signal
+                    yield "data: [DONE]\n\n"
+                finally:
+                    # Client gone mid-stream: close the handler first so it releases the lease itself
+                    await chunks.aclose()
+                    if lease and not lease.released:
+                        # The handler never started: no outcome to report
+                        lease.release(None)
+                    if stream_quota:
+                        stream_quota.release()
 
+            # The quota is held until the stream ends
+            stream_quota, quota = quota, None
             return StreamingResponse(
                 generate(),
                 media_type="text/event-stream",
@@ -211,3 +255,6 @@ async def create_chat_completion(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if quota:
+            quota.release()
@@ -1,7 +1,7 @@
 """Configuration management for Flow2API"""
 import tomli
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 class Config:
     """Application configuration"""
@@ -145,6 +145,28 @@ class Config:
             self._config["generation"] = {}
         self._config["generation"]["video_timeout"] = timeout
 
+    @property
+    def image_selection_strategy(self) -> str:
+        """Get token selection strategy for image generation"""
+        return self._config.get("generation", {}).get("image_strategy", "random")
+
+    def set_image_selection_strategy(self, strategy: str):
+        """Set token selection strategy for image generation"""
+        if "generation" not in self._config:
+            self._config["generation"] = {}
+        self._config["generation"]["image_strategy"] = strategy
+
+    @property
+    def video_selection_strategy(self) -> str:
+        """Get token selection strategy for video generation"""
+        return self._config.get("generation", {}).get("video_strategy", "random")
+
+    def set_video_selection_strategy(self, strategy: str):
+        """Set token selection strategy for video generation"""
+        if "generation" not in self._config:
+            self._config["generation"] = {}
+        self._config["generation"]["video_strategy"] = strategy
+
     # Cache configuration
     @property
     def cache_enabled(self) -> bool:
@@ -213,6 +235,272 @@ class Config:
             self._config["captcha"] = {}
         self._config["captcha"]["yescaptcha_base_url"] = base_url
 
+    # Database configuration
+    @property
+    def db_reader_pool_size(self) -> int:
+        """Get number of pooled reader connections"""
+        return self._config.get("database", {}).get("reader_pool_size", 4)
+
+    @property
+    def db_cache_size_kb(self) -> int:
+        """Get SQLite page cache size per connection in KiB"""
+        return self._config.get("database", {}).get("cache_size_kb", 16384)
+
+    # Statistics configuration
+    @property
+    def stats_flush_interval_ms(self) -> int:
+        """Get token statistics flush interval in milliseconds"""
+        return self._config.get("stats", {}).get("flush_interval_ms", 1000)
+
+    @property
+    def stats_flush_max_events(self) -> int:
+        """Get number of pending statistics events that triggers an early flush"""
+        return self._config.get("stats", {}).get("flush_max_events", 100)
+
+    # Request log writer configuration
+    @property
+    def request_log_queue_size(self) -> int:
+        """Get maximum number of request logs waiting to be written"""
+        return self._config.get("request_log", {}).get("queue_size", 10000)
+
+    @property
+    def request_log_batch_size(self) -> int:
+        """Get maximum number of request logs written per transaction"""
+        return self._config.get("request_log", {}).get("batch_size", 200)
+
+    @property
+    def request_log_overflow_policy(self) -> str:
+        """Get request log queue overflow policy (drop_oldest or block)"""
+        return self._config.get("request_log", {}).get("overflow_policy", "drop_oldest")
+
+    # Request log retention configuration
+    @property
+    def log_retention_enabled(self) -> bool:
+        """Get whether request logs are rolled into daily partitions and expired"""
+        return self._config.get("log_retention", {}).get("enabled", True)
+
+    @property
+    def log_retention_days(self) -> int:
+        """Get number of days request log partitions are kept"""
+        return self._config.get("log_retention", {}).get("retention_days", 30)
+
+    @property
+    def log_retention_interval_seconds(self) -> int:
+        """Get interval between retention passes in seconds"""
+        return self._config.get("log_retention", {}).get("interval_seconds", 3600)
+
+    # AT refresh scheduler configuration
+    @property
+    def at_refresh_enabled(self) -> bool:
+        """Get whether ATs are refreshed in the background before they expire"""
+        return self._config.get("at_refresh", {}).get("enabled", True)
+
+    @property
+    def at_refresh_lead_seconds(self) -> int:
+        """Get how long before expiry an AT is refreshed in the background"""
+        return self._config.get("at_refresh", {}).get("lead_seconds", 5400)
+
+    @property
+    def at_refresh_jitter_seconds(self) -> int:
+        """Get random extra lead added per token to spread refreshes"""
+        return self._config.get("at_refresh", {}).get("jitter_seconds", 600)
+
+    @property
+    def at_refresh_max_parallel(self) -> int:
+        """Get maximum number of concurrent background AT refreshes"""
+        return self._config.get("at_refresh", {}).get("max_parallel", 4)
+
+    @property
+    def at_refresh_max_inflight(self) -> int:
+        """Get maximum number of AT refreshes in flight across all tokens"""
+        return self._config.get("at_refresh", {}).get("max_inflight", 8)
+
+    # Token import configuration
+    @property
+    def token_import_max_parallel(self) -> int:
+        """Get maximum number of import items processed upstream concurrently"""
+        return self._config.get("token_import", {}).get("max_parallel", 8)
+
+    # Credit sync configuration
+    @property
+    def credit_sync_enabled(self) -> bool:
+        """Get whether credits of active tokens are synced periodically"""
+        return self._config.get("credit_sync", {}).get("enabled", True)
+
+    @property
+    def credit_sync_interval_seconds(self) -> int:
+        """Get interval between credit sync passes"""
+        return self._config.get("credit_sync", {}).get("interval_seconds", 600)
+
+    @property
+    def credit_sync_max_parallel(self) -> int:
+        """Get maximum number of concurrent get_credits calls"""
+        return self._config.get("credit_sync", {}).get("max_parallel", 8)
+
+    @property
+    def credit_sync_rate_per_second(self) -> float:
+        """Get maximum number of get_credits calls started per second"""
+        return self._config.get("credit_sync", {}).get("rate_per_second", 5)
+
+    # Auto-unban configuration
+    @property
+    def auto_unban_durations(self) -> Dict[str, int]:
+        """Get ban duration in seconds per ban reason (0 = never auto-unban)"""
+        durations = {"429_rate_limit": 43200, "error_threshold": 0}
+        durations.update(self._config.get("auto_unban", {}))
+        return durations
+
+    # Project pool configuration
+    @property
+    def project_pool_enabled(self) -> bool:
+        """Get whether Flow projects are pre-created in the background"""
+        return self._config.get("project_pool", {}).get("enabled", True)
+
+    @property
+    def project_pool_size(self) -> int:
+        """Get number of spare projects kept per active token"""
+        return self._config.get("project_pool", {}).get("pool_size", 2)
+
+    @property
+    def project_pool_max_generations(self) -> int:
+        """Get number of generations after which a project is retired"""
+        return self._config.get("project_pool", {}).get("max_generations", 200)
+
+    @property
+    def project_pool_max_parallel(self) -> int:
+        """Get maximum number of concurrent background create_project calls"""
+        return self._config.get("project_pool", {}).get("max_parallel", 4)
+
+    @property
+    def project_pool_interval_seconds(self) -> int:
+        """Get interval between provisioning passes"""
+        return self._config.get("project_pool", {}).get("interval_seconds", 60)
+
+    # Admission queue configuration
+    @property
+    def admission_max_queue(self) -> int:
+        """Get maximum number of requests waiting for a token slot, per model type (0 = no queue)"""
+        return self._config.get("admission", {}).get("max_queue", 100)
+
+    @property
+    def admission_max_wait_seconds(self) -> float:
+        """Get maximum time a request waits for a token slot before a 429"""
+        return self._config.get("admission", {}).get("max_wait_seconds", 30)
+
+    @property
+    def admission_mode(self) -> str:
+        """Get admission queue order: fifo, or fair (round-robin per API key)"""
+        return self._config.get("admission", {}).get("mode", "fifo")
+
+    # Model routing configuration
+    @property
+    def model_routing_tiers(self) -> Dict[str, List[str]]:
+        """Get paygate tiers allowed per model, overriding the built-in rules"""
+        return self._config.get("model_routing", {}).get("tiers", {})
+
+    @property
+    def model_routing_failure_threshold(self) -> int:
+        """Get consecutive failures of a model on a token before it is skipped for that model"""
+        return self._config.get("model_routing", {}).get("failure_threshold", 3)
+
+    @property
+    def model_routing_cooldown_seconds(self) -> int:
+        """Get how long a token is skipped for a model after repeated failures"""
+        return self._config.get("model_routing", {}).get("cooldown_seconds", 1800)
+
+    # Circuit breaker configuration
+    @property
+    def circuit_breaker_enabled(self) -> bool:
+        """Get whether failing tokens are isolated by per-token circuit breakers"""
+        return self._config.get("circuit_breaker", {}).get("enabled", True)
+
+    @property
+    def circuit_breaker_window_seconds(self) -> float:
+        """Get sliding window over which a token's error rate is computed"""
+        return self._config.get("circuit_breaker", {}).get("window_seconds", 60)
+
+    @property
+    def circuit_breaker_min_requests(self) -> int:
+        """Get minimum generations in the window before the circuit can open"""
+        return self._config.get("circuit_breaker", {}).get("min_requests", 5)
+
+    @property
+    def circuit_breaker_error_rate_threshold(self) -> float:
+        """Get error rate in the window at which the circuit opens"""
+        return self._config.get("circuit_breaker", {}).get("error_rate_threshold", 0.5)
+
+    @property
+    def circuit_breaker_open_seconds(self) -> float:
+        """Get how long an open circuit keeps traffic away before probing"""
+        return self._config.get("circuit_breaker", {}).get("open_seconds", 30)
+
+    @property
+    def circuit_breaker_max_open_seconds(self) -> float:
+        """Get upper bound of the open time, doubled after each failed probe round"""
+        return self._config.get("circuit_breaker", {}).get("max_open_seconds", 600)
+
+    @property
+    def circuit_breaker_half_open_probes(self) -> int:
+        """Get probe generations allowed (and needed to close) in half-open state"""
+        return self._config.get("circuit_breaker", {}).get("half_open_probes", 1)
+
+    @property
+    def circuit_breaker_ban_after_failed_probes(self) -> int:
+        """Get failed probe rounds in a row before the token is banned (0 = never)"""
+        return self._config.get("circuit_breaker", {}).get("ban_after_failed_probes", 5)
+
+    # Adaptive concurrency configuration
+    @property
+    def adaptive_concurrency_enabled(self) -> bool:
+        """Get whether per-token concurrency limits adapt (AIMD) below the configured ones"""
+        return self._config.get("adaptive_concurrency", {}).get("enabled", True)
+
+    @property
+    def adaptive_concurrency_min_limit(self) -> int:
+        """Get lowest concurrency an adapted token is cut to"""
+        return self._config.get("adaptive_concurrency", {}).get("min_limit", 1)
+
+    @property
+    def adaptive_concurrency_increase_step(self) -> float:
+        """Get slots added per limit's worth of fast successes while saturated"""
+        return self._config.get("adaptive_concurrency", {}).get("increase_step", 1.0)
+
+    @property
+    def adaptive_concurrency_decrease_factor(self) -> float:
+        """Get factor applied to the limit on a 429 or timeout"""
+        return self._config.get("adaptive_concurrency", {}).get("decrease_factor", 0.5)
+
+    @property
+    def adaptive_concurrency_latency_tolerance(self) -> float:
+        """Get how much slower than the fastest recent success a success may be and still grow the limit"""
+        return self._config.get("adaptive_concurrency", {}).get("latency_tolerance", 2.0)
+
+    # Quota configuration
+    @property
+    def quota_rate_per_second(self) -> float:
+        """Get requests per second each API key may start (token bucket refill, 0 = no rate limit)"""
+        return self._config.get("quota", {}).get("rate_per_second", 0)
+
+    @property
+    def quota_burst(self) -> float:
+        """Get token bucket size per API key (requests that may start at once)"""
+        return self._config.get("quota", {}).get("burst", 10)
+
+    @property
+    def quota_max_in_flight(self) -> int:
+        """Get maximum requests in flight per API key (0 = no limit)"""
+        return self._config.get("quota", {}).get("max_in_flight", 0)
+
+    @property
+    def quota_global_max_in_flight(self) -> int:
+        """Get maximum requests in flight over all API keys (0 = no limit)"""
+        return self._config.get("quota", {}).get("global_max_in_flight", 0)
+
+    @property
+    def quota_keys(self) -> Dict[str, dict]:
+        """Get per-API-key overrides (rate_per_second, burst, max_in_flight, weight)"""
+        return self._config.get("quota", {}).get("keys", {})
+
 
 # Global config instance
 config = Config()
@@ -1,14 +1,69 @@
 """Database storage layer for Flow2API"""
+import asyncio
 import aiosqlite
 import json
-from datetime import datetime
-from typing import Optional, List
+from contextlib import asynccontextmanager
+from datetime import datetime, date, timedelta
+from typing import Optional, List, Tuple
 from pathlib import Path
-from .models import Token, TokenStats, Task, RequestLog, AdminConfig, ProxyConfig, GenerationConfig, CacheConfig, Project, CaptchaConfig, PluginConfig
+from .models import Token, TokenStats, Task, RequestLog, AdminConfig, ProxyConfig, GenerationConfig, CacheConfig, Project, CaptchaConfig, PluginConfig, ConfigSnapshot
+
+
+# request_logs indexes: (suffix, columns). Every index ends in created_at so
+# keyset pages ordered by (created_at, id) are an index range scan (id is the rowid)
+REQUEST_LOG_INDEXES = [
+    ("created_at", "created_at"),
+    ("token_created", "token_id, created_at"),
+    ("status_created", "status_code, created_at"),
+    ("operation_created", "operation, created_at"),
+]
+
+
+# Sort keys accepted by Database.get_tokens_with_stats -> SQL expression
+TOKEN_SORT_COLUMNS = {
+    "id": "t.id",
+    "created_at": "t.created_at",
+    "last_used_at": "t.last_used_at",
+    "use_count": "t.use_count",
+    "credits": "t.credits",
+    "email": "t.email",
+    "image_count": "image_count",
+    "video_count": "video_count",
+    "error_count": "error_count",
+}
+
+
+# Daily request log partitions: request_logs_pYYYYMMDD (UTC day of created_at)
+REQUEST_LOG_PARTITION_PREFIX = "request_logs_p"
+REQUEST_LOG_COLUMNS = "id, token_id, operation, request_body, response_body, status_code, duration, created_at"
+
+
+# Atomic token_stats increment with daily rollover of the today_* counters.
+# Parameters are built by Database._token_stats_params.
+TOKEN_STATS_UPDATE_SQL = """
+    UPDATE token_stats
+    SET image_count = image_count + ?,
+        video_count = video_count + ?,
+        error_count = error_count + ?,
+        today_image_count = CASE WHEN today_date = ? THEN today_image_count + ? ELSE ? END,
+        today_video_count = CASE WHEN today_date = ? THEN today_video_count + ? ELSE ? END,
+        today_error_count = CASE WHEN today_date = ? THEN today_error_count + ? ELSE ? END,
+        today_date = ?,
+        consecutive_error_count = CASE WHEN ? THEN ? ELSE consecutive_error_count + ? END,
+        last_error_at = CASE WHEN ? > 0 THEN CURRENT_TIMESTAMP ELSE last_error_at END
+    WHERE token_id = ?
+"""
 
 
 class Database:
-    """SQLite database manager"""
+    """SQLite database manager
+
+    After open() the manager owns a long-lived connection pool: one writer
+    connection (serialized by a lock, one transaction per operation) and N
+    reader connections. WAL mode lets readers run concurrently with the writer.
+    Before open() (or after close()) every operation falls back to a
+    short-lived connection, which keeps one-off scripts working.
+    """
 
     def __init__(self, db_path: str = None):
         if db_path is None:
@@ -18,10 +73,109 @@ class Database:
             db_path = str(data_dir / "flow.db")
         self.db_path = db_path
 
+        # Connection pool (populated by open())
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._readers: Optional[asyncio.Queue] = None
+        self._reader_connections: List[aiosqlite.Connection] = []
+
+        # Config snapshot (installed by reload_config_to_memory)
+        self._config_snapshot: Optional[ConfigSnapshot] = None
+
     def db_exists(self) -> bool:
         """Check if database file exists"""
         return Path(self.db_path).exists()
 
+    # ========== Connection pool ==========
+
+    async def _connect(self, read_only: bool = False, cache_size_kb: int = 16384) -> aiosqlite.Connection:
+        """Open a tuned connection
+
+        Args:
+            read_only: Mark the connection query-only (reader pool)
+            cache_size_kb: Page cache size per connection in KiB
+        """
+        db = await aiosqlite.connect(self.db_path)
+        db.row_factory = aiosqlite.Row
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute("PRAGMA synchronous=NORMAL")
+        await db.execute(f"PRAGMA cache_size=-{int(cache_size_kb)}")
+        await db.execute("PRAGMA temp_store=MEMORY")
+        await db.execute("PRAGMA busy_timeout=5000")
+        if read_only:
+            await db.execute("PRAGMA query_only=1")
+        return db
+
+    async def open(self, reader_count: int = 4, cache_size_kb: int = 16384):
+        """Open the persistent connection pool (called from the FastAPI lifespan)
+
+        Args:
+            reader_count: Number of reader connections
+            cache_size_kb: Page cache size per connection in KiB
+        """
+        if self._writer is not None:
+            return
+
+        self._writer = await self._connect(cache_size_kb=cache_size_kb)
+
+        self._readers = asyncio.Queue()
+        self._reader_connections = []
+        for _ in range(max(1, reader_count)):
+            reader = await self._connect(read_only=True, cache_size_kb=cache_size_kb)
+            self._reader_connections.append(reader)
+            self._readers.put_nowait(reader)
+
+    async def close(self):
+        """Close the connection pool"""
+        if self._writer is None:
+            return
+
+        async with self._write_lock:
+            for reader in self._reader_connections:
+                await reader.close()
+            self._reader_connections = []
+            self._readers = None
+
+            await self._writer.close()
+            self._writer = None
+
+    @asynccontextmanager
+    async def _read(self):
+        """Borrow a reader connection from the pool"""
+        if self._readers is None:
+            async with aiosqlite.connect(self.db_path) as db:
+                db.row_factory = aiosqlite.Row
+                yield db
+            return
+
+        readers = self._readers
+        db = await readers.get()
+        try:
+            yield db
+        finally:
+            readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def _write(self):
+        """Run one write transaction on the writer connection
+
+        Commits when the block exits normally and rolls back on error.
+        """
+        if self._writer is None:
+            async with aiosqlite.connect(self.db_path) as db:
+                db.row_factory = aiosqlite.Row
+                yield db
+                await db.commit()
+            return
+
+        async with self._write_lock:
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
     async def _table_exists(self, db, table_name: str) -> bool:
         """Check if a table exists in the database"""
         cursor = await db.execute(
@@ -95,16 +249,20 @@ class Database:
         if count[0] == 0:
             image_timeout = 300
             video_timeout = 1500
+            image_strategy = "random"
+            video_strategy = "random"
 
             if config_dict:
                 generation_config = config_dict.get("generation", {})
                 image_timeout = generation_config.get("image_timeout", 300)
                 video_timeout = generation_config.get("video_timeout", 1500)
+                image_strategy = generation_config.get("image_strategy", "random")
+                video_strategy = generation_config.get("video_strategy", "random")
 
             await db.execute("""
-                INSERT INTO generation_config (id, image_timeout, video_timeout)
-                VALUES (1, ?, ?)
-            """, (image_timeout, video_timeout))
+                INSERT INTO generation_config (id, image_timeout, video_timeout, image_strategy, video_strategy)
+                VALUES (1, ?, ?, ?, ?)
+            """, (image_timeout, video_timeout, image_strategy, video_strategy))
 
         # Ensure cache_config has a row
         cursor = await db.execute("SELECT COUNT(*) FROM cache_config")
@@ -189,7 +347,7 @@ class Database:
                         Used only to initialize missing config rows with default values.
                         Existing config rows will NOT be overwritten.
         """
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             print("Checking database integrity and performing migrations...")
 
             # ========== Step 1: Create missing tables ==========
@@ -272,6 +430,21 @@ class Database:
                     except Exception as e:
                         print(f"  ✗ Failed to add column 'error_ban_threshold': {e}")
 
+            # Check and add missing columns to generation_config table
+            if await self._table_exists(db, "generation_config"):
+                generation_columns_to_add = [
+                    ("image_strategy", "TEXT DEFAULT 'random'"),
+                    ("video_strategy", "TEXT DEFAULT 'random'"),
+                ]
+
+                for col_name, col_type in generation_columns_to_add:
+                    if not await self._column_exists(db, "generation_config", col_name):
+                        try:
+                            await db.execute(f"ALTER TABLE generation_config ADD COLUMN {col_name} {col_type}")
+                            print(f"  ✓ Added column '{col_name}' to generation_config table")
+                        except Exception as e:
+                            print(f"  ✗ Failed to add column '{col_name}': {e}")
+
             # Check and add missing columns to captcha_config table
             if await self._table_exists(db, "captcha_config"):
                 captcha_columns_to_add = [
@@ -305,6 +478,15 @@ class Database:
                         except Exception as e:
                             print(f"  ✗ Failed to add column '{col_name}': {e}")
 
+            # Check and add missing columns to projects table
+            if await self._table_exists(db, "projects"):
+                if not await self._column_exists(db, "projects", "generation_count"):
+                    try:
+                        await db.execute("ALTER TABLE projects ADD COLUMN generation_count INTEGER DEFAULT 0")
+                        print(f"  ✓ Added column 'generation_count' to projects table")
+                    except Exception as e:
+                        print(f"  ✗ Failed to add column 'generation_count': {e}")
+
             # Check and add missing columns to plugin_config table
             if await self._table_exists(db, "plugin_config"):
                 plugin_columns_to_add = [
@@ -319,17 +501,20 @@ class Database:
                         except Exception as e:
                             print(f"  ✗ Failed to add column '{col_name}': {e}")
 
-            # ========== Step 3: Ensure all config tables have default rows ==========
+            # ========== Step 3: Ensure request_logs and lookup indexes exist ==========
+            await self._create_request_log_indexes(db)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_token_email ON tokens(email)")
+
+            # ========== Step 4: Ensure all config tables have default rows ==========
             # Note: This will NOT overwrite existing config rows
             # It only ensures missing rows are created with default values from setting.toml
             await self._ensure_config_rows(db, config_dict=config_dict)
 
-            await db.commit()
             print("Database migration check completed.")
 
     async def init_db(self):
         """Initialize database tables"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             # Tokens table (Flow2API version)
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS tokens (
@@ -366,6 +551,7 @@ class Database:
                     project_name TEXT NOT NULL,
                     tool_name TEXT DEFAULT 'PINHOLE',
                     is_active BOOLEAN DEFAULT 1,
+                    generation_count INTEGER DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (token_id) REFERENCES tokens(id)
                 )
@@ -453,6 +639,8 @@ class Database:
                     id INTEGER PRIMARY KEY DEFAULT 1,
                     image_timeout INTEGER DEFAULT 300,
                     video_timeout INTEGER DEFAULT 1500,
+                    image_strategy TEXT DEFAULT 'random',
+                    video_strategy TEXT DEFAULT 'random',
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
@@ -511,12 +699,20 @@ class Database:
             # Create indexes
             await db.execute("CREATE INDEX IF NOT EXISTS idx_task_id ON tasks(task_id)")
             await db.execute("CREATE INDEX IF NOT EXISTS idx_token_st ON tokens(st)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_token_email ON tokens(email)")
             await db.execute("CREATE INDEX IF NOT EXISTS idx_project_id ON projects(project_id)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_token_stats_token_id ON token_stats(token_id)")
 
             # Migrate request_logs table if needed
             await self._migrate_request_logs(db)
 
-            await db.commit()
+            # request_logs indexes (after migration, which may recreate the table)
+            await self._create_request_log_indexes(db)
+
+    async def _create_request_log_indexes(self, db, table: str = "request_logs"):
+        """Create the request_logs indexes used by filtered keyset pagination"""
+        for suffix, columns in REQUEST_LOG_INDEXES:
+            await db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{suffix} ON {table}({columns})")
 
     async def _migrate_request_logs(self, db):
         """Migrate request_logs table from old schema to new schema"""
@@ -573,34 +769,92 @@ class Database:
             # Continue even if migration fails
 
     # Token operations
+    @staticmethod
+    async def _insert_token(db, token: Token) -> int:
+        cursor = await db.execute("""
+            INSERT INTO tokens (st, at, at_expires, email, name, remark, is_active,
+                               credits, user_paygate_tier, current_project_id, current_project_name,
+                               image_enabled, video_enabled, image_concurrency, video_concurrency)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (token.st, token.at, token.at_expires, token.email, token.name, token.remark,
+              token.is_active, token.credits, token.user_paygate_tier,
+              token.current_project_id, token.current_project_name,
+              token.image_enabled, token.video_enabled,
+              token.image_concurrency, token.video_concurrency))
+        token_id = cursor.lastrowid
+
+        # Create stats entry
+        await db.execute("""
+            INSERT INTO token_stats (token_id) VALUES (?)
+        """, (token_id,))
+
+        return token_id
+
+    @staticmethod
+    async def _update_token_fields(db, token_id: int, fields: dict):
+        updates = []
+        params = []
+
+        for key, value in fields.items():
+            if value is not None:
+                updates.append(f"{key} = ?")
+                params.append(value)
+
+        if updates:
+            params.append(token_id)
+            query = f"UPDATE tokens SET {', '.join(updates)} WHERE id = ?"
+            await db.execute(query, params)
+
     async def add_token(self, token: Token) -> int:
         """Add a new token"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("""
-                INSERT INTO tokens (st, at, at_expires, email, name, remark, is_active,
-                                   credits, user_paygate_tier, current_project_id, current_project_name,
-                                   image_enabled, video_enabled, image_concurrency, video_concurrency)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (token.st, token.at, token.at_expires, token.email, token.name, token.remark,
-                  token.is_active, token.credits, token.user_paygate_tier,
-                  token.current_project_id, token.current_project_name,
-                  token.image_enabled, token.video_enabled,
-                  token.image_concurrency, token.video_concurrency))
-            await db.commit()
-            token_id = cursor.lastrowid
-
-            # Create stats entry
-            await db.execute("""
-                INSERT INTO token_stats (token_id) VALUES (?)
-            """, (token_id,))
-            await db.commit()
+        async with self._write() as db:
+            return await self._insert_token(db, token)
+
+    async def import_tokens(
+        self,
+        new_tokens: List[Tuple[Token, Project]],
+        updates: List[Tuple[int, dict]]
+    ) -> List[int]:
+        """Insert and update imported tokens in one transaction
+
+        Args:
+            new_tokens: (token, project) pairs to insert; the project is
+                linked to the inserted token
+            updates: (token_id, fields) pairs, applied like update_token
+                (fields whose value is None are skipped)
 
-            return token_id
+        Returns:
+            IDs of the inserted tokens, in input order
+        """
+        token_ids = []
+        async with self._write() as db:
+            for token, project in new_tokens:
+                token_id = await self._insert_token(db, token)
+                await db.execute("""
+                    INSERT INTO projects (project_id, token_id, project_name, tool_name, is_active)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (project.project_id, token_id, project.project_name,
+                      project.tool_name, project.is_active))
+                token_ids.append(token_id)
+
+            for token_id, fields in updates:
+                await self._update_token_fields(db, token_id, fields)
+
+        return token_ids
+
+    async def get_tokens_by_ids(self, token_ids: List[int]) -> List[Token]:
+        """Get tokens by ID (one query)"""
+        if not token_ids:
+            return []
+        async with self._read() as db:
+            placeholders = ", ".join("?" for _ in token_ids)
+            cursor = await db.execute(f"SELECT * FROM tokens WHERE id IN ({placeholders})", token_ids)
+            rows = await cursor.fetchall()
+            return [Token(**dict(row)) for row in rows]
 
     async def get_token(self, token_id: int) -> Optional[Token]:
         """Get token by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM tokens WHERE id = ?", (token_id,))
             row = await cursor.fetchone()
             if row:
@@ -609,8 +863,7 @@ class Database:
 
     async def get_token_by_st(self, st: str) -> Optional[Token]:
         """Get token by ST"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM tokens WHERE st = ?", (st,))
             row = await cursor.fetchone()
             if row:
@@ -619,8 +872,7 @@ class Database:
 
     async def get_token_by_email(self, email: str) -> Optional[Token]:
         """Get token by email"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM tokens WHERE email = ?", (email,))
             row = await cursor.fetchone()
             if row:
@@ -629,61 +881,77 @@ class Database:
 
     async def get_all_tokens(self) -> List[Token]:
         """Get all tokens"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM tokens ORDER BY created_at DESC")
             rows = await cursor.fetchall()
             return [Token(**dict(row)) for row in rows]
 
     async def get_active_tokens(self) -> List[Token]:
         """Get all active tokens"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM tokens WHERE is_active = 1 ORDER BY last_used_at ASC")
             rows = await cursor.fetchall()
             return [Token(**dict(row)) for row in rows]
 
     async def update_token(self, token_id: int, **kwargs):
         """Update token fields"""
-        async with aiosqlite.connect(self.db_path) as db:
-            updates = []
-            params = []
+        async with self._write() as db:
+            await self._update_token_fields(db, token_id, kwargs)
+
+    async def clear_token_ban(self, token_id: int):
+        """Clear ban_reason and banned_at of a token"""
+        async with self._write() as db:
+            await db.execute(
+                "UPDATE tokens SET ban_reason = NULL, banned_at = NULL WHERE id = ?",
+                (token_id,)
+            )
 
-            for key, value in kwargs.items():
-                if value is not None:
-                    updates.append(f"{key} = ?")
-                    params.append(value)
+    async def get_banned_tokens(self) -> List[Token]:
+        """Get disabled tokens that carry a ban reason"""
+        async with self._read() as db:
+            cursor = await db.execute(
+                "SELECT * FROM tokens WHERE is_active = 0 AND ban_reason IS NOT NULL"
+            )
+            rows = await cursor.fetchall()
+            return [Token(**dict(row)) for row in rows]
 
-            if updates:
-                params.append(token_id)
-                query = f"UPDATE tokens SET {', '.join(updates)} WHERE id = ?"
-                await db.execute(query, params)
-                await db.commit()
+    async def update_token_credits(self, updates: List[Tuple[int, int, Optional[str]]]):
+        """Write credits for many tokens in one transaction
+
+        Args:
+            updates: (token_id, credits, user_paygate_tier) tuples; a None
+                tier keeps the stored one
+        """
+        if not updates:
+            return
+        async with self._write() as db:
+            await db.executemany("""
+                UPDATE tokens
+                SET credits = ?, user_paygate_tier = COALESCE(?, user_paygate_tier)
+                WHERE id = ?
+            """, [(credits, tier, token_id) for token_id, credits, tier in updates])
 
     async def delete_token(self, token_id: int):
         """Delete token and related data"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("DELETE FROM token_stats WHERE token_id = ?", (token_id,))
             await db.execute("DELETE FROM projects WHERE token_id = ?", (token_id,))
             await db.execute("DELETE FROM tokens WHERE id = ?", (token_id,))
-            await db.commit()
 
     # Project operations
     async def add_project(self, project: Project) -> int:
         """Add a new project"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             cursor = await db.execute("""
                 INSERT INTO projects (project_id, token_id, project_name, tool_name, is_active)
                 VALUES (?, ?, ?, ?, ?)
             """, (project.project_id, project.token_id, project.project_name,
                   project.tool_name, project.is_active))
-            await db.commit()
             return cursor.lastrowid
 
     async def get_project_by_id(self, project_id: str) -> Optional[Project]:
         """Get project by UUID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM projects WHERE project_id = ?", (project_id,))
             row = await cursor.fetchone()
             if row:
@@ -692,8 +960,7 @@ class Database:
 
     async def get_projects_by_token(self, token_id: int) -> List[Project]:
         """Get all projects for a token"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute(
                 "SELECT * FROM projects WHERE token_id = ? ORDER BY created_at DESC",
                 (token_id,)
@@ -701,28 +968,49 @@ class Database:
             rows = await cursor.fetchall()
             return [Project(**dict(row)) for row in rows]
 
+    async def get_active_projects(self) -> List[Project]:
+        """Get all projects that are not retired (oldest first)"""
+        async with self._read() as db:
+            cursor = await db.execute(
+                "SELECT * FROM projects WHERE is_active = 1 ORDER BY created_at ASC, id ASC"
+            )
+            rows = await cursor.fetchall()
+            return [Project(**dict(row)) for row in rows]
+
+    async def retire_project(self, project_id: str):
+        """Take a project out of rotation (the Flow project itself is kept)"""
+        async with self._write() as db:
+            await db.execute("UPDATE projects SET is_active = 0 WHERE project_id = ?", (project_id,))
+
+    async def add_project_generations(self, counts: List[Tuple[str, int]]):
+        """Add (project_id, generations) to the projects' generation counters"""
+        if not counts:
+            return
+        async with self._write() as db:
+            await db.executemany(
+                "UPDATE projects SET generation_count = generation_count + ? WHERE project_id = ?",
+                [(count, project_id) for project_id, count in counts]
+            )
+
     async def delete_project(self, project_id: str):
         """Delete project"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("DELETE FROM projects WHERE project_id = ?", (project_id,))
-            await db.commit()
 
     # Task operations
     async def create_task(self, task: Task) -> int:
         """Create a new task"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             cursor = await db.execute("""
                 INSERT INTO tasks (task_id, token_id, model, prompt, status, progress, scene_id)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
             """, (task.task_id, task.token_id, task.model, task.prompt,
                   task.status, task.progress, task.scene_id))
-            await db.commit()
             return cursor.lastrowid
 
     async def get_task(self, task_id: str) -> Optional[Task]:
         """Get task by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,))
             row = await cursor.fetchone()
             if row:
@@ -735,7 +1023,7 @@ class Database:
 
     async def update_task(self, task_id: str, **kwargs):
         """Update task"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             updates = []
             params = []
 
@@ -751,124 +1039,204 @@ class Database:
                 params.append(task_id)
                 query = f"UPDATE tasks SET {', '.join(updates)} WHERE task_id = ?"
                 await db.execute(query, params)
-                await db.commit()
 
-    # Token stats operations (kept for compatibility, now delegates to specific methods)
+    # Token stats operations
     async def increment_token_stats(self, token_id: int, stat_type: str):
-        """Increment token statistics (delegates to specific methods)"""
-        if stat_type == "image":
-            await self.increment_image_count(token_id)
-        elif stat_type == "video":
-            await self.increment_video_count(token_id)
-        elif stat_type == "error":
-            await self.increment_error_count(token_id)
+        """Increment token statistics (kept for compatibility, delegates to increment_stats)"""
+        if stat_type in ("image", "video", "error"):
+            await self.increment_stats(token_id, **{stat_type: 1})
+
+    async def get_tokens_with_stats(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        sort: str = "created_at",
+        order: str = "desc",
+        is_active: Optional[bool] = None,
+        search: Optional[str] = None
+    ) -> Tuple[List[Tuple[Token, TokenStats]], int]:
+        """Get tokens joined with their statistics in one query
+
+        Args:
+            offset: Rows to skip
+            limit: Page size (None = all rows)
+            sort: One of TOKEN_SORT_COLUMNS
+            order: "asc" or "desc"
+            is_active: Only active / only inactive tokens
+            search: Substring match on email, name or remark
+
+        Returns:
+            ([(token, stats), ...], total number of matching tokens)
+        """
+        sort_column = TOKEN_SORT_COLUMNS.get(sort, "t.created_at")
+        direction = "ASC" if order.lower() == "asc" else "DESC"
+
+        conditions = []
+        params = []
+        if is_active is not None:
+            conditions.append("t.is_active = ?")
+            params.append(is_active)
+        if search:
+            conditions.append("(t.email LIKE ? OR t.name LIKE ? OR t.remark LIKE ?)")
+            params.extend([f"%{search}%"] * 3)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        params.extend([limit if limit is not None else -1, max(offset, 0)])
+
+        async with self._read() as db:
+            cursor = await db.execute(f"""
+                SELECT
+                    t.*,
+                    COALESCE(s.image_count, 0) AS image_count,
+                    COALESCE(s.video_count, 0) AS video_count,
+                    COALESCE(s.success_count, 0) AS success_count,
+                    COALESCE(s.error_count, 0) AS error_count,
+                    s.last_success_at,
+                    s.last_error_at,
+                    COALESCE(s.today_image_count, 0) AS today_image_count,
+                    COALESCE(s.today_video_count, 0) AS today_video_count,
+                    COALESCE(s.today_error_count, 0) AS today_error_count,
+                    s.today_date,
+                    COALESCE(s.consecutive_error_count, 0) AS consecutive_error_count,
+                    COUNT(*) OVER () AS total_count
+                FROM tokens t
+                LEFT JOIN token_stats s ON s.token_id = t.id
+                {where}
+                ORDER BY {sort_column} {direction}, t.id {direction}
+                LIMIT ? OFFSET ?
+            """, params)
+            rows = await cursor.fetchall()
+
+        if not rows:
+            # COUNT(*) OVER () is only available on returned rows
+            if offset > 0:
+                async with self._read() as db:
+                    cursor = await db.execute(f"SELECT COUNT(*) FROM tokens t {where}", params[:-2])
+                    return [], (await cursor.fetchone())[0]
+            return [], 0
+
+        result = []
+        for row in rows:
+            data = dict(row)
+            token = Token(**data)
+            data["token_id"] = token.id
+            result.append((token, TokenStats(**data)))
+        return result, rows[0]["total_count"]
+
+    async def aggregate_stats(self) -> dict:
+        """Sum token counts and statistics over all tokens in one query
+
+        Today's counters only count rows whose today_date is today.
+        """
+        today = str(date.today())
+        async with self._read() as db:
+            cursor = await db.execute("""
+                SELECT
+                    COUNT(*) AS total_tokens,
+                    COALESCE(SUM(t.is_active = 1), 0) AS active_tokens,
+                    COALESCE(SUM(s.image_count), 0) AS total_images,
+                    COALESCE(SUM(s.video_count), 0) AS total_videos,
+                    COALESCE(SUM(s.error_count), 0) AS total_errors,
+                    COALESCE(SUM(CASE WHEN s.today_date = ? THEN s.today_image_count ELSE 0 END), 0) AS today_images,
+                    COALESCE(SUM(CASE WHEN s.today_date = ? THEN s.today_video_count ELSE 0 END), 0) AS today_videos,
+                    COALESCE(SUM(CASE WHEN s.today_date = ? THEN s.today_error_count ELSE 0 END), 0) AS today_errors
+                FROM tokens t
+                LEFT JOIN token_stats s ON s.token_id = t.id
+            """, (today, today, today))
+            return dict(await cursor.fetchone())
 
     async def get_token_stats(self, token_id: int) -> Optional[TokenStats]:
         """Get token statistics"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM token_stats WHERE token_id = ?", (token_id,))
             row = await cursor.fetchone()
             if row:
                 return TokenStats(**dict(row))
             return None
 
+    @staticmethod
+    def _token_stats_params(token_id: int, today: str, image: int = 0, video: int = 0, error: int = 0,
+                            consecutive_reset: bool = False, consecutive_errors: Optional[int] = None) -> tuple:
+        """Build the parameter tuple for TOKEN_STATS_UPDATE_SQL
+
+        consecutive_reset: replace consecutive_error_count with consecutive_errors
+        instead of incrementing it (a success was seen in the batch)
+        """
+        if consecutive_errors is None:
+            consecutive_errors = error
+        return (
+            image, video, error,
+            today, image, image,
+            today, video, video,
+            today, error, error,
+            today,
+            consecutive_reset, consecutive_errors, consecutive_errors,
+            error,
+            token_id
+        )
+
+    async def increment_stats(self, token_id: int, image: int = 0, video: int = 0, error: int = 0):
+        """Increment several token counters in one atomic statement
+
+        Totals and today's counters are updated together; today's counters
+        restart from the increment when today_date is not today (daily reset).
+        Errors also bump consecutive_error_count and set last_error_at.
+
+        Args:
+            token_id: Token ID
+            image: Images to add
+            video: Videos to add
+            error: Errors to add
+        """
+        params = self._token_stats_params(token_id, str(date.today()), image, video, error)
+        async with self._write() as db:
+            await db.execute(TOKEN_STATS_UPDATE_SQL, params)
+
     async def increment_image_count(self, token_id: int):
         """Increment image generation count with daily reset"""
-        from datetime import date
-        async with aiosqlite.connect(self.db_path) as db:
-            today = str(date.today())
-            # Get current stats
-            cursor = await db.execute("SELECT today_date FROM token_stats WHERE token_id = ?", (token_id,))
-            row = await cursor.fetchone()
-
-            # If date changed, reset today's count
-            if row and row[0] != today:
-                await db.execute("""
-                    UPDATE token_stats
-                    SET image_count = image_count + 1,
-                        today_image_count = 1,
-                        today_date = ?
-                    WHERE token_id = ?
-                """, (today, token_id))
-            else:
-                # Same day, just increment both
-                await db.execute("""
-                    UPDATE token_stats
-                    SET image_count = image_count + 1,
-                        today_image_count = today_image_count + 1,
-                        today_date = ?
-                    WHERE token_id = ?
-                """, (today, token_id))
-            await db.commit()
+        await self.increment_stats(token_id, image=1)
 
     async def increment_video_count(self, token_id: int):
         """Increment video generation count with daily reset"""
-        from datetime import date
-        async with aiosqlite.connect(self.db_path) as db:
-            today = str(date.today())
-            # Get current stats
-            cursor = await db.execute("SELECT today_date FROM token_stats WHERE token_id = ?", (token_id,))
-            row = await cursor.fetchone()
-
-            # If date changed, reset today's count
-            if row and row[0] != today:
-                await db.execute("""
-                    UPDATE token_stats
-                    SET video_count = video_count + 1,
-                        today_video_count = 1,
-                        today_date = ?
-                    WHERE token_id = ?
-                """, (today, token_id))
-            else:
-                # Same day, just increment both
-                await db.execute("""
-                    UPDATE token_stats
-                    SET video_count = video_count + 1,
-                        today_video_count = today_video_count + 1,
-                        today_date = ?
-                    WHERE token_id = ?
-                """, (today, token_id))
-            await db.commit()
+        await self.increment_stats(token_id, video=1)
 
     async def increment_error_count(self, token_id: int):
         """Increment error count with daily reset
 
-        Updates two counters:
+        Updates three counters:
         - error_count: Historical total errors (never reset)
         - consecutive_error_count: Consecutive errors (reset on success/enable)
         - today_error_count: Today's errors (reset on date change)
         """
-        from datetime import date
-        async with aiosqlite.connect(self.db_path) as db:
-            today = str(date.today())
-            # Get current stats
-            cursor = await db.execute("SELECT today_date FROM token_stats WHERE token_id = ?", (token_id,))
-            row = await cursor.fetchone()
+        await self.increment_stats(token_id, error=1)
 
-            # If date changed, reset today's error count
-            if row and row[0] != today:
-                await db.execute("""
-                    UPDATE token_stats
-                    SET error_count = error_count + 1,
-                        consecutive_error_count = consecutive_error_count + 1,
-                        today_error_count = 1,
-                        today_date = ?,
-                        last_error_at = CURRENT_TIMESTAMP
-                    WHERE token_id = ?
-                """, (today, token_id))
-            else:
-                # Same day, just increment all counters
-                await db.execute("""
-                    UPDATE token_stats
-                    SET error_count = error_count + 1,
-                        consecutive_error_count = consecutive_error_count + 1,
-                        today_error_count = today_error_count + 1,
-                        today_date = ?,
-                        last_error_at = CURRENT_TIMESTAMP
-                    WHERE token_id = ?
-                """, (today, token_id))
-            await db.commit()
+    async def apply_token_stats(self, pending: dict):
+        """Apply accumulated usage counters for many tokens in one transaction
+
+        Args:
+            pending: token_id -> PendingTokenStats (see services.stats_aggregator)
+        """
+        today = str(date.today())
+
+        stats_rows = []
+        usage_rows = []
+        for token_id, p in pending.items():
+            stats_rows.append(self._token_stats_params(
+                token_id, today, p.image, p.video, p.error,
+                consecutive_reset=p.consecutive_reset,
+                consecutive_errors=p.consecutive_errors
+            ))
+            if p.use_count:
+                usage_rows.append((p.use_count, p.last_used_at, token_id))
+
+        async with self._write() as db:
+            await db.executemany(TOKEN_STATS_UPDATE_SQL, stats_rows)
+            if usage_rows:
+                await db.executemany("""
+                    UPDATE tokens
+                    SET use_count = use_count + ?, last_used_at = ?
+                    WHERE id = ?
+                """, usage_rows)
 
     async def reset_error_count(self, token_id: int):
         """Reset consecutive error count (only reset consecutive_error_count, keep error_count and today_error_count)
@@ -879,17 +1247,15 @@ class Database:
 
         Note: error_count (total historical errors) is NEVER reset
         """
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 UPDATE token_stats SET consecutive_error_count = 0 WHERE token_id = ?
             """, (token_id,))
-            await db.commit()
 
     # Config operations
     async def get_admin_config(self) -> Optional[AdminConfig]:
         """Get admin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM admin_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
@@ -898,7 +1264,7 @@ class Database:
 
     async def update_admin_config(self, **kwargs):
         """Update admin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             updates = []
             params = []
 
@@ -911,12 +1277,10 @@ class Database:
                 updates.append("updated_at = CURRENT_TIMESTAMP")
                 query = f"UPDATE admin_config SET {', '.join(updates)} WHERE id = 1"
                 await db.execute(query, params)
-                await db.commit()
 
     async def get_proxy_config(self) -> Optional[ProxyConfig]:
         """Get proxy configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM proxy_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
@@ -925,96 +1289,280 @@ class Database:
 
     async def update_proxy_config(self, enabled: bool, proxy_url: Optional[str] = None):
         """Update proxy configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 UPDATE proxy_config
                 SET enabled = ?, proxy_url = ?, updated_at = CURRENT_TIMESTAMP
                 WHERE id = 1
             """, (enabled, proxy_url))
-            await db.commit()
 
     async def get_generation_config(self) -> Optional[GenerationConfig]:
         """Get generation configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM generation_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
                 return GenerationConfig(**dict(row))
             return None
 
-    async def update_generation_config(self, image_timeout: int, video_timeout: int):
-        """Update generation configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+    async def update_generation_config(
+        self,
+        image_timeout: int,
+        video_timeout: int,
+        image_strategy: Optional[str] = None,
+        video_strategy: Optional[str] = None
+    ):
+        """Update generation configuration (strategies left unchanged when None)"""
+        async with self._write() as db:
             await db.execute("""
                 UPDATE generation_config
-                SET image_timeout = ?, video_timeout = ?, updated_at = CURRENT_TIMESTAMP
+                SET image_timeout = ?, video_timeout = ?,
+                    image_strategy = COALESCE(?, image_strategy),
+                    video_strategy = COALESCE(?, video_strategy),
+                    updated_at = CURRENT_TIMESTAMP
                 WHERE id = 1
-            """, (image_timeout, video_timeout))
-            await db.commit()
+            """, (image_timeout, video_timeout, image_strategy, video_strategy))
 
     # Request log operations
     async def add_request_log(self, log: RequestLog):
         """Add request log"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 INSERT INTO request_logs (token_id, operation, request_body, response_body, status_code, duration)
                 VALUES (?, ?, ?, ?, ?, ?)
             """, (log.token_id, log.operation, log.request_body, log.response_body,
                   log.status_code, log.duration))
-            await db.commit()
 
-    async def get_logs(self, limit: int = 100, token_id: Optional[int] = None):
-        """Get request logs with token email"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+    async def add_request_logs(self, logs: List[RequestLog]):
+        """Add many request logs in one transaction
 
-            if token_id:
-                cursor = await db.execute("""
-                    SELECT
-                        rl.id,
-                        rl.token_id,
-                        rl.operation,
-                        rl.request_body,
-                        rl.response_body,
-                        rl.status_code,
-                        rl.duration,
-                        rl.created_at,
-                        t.email as token_email,
-                        t.name as token_username
-                    FROM request_logs rl
-                    LEFT JOIN tokens t ON rl.token_id = t.id
-                    WHERE rl.token_id = ?
-                    ORDER BY rl.created_at DESC
-                    LIMIT ?
-                """, (token_id, limit))
-            else:
-                cursor = await db.execute("""
-                    SELECT
-                        rl.id,
-                        rl.token_id,
-                        rl.operation,
-                        rl.request_body,
-                        rl.response_body,
-                        rl.status_code,
-                        rl.duration,
-                        rl.created_at,
-                        t.email as token_email,
-                        t.name as token_username
-                    FROM request_logs rl
-                    LEFT JOIN tokens t ON rl.token_id = t.id
-                    ORDER BY rl.created_at DESC
-                    LIMIT ?
-                """, (limit,))
+        created_at is stored in the same format as CURRENT_TIMESTAMP (UTC);
+        logs without created_at get the database default.
+        """
+        rows = [
+            (log.token_id, log.operation, log.request_body, log.response_body,
+             log.status_code, log.duration,
+             log.created_at.strftime("%Y-%m-%d %H:%M:%S") if log.created_at else None)
+            for log in logs
+        ]
+        async with self._write() as db:
+            await db.executemany("""
+                INSERT INTO request_logs (token_id, operation, request_body, response_body, status_code, duration, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            """, rows)
+
+    # ========== Request log partitions ==========
+
+    @staticmethod
+    def _log_partition_name(day: date) -> str:
+        return f"{REQUEST_LOG_PARTITION_PREFIX}{day.strftime('%Y%m%d')}"
+
+    @staticmethod
+    def _log_partition_day(name: str) -> date:
+        return datetime.strptime(name[len(REQUEST_LOG_PARTITION_PREFIX):], "%Y%m%d").date()
+
+    async def _log_partitions(self, db) -> List[str]:
+        """List daily request log partitions, newest first"""
+        cursor = await db.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name GLOB ?",
+            (f"{REQUEST_LOG_PARTITION_PREFIX}[0-9]*",)
+        )
+        rows = await cursor.fetchall()
+        return sorted((row[0] for row in rows), reverse=True)
 
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+    async def get_log_partitions(self) -> List[str]:
+        """List daily request log partitions, newest first"""
+        async with self._read() as db:
+            return await self._log_partitions(db)
+
+    async def roll_request_logs(self, before_day: date) -> int:
+        """Move request logs created before `before_day` into daily partitions
+
+        Each day is moved in its own transaction so the writer lock is never
+        held for long. Returns the number of rows moved.
+        """
+        async with self._read() as db:
+            cursor = await db.execute(
+                "SELECT DISTINCT substr(created_at, 1, 10) FROM request_logs WHERE created_at < ?",
+                (str(before_day),)
+            )
+            days = [row[0] for row in await cursor.fetchall()]
+
+        moved = 0
+        for day_str in days:
+            day = date.fromisoformat(day_str)
+            table = self._log_partition_name(day)
+            day_range = (str(day), str(day + timedelta(days=1)))
+
+            async with self._write() as db:
+                await db.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        id INTEGER PRIMARY KEY,
+                        token_id INTEGER,
+                        operation TEXT NOT NULL,
+                        request_body TEXT,
+                        response_body TEXT,
+                        status_code INTEGER NOT NULL,
+                        duration FLOAT NOT NULL,
+                        created_at TIMESTAMP
+                    )
+                """)
+                await self._create_request_log_indexes(db, table)
+                cursor = await db.execute(f"""
+                    INSERT INTO {table} ({REQUEST_LOG_COLUMNS})
+                    SELECT {REQUEST_LOG_COLUMNS} FROM request_logs
+                    WHERE created_at >= ? AND created_at < ?
+                """, day_range)
+                moved += cursor.rowcount
+                await db.execute(
+                    "DELETE FROM request_logs WHERE created_at >= ? AND created_at < ?",
+                    day_range
+                )
+        return moved
+
+    async def drop_log_partitions(self, before_day: date) -> List[str]:
+        """Drop daily partitions older than `before_day` (one DROP TABLE each)"""
+        async with self._write() as db:
+            dropped = [
+                table for table in await self._log_partitions(db)
+                if self._log_partition_day(table) < before_day
+            ]
+            for table in dropped:
+                await db.execute(f"DROP TABLE IF EXISTS {table}")
+        return dropped
+
+    async def enable_incremental_vacuum(self):
+        """Switch the database to auto_vacuum=INCREMENTAL
+
+        Changing auto_vacuum on an existing database needs a full VACUUM, so
+        this is a one-time (possibly slow) migration; later calls are no-ops.
+        """
+        async with self._write() as db:
+            cursor = await db.execute("PRAGMA auto_vacuum")
+            row = await cursor.fetchone()
+            if row[0] == 2:
+                return
+            print("🔄 Enabling incremental auto_vacuum (one-time VACUUM)...")
+            await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            await db.execute("VACUUM")
+            print("✅ Incremental auto_vacuum enabled")
+
+    async def incremental_vacuum(self, pages: int = 0) -> int:
+        """Return free pages to the filesystem (0 = all free pages)
+
+        Returns the number of free pages before vacuuming.
+        """
+        async with self._write() as db:
+            cursor = await db.execute("PRAGMA freelist_count")
+            free_pages = (await cursor.fetchone())[0]
+            if free_pages:
+                # executescript steps the pragma to completion (execute() frees a single page)
+                await db.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+                # The file only shrinks once the WAL is checkpointed
+                await db.executescript("PRAGMA wal_checkpoint(PASSIVE);")
+            return free_pages
+
+    async def _query_logs(self, db, table: str, conditions: list, params: list, limit: int) -> List[dict]:
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = await db.execute(f"""
+            SELECT
+                rl.id,
+                rl.token_id,
+                rl.operation,
+                rl.request_body,
+                rl.response_body,
+                rl.status_code,
+                rl.duration,
+                rl.created_at,
+                t.email as token_email,
+                t.name as token_username
+            FROM {table} rl
+            LEFT JOIN tokens t ON rl.token_id = t.id
+            {where}
+            ORDER BY rl.created_at DESC, rl.id DESC
+            LIMIT ?
+        """, params + [limit])
+        rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+
+    async def get_logs(
+        self,
+        limit: int = 100,
+        token_id: Optional[int] = None,
+        status_code: Optional[int] = None,
+        operation: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        before: Optional[tuple] = None
+    ):
+        """Get request logs with token email, newest first
+
+        Uses keyset pagination on (created_at, id): pass the (created_at, id)
+        of the last row of a page as `before` to get the next page. Each page
+        is an index range scan, independent of how deep it is.
+
+        The live request_logs table is read first, then daily partitions
+        newest first; partitions that cannot contribute to the page (outside
+        the time range, or older than a full page) are skipped.
+
+        Args:
+            limit: Page size
+            token_id: Only logs of this token
+            status_code: Only logs with this status code
+            operation: Only logs of this operation
+            since: Only logs created at or after this time ("YYYY-MM-DD HH:MM:SS", UTC)
+            until: Only logs created before this time ("YYYY-MM-DD HH:MM:SS", UTC)
+            before: (created_at, id) cursor, only logs strictly older than it
+        """
+        conditions = []
+        params = []
+        if token_id:
+            conditions.append("rl.token_id = ?")
+            params.append(token_id)
+        if status_code is not None:
+            conditions.append("rl.status_code = ?")
+            params.append(status_code)
+        if operation:
+            conditions.append("rl.operation = ?")
+            params.append(operation)
+        if since:
+            conditions.append("rl.created_at >= ?")
+            params.append(since)
+        if until:
+            conditions.append("rl.created_at < ?")
+            params.append(until)
+        if before:
+            conditions.append("(rl.created_at, rl.id) < (?, ?)")
+            params.extend(before)
+
+        def sort_key(log):
+            return log["created_at"] or "", log["id"]
+
+        async with self._read() as db:
+            logs = await self._query_logs(db, "request_logs", conditions, params, limit)
+
+            for table in await self._log_partitions(db):
+                day = self._log_partition_day(table)
+                day_start, day_end = str(day), str(day + timedelta(days=1))
+                if since and since >= day_end:
+                    break  # This and all older partitions are before the range
+                if len(logs) >= limit and (logs[limit - 1]["created_at"] or "") >= day_end:
+                    break  # Page already full with newer logs
+                if (until and until <= day_start) or (before and before[0] < day_start):
+                    continue
+
+                logs.extend(await self._query_logs(db, table, conditions, params, limit))
+                logs.sort(key=sort_key, reverse=True)
+                del logs[limit:]
+
+            return logs
 
     async def clear_all_logs(self):
-        """Clear all request logs"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Clear all request logs (including daily partitions)"""
+        async with self._write() as db:
             await db.execute("DELETE FROM request_logs")
-            await db.commit()
+            for table in await self._log_partitions(db):
+                await db.execute(f"DROP TABLE IF EXISTS {table}")
 
     async def init_config_from_toml(self, config_dict: dict, is_first_startup: bool = True):
         """
@@ -1025,7 +1573,7 @@ class Database:
             is_first_startup: If True, initialize all config rows from setting.toml.
                             If False (upgrade mode), only ensure missing config rows exist with default values.
         """
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             if is_first_startup:
                 # First startup: Initialize all config tables with values from setting.toml
                 await self._ensure_config_rows(db, config_dict)
@@ -1033,58 +1581,88 @@ class Database:
                 # Upgrade mode: Only ensure missing config rows exist (with default values, not from TOML)
                 await self._ensure_config_rows(db, config_dict=None)
 
-            await db.commit()
+    @property
+    def config_snapshot(self) -> Optional[ConfigSnapshot]:
+        """Current config snapshot (None until the first load)"""
+        return self._config_snapshot
+
+    async def get_config_snapshot(self) -> ConfigSnapshot:
+        """Get the current config snapshot, loading it on first use
+
+        After the first load this does no I/O; the snapshot is only replaced
+        by reload_config_to_memory.
+        """
+        if self._config_snapshot is None:
+            return await self.load_config_snapshot()
+        return self._config_snapshot
+
+    async def load_config_snapshot(self) -> ConfigSnapshot:
+        """Read all config tables and install them as a new snapshot version"""
+        previous = self._config_snapshot
+        snapshot = ConfigSnapshot(
+            version=previous.version + 1 if previous else 1,
+            loaded_at=datetime.now(),
+            admin=await self.get_admin_config(),
+            proxy=await self.get_proxy_config() or ProxyConfig(),
+            generation=await self.get_generation_config() or GenerationConfig(),
+            cache=await self.get_cache_config(),
+            debug=await self.get_debug_config(),
+            captcha=await self.get_captcha_config(),
+            plugin=await self.get_plugin_config()
+        )
+        self._config_snapshot = snapshot
+        return snapshot
 
     async def reload_config_to_memory(self):
         """
         Reload all configuration from database to in-memory Config instance.
         This should be called after any configuration update to ensure hot-reload.
 
-        Includes:
+        Installs a new ConfigSnapshot (read by ProxyManager, TokenManager and the
+        captcha services) and copies it into the global Config:
         - Admin config (username, password, api_key)
         - Cache config (enabled, timeout, base_url)
-        - Generation config (image_timeout, video_timeout)
-        - Proxy config will be handled by ProxyManager
+        - Generation config (image_timeout, video_timeout, selection strategies)
+        - Debug config (enabled)
+        - Captcha config (method, yescaptcha key/url)
         """
         from .config import config
 
+        snapshot = await self.load_config_snapshot()
+
         # Reload admin config
-        admin_config = await self.get_admin_config()
+        admin_config = snapshot.admin
         if admin_config:
             config.set_admin_username_from_db(admin_config.username)
             config.set_admin_password_from_db(admin_config.password)
             config.api_key = admin_config.api_key
 
         # Reload cache config
-        cache_config = await self.get_cache_config()
-        if cache_config:
-            config.set_cache_enabled(cache_config.cache_enabled)
-            config.set_cache_timeout(cache_config.cache_timeout)
-            config.set_cache_base_url(cache_config.cache_base_url or "")
+        cache_config = snapshot.cache
+        config.set_cache_enabled(cache_config.cache_enabled)
+        config.set_cache_timeout(cache_config.cache_timeout)
+        config.set_cache_base_url(cache_config.cache_base_url or "")
 
         # Reload generation config
-        generation_config = await self.get_generation_config()
-        if generation_config:
-            config.set_image_timeout(generation_config.image_timeout)
-            config.set_video_timeout(generation_config.video_timeout)
+        generation_config = snapshot.generation
+        config.set_image_timeout(generation_config.image_timeout)
+        config.set_video_timeout(generation_config.video_timeout)
+        config.set_image_selection_strategy(generation_config.image_strategy)
+        config.set_video_selection_strategy(generation_config.video_strategy)
 
         # Reload debug config
-        debug_config = await self.get_debug_config()
-        if debug_config:
-            config.set_debug_enabled(debug_config.enabled)
+        config.set_debug_enabled(snapshot.debug.enabled)
 
         # Reload captcha config
-        captcha_config = await self.get_captcha_config()
-        if captcha_config:
-            config.set_captcha_method(captcha_config.captcha_method)
-            config.set_yescaptcha_api_key(captcha_config.yescaptcha_api_key)
-            config.set_yescaptcha_base_url(captcha_config.yescaptcha_base_url)
+        captcha_config = snapshot.captcha
+        config.set_captcha_method(captcha_config.captcha_method)
+        config.set_yescaptcha_api_key(captcha_config.yescaptcha_api_key)
+        config.set_yescaptcha_base_url(captcha_config.yescaptcha_base_url)
 
     # Cache config operations
     async def get_cache_config(self) -> CacheConfig:
         """Get cache configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM cache_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
@@ -1094,8 +1672,7 @@ class Database:
 
     async def update_cache_config(self, enabled: bool = None, timeout: int = None, base_url: Optional[str] = None):
         """Update cache configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._write() as db:
             # Get current values
             cursor = await db.execute("SELECT * FROM cache_config WHERE id = 1")
             row = await cursor.fetchone()
@@ -1127,14 +1704,11 @@ class Database:
                     VALUES (1, ?, ?, ?)
                 """, (new_enabled, new_timeout, new_base_url))
 
-            await db.commit()
-
     # Debug config operations
     async def get_debug_config(self) -> 'DebugConfig':
         """Get debug configuration"""
         from .models import DebugConfig
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM debug_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
@@ -1150,8 +1724,7 @@ class Database:
         mask_token: bool = None
     ):
         """Update debug configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._write() as db:
             # Get current values
             cursor = await db.execute("SELECT * FROM debug_config WHERE id = 1")
             row = await cursor.fetchone()
@@ -1181,13 +1754,10 @@ class Database:
                     VALUES (1, ?, ?, ?, ?)
                 """, (new_enabled, new_log_requests, new_log_responses, new_mask_token))
 
-            await db.commit()
-
     # Captcha config operations
     async def get_captcha_config(self) -> CaptchaConfig:
         """Get captcha configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM captcha_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
@@ -1203,8 +1773,7 @@ class Database:
         browser_proxy_url: str = None
     ):
         """Update captcha configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._write() as db:
             cursor = await db.execute("SELECT * FROM captcha_config WHERE id = 1")
             row = await cursor.fetchone()
 
@@ -1234,13 +1803,10 @@ class Database:
                     VALUES (1, ?, ?, ?, ?, ?)
                 """, (new_method, new_api_key, new_base_url, new_proxy_enabled, new_proxy_url))
 
-            await db.commit()
-
     # Plugin config operations
     async def get_plugin_config(self) -> PluginConfig:
         """Get plugin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM plugin_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
@@ -1249,8 +1815,7 @@ class Database:
 
     async def update_plugin_config(self, connection_token: str, auto_enable_on_update: bool = True):
         """Update plugin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._write() as db:
             cursor = await db.execute("SELECT * FROM plugin_config WHERE id = 1")
             row = await cursor.fetchone()
 
@@ -1266,4 +1831,3 @@ class Database:
                     VALUES (1, ?, ?)
                 """, (connection_token, auto_enable_on_update))
 
-            await db.commit()
@@ -50,7 +50,8 @@ class Project(BaseModel):
     token_id: int  # Associated Token ID
     project_name: str  # Project name
     tool_name: str = "PINHOLE"  # Tool name, fixed as PINHOLE
-    is_active: bool = True
+    is_active: bool = True  # False once retired from the project pool
+    generation_count: int = 0  # Generations started in this project
     created_at: Optional[datetime] = None
 
 
@@ -117,10 +118,12 @@ class ProxyConfig(BaseModel):
 
 
 class GenerationConfig(BaseModel):
-    """Generation timeout configuration"""
+    """Generation timeout and token selection configuration"""
     id: int = 1
     image_timeout: int = 300  # seconds
     video_timeout: int = 1500  # seconds
+    image_strategy: str = "random"  # token selection strategy, see selection_strategies.STRATEGIES
+    video_strategy: str = "random"
 
 
 class CacheConfig(BaseModel):
@@ -167,6 +170,23 @@ class PluginConfig(BaseModel):
     updated_at: Optional[datetime] = None
 
 
+class ConfigSnapshot(BaseModel):
+    """In-memory copy of all config tables
+
+    Installed by Database.reload_config_to_memory and replaced as a whole
+    (never mutated), so hot paths can read config without touching SQLite.
+    """
+    version: int = 0
+    loaded_at: datetime
+    admin: Optional[AdminConfig] = None
+    proxy: ProxyConfig = ProxyConfig()
+    generation: GenerationConfig = GenerationConfig()
+    cache: CacheConfig = CacheConfig()
+    debug: DebugConfig = DebugConfig()
+    captcha: CaptchaConfig = CaptchaConfig()
+    plugin: PluginConfig = PluginConfig()
+
+
 # OpenAI Compatible Request Models
 class ChatMessage(BaseModel):
     """Chat message"""
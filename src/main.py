@@ -11,9 +11,20 @@ from .core.database import Database
 from .services.flow_client import FlowClient
 from .services.proxy_manager import ProxyManager
 from .services.token_manager import TokenManager
+from .services.at_refresh_scheduler import ATRefreshScheduler
+from .services.credit_sync import CreditSyncService
+from .services.unban_scheduler import UnbanScheduler
+from .services.project_provisioner import ProjectProvisioner
+from .services.stats_aggregator import StatsAggregator
+from .services.request_log_writer import RequestLogWriter
+from .services.log_retention import LogRetentionService
 from .services.load_balancer import LoadBalancer
+from .services.admission_queue import AdmissionQueue
+from .services.model_router import ModelRouter
+from .services.circuit_breaker import TokenCircuitBreakers
+from .services.client_quota import ClientQuotas
 from .services.concurrency_manager import ConcurrencyManager
-from .services.generation_handler import GenerationHandler
+from .services.generation_handler import GenerationHandler, MODEL_CONFIG
 from .api import routes, admin
 
 
@@ -31,6 +42,12 @@ async def lifespan(app: FastAPI):
     # Check if database exists (determine if first startup)
     is_first_startup = not db.db_exists()
 
+    # Open persistent connection pool (WAL, one writer + N readers)
+    await db.open(
+        reader_count=config.db_reader_pool_size,
+        cache_size_kb=config.db_cache_size_kb
+    )
+
     # Initialize database tables structure
     await db.init_db()
 
@@ -44,33 +61,12 @@ async def lifespan(app: FastAPI):
         await db.check_and_migrate_db(config_dict)
         print("✓ Database migration check completed.")
 
-    # Load admin config from database
-    admin_config = await db.get_admin_config()
-    if admin_config:
-        config.set_admin_username_from_db(admin_config.username)
-        config.set_admin_password_from_db(admin_config.password)
-        config.api_key = admin_config.api_key
-
-    # Load cache configuration from database
-    cache_config = await db.get_cache_config()
-    config.set_cache_enabled(cache_config.cache_enabled)
-    config.set_cache_timeout(cache_config.cache_timeout)
-    config.set_cache_base_url(cache_config.cache_base_url or "")
-
-    # Load generation configuration from database
-    generation_config = await db.get_generation_config()
-    config.set_image_timeout(generation_config.image_timeout)
-    config.set_video_timeout(generation_config.video_timeout)
-
-    # Load debug configuration from database
-    debug_config = await db.get_debug_config()
-    config.set_debug_enabled(debug_config.enabled)
-
-    # Load captcha configuration from database
-    captcha_config = await db.get_captcha_config()
-    config.set_captcha_method(captcha_config.captcha_method)
-    config.set_yescaptcha_api_key(captcha_config.yescaptcha_api_key)
-    config.set_yescaptcha_base_url(captcha_config.yescaptcha_base_url)
+    # Incremental auto_vacuum (one-time VACUUM on databases created before it was enabled)
+    await db.enable_incremental_vacuum()
+
+    # Load config tables into the in-memory snapshot and global config
+    await db.reload_config_to_memory()
+    captcha_config = db.config_snapshot.captcha
 
     # Initialize browser captcha service if needed
     browser_service = None
@@ -84,31 +80,56 @@ async def lifespan(app: FastAPI):
         browser_service = await BrowserCaptchaService.get_instance(db)
         print("✓ Browser captcha service initialized (headless mode)")
 
+    # Load tokens into the in-memory registry
+    await token_manager.load_tokens()
+
     # Initialize concurrency manager
     tokens = await token_manager.get_all_tokens()
     await concurrency_manager.initialize(tokens)
 
+    # Start background AT refresh scheduler
+    if config.at_refresh_enabled:
+        await at_refresh_scheduler.start()
+
+    # Start scheduled credit sync
+    if config.credit_sync_enabled:
+        await credit_sync.start()
+
     # Start file cache cleanup task
     await generation_handler.file_cache.start_cleanup_task()
 
-    # Start 429 auto-unban task
-    import asyncio
-    async def auto_unban_task():
-        """定时任务：每小时检查并解禁429被禁用的token"""
-        while True:
-            try:
-                await asyncio.sleep(3600)  # 每小时执行一次
-                await token_manager.auto_unban_429_tokens()
-            except Exception as e:
-                print(f"❌ Auto-unban task error: {e}")
+    # Start token statistics flush loop
+    await stats_aggregator.start()
+
+    # Start request log writer
+    await request_log_writer.start()
+
+    # Start request log retention task
+    if config.log_retention_enabled:
+        await log_retention.start()
 
-    auto_unban_task_handle = asyncio.create_task(auto_unban_task())
+    # Start project pool provisioning
+    if config.project_pool_enabled:
+        await project_provisioner.start()
 
-    print(f"✓ Database initialized")
+    # Start auto-unban scheduler (rebuilt from the database)
+    await unban_scheduler.start()
+
+    print(f"✓ Database initialized (pool: 1 writer + {config.db_reader_pool_size} readers)")
     print(f"✓ Total tokens: {len(tokens)}")
     print(f"✓ Cache: {'Enabled' if config.cache_enabled else 'Disabled'} (timeout: {config.cache_timeout}s)")
+    if config.at_refresh_enabled:
+        print(f"✓ AT refresh scheduler started (lead: {config.at_refresh_lead_seconds}s, parallel: {config.at_refresh_max_parallel})")
+    if config.credit_sync_enabled:
+        print(f"✓ Credit sync started (interval: {config.credit_sync_interval_seconds}s)")
+    if config.project_pool_enabled:
+        print(f"✓ Project pool started ({config.project_pool_size} spare projects per token)")
     print(f"✓ File cache cleanup task started")
-    print(f"✓ 429 auto-unban task started (runs every hour)")
+    print(f"✓ Stats aggregator started (flush every {config.stats_flush_interval_ms}ms)")
+    print(f"✓ Request log writer started (queue: {config.request_log_queue_size}, overflow: {config.request_log_overflow_policy})")
+    if config.log_retention_enabled:
+        print(f"✓ Log retention task started (keep {config.log_retention_days} days)")
+    print(f"✓ Auto-unban scheduler started ({unban_scheduler.get_stats()['scheduled']} banned tokens scheduled)")
     print(f"✓ Server running on http://{config.server_host}:{config.server_port}")
     print("=" * 60)
 
@@ -116,41 +137,143 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     print("Flow2API Shutting down...")
+    # Stop AT refresh scheduler
+    await at_refresh_scheduler.stop()
+    # Stop credit sync
+    await credit_sync.stop()
     # Stop file cache cleanup task
     await generation_handler.file_cache.stop_cleanup_task()
-    # Stop auto-unban task
-    auto_unban_task_handle.cancel()
-    try:
-        await auto_unban_task_handle
-    except asyncio.CancelledError:
-        pass
+    # Stop project pool provisioning (writes pending generation counters)
+    await project_provisioner.stop()
+    # Stop auto-unban scheduler
+    await unban_scheduler.stop()
     # Close browser if initialized
     if browser_service:
         await browser_service.close()
         print("✓ Browser captcha service closed")
     print("✓ File cache cleanup task stopped")
-    print("✓ 429 auto-unban task stopped")
+    print("✓ Auto-unban scheduler stopped")
+    # Stop log retention task
+    await log_retention.stop()
+    # Write queued request logs
+    await request_log_writer.stop()
+    print("✓ Request log writer stopped")
+    # Flush pending token statistics
+    await stats_aggregator.stop()
+    print("✓ Stats aggregator flushed")
+    # Close database connection pool
+    await db.close()
+    print("✓ Database connection pool closed")
 
 
 # Initialize components
 db = Database()
 proxy_manager = ProxyManager(db)
 flow_client = FlowClient(proxy_manager)
-token_manager = TokenManager(db, flow_client)
-concurrency_manager = ConcurrencyManager()
-load_balancer = LoadBalancer(token_manager, concurrency_manager)
+stats_aggregator = StatsAggregator(
+    db,
+    flush_interval_ms=config.stats_flush_interval_ms,
+    flush_max_events=config.stats_flush_max_events
+)
+token_manager = TokenManager(
+    db, flow_client, stats_aggregator,
+    max_refresh_parallel=config.at_refresh_max_inflight
+)
+at_refresh_scheduler = ATRefreshScheduler(
+    token_manager,
+    lead_seconds=config.at_refresh_lead_seconds,
+    jitter_seconds=config.at_refresh_jitter_seconds,
+    max_parallel=config.at_refresh_max_parallel
+)
+unban_scheduler = UnbanScheduler(token_manager, config.auto_unban_durations)
+project_provisioner = ProjectProvisioner(
+    token_manager,
+    pool_size=config.project_pool_size,
+    max_generations=config.project_pool_max_generations,
+    max_parallel=config.project_pool_max_parallel,
+    interval_seconds=config.project_pool_interval_seconds
+)
+if config.project_pool_enabled:
+    token_manager.project_provisioner = project_provisioner
+credit_sync = CreditSyncService(
+    token_manager,
+    interval_seconds=config.credit_sync_interval_seconds,
+    max_parallel=config.credit_sync_max_parallel,
+    rate_per_second=config.credit_sync_rate_per_second
+)
+request_log_writer = RequestLogWriter(
+    db,
+    max_queue_size=config.request_log_queue_size,
+    batch_size=config.request_log_batch_size,
+    overflow_policy=config.request_log_overflow_policy
+)
+concurrency_manager = ConcurrencyManager(
+    adaptive=config.adaptive_concurrency_enabled,
+    min_limit=config.adaptive_concurrency_min_limit,
+    increase_step=config.adaptive_concurrency_increase_step,
+    decrease_factor=config.adaptive_concurrency_decrease_factor,
+    latency_tolerance=config.adaptive_concurrency_latency_tolerance
+)
+token_manager.registry.add_listener(concurrency_manager.on_token_changed)
+admission_queue = AdmissionQueue(
+    max_queue=config.admission_max_queue,
+    max_wait_seconds=config.admission_max_wait_seconds,
+    mode=config.admission_mode
+)
+client_quotas = ClientQuotas(
+    rate_per_second=config.quota_rate_per_second,
+    burst=config.quota_burst,
+    max_in_flight=config.quota_max_in_flight,
+    global_max_in_flight=config.quota_global_max_in_flight,
+    overrides=config.quota_keys
+)
+for api_key, key_quota in config.quota_keys.items():
+    if "weight" in key_quota:
+        admission_queue.set_weight(api_key, key_quota["weight"])
+model_router = ModelRouter(
+    MODEL_CONFIG,
+    tier_overrides=config.model_routing_tiers,
+    failure_threshold=config.model_routing_failure_threshold,
+    cooldown_seconds=config.model_routing_cooldown_seconds
+)
+circuit_breakers = TokenCircuitBreakers(
+    window_seconds=config.circuit_breaker_window_seconds,
+    min_requests=config.circuit_breaker_min_requests,
+    error_rate_threshold=config.circuit_breaker_error_rate_threshold,
+    open_seconds=config.circuit_breaker_open_seconds,
+    max_open_seconds=config.circuit_breaker_max_open_seconds,
+    half_open_probes=config.circuit_breaker_half_open_probes,
+    ban_after_failed_probes=config.circuit_breaker_ban_after_failed_probes,
+    on_give_up=token_manager.ban_failing_token
+)
+if config.circuit_breaker_enabled:
+    token_manager.circuit_breakers = circuit_breakers
+load_balancer = LoadBalancer(
+    token_manager, concurrency_manager, admission_queue, model_router,
+    circuit_breakers if config.circuit_breaker_enabled else None
+)
+log_retention = LogRetentionService(
+    db,
+    retention_days=config.log_retention_days,
+    interval_seconds=config.log_retention_interval_seconds
+)
 generation_handler = GenerationHandler(
     flow_client,
     token_manager,
     load_balancer,
     db,
     concurrency_manager,
-    proxy_manager  # Add proxy_manager parameter
+    proxy_manager,  # Add proxy_manager parameter
+    request_log_writer
 )
 
 # Set dependencies
 routes.set_generation_handler(generation_handler)
-admin.set_dependencies(token_manager, proxy_manager, db)
+routes.set_client_quotas(client_quotas)
+admin.set_dependencies(
+    token_manager, proxy_manager, db, request_log_writer, at_refresh_scheduler, credit_sync, load_balancer,
+    client_quotas
+)
 
 # Create FastAPI app
 app = FastAPI(
@@ -167,6 +290,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
 # Include routers
@@ -1,17 +1,52 @@
 """Services modules"""
 
-from .flow_client import FlowClient
+from .flow_client import FlowClient, FlowAPIError
 from .proxy_manager import ProxyManager
-from .load_balancer import LoadBalancer
+from .token_pools import TokenPools
+from .selection_strategies import SelectionStrategy, TokenLoadTracker
+from .admission_queue import AdmissionQueue, AdmissionRejected
+from .client_quota import ClientQuotas, QuotaExceeded
+from .model_router import ModelRouter
+from .circuit_breaker import TokenCircuitBreakers
+from .load_balancer import LoadBalancer, TokenLease
 from .concurrency_manager import ConcurrencyManager
+from .token_registry import TokenRegistry
+from .stats_aggregator import StatsAggregator
+from .request_log_writer import RequestLogWriter
+from .log_retention import LogRetentionService
 from .token_manager import TokenManager
+from .at_refresh_scheduler import ATRefreshScheduler
+from .token_importer import TokenImporter
+from .credit_sync import CreditSyncService
+from .unban_scheduler import UnbanScheduler
+from .project_provisioner import ProjectProvisioner
 from .generation_handler import GenerationHandler
 
 __all__ = [
     "FlowClient",
+    "FlowAPIError",
     "ProxyManager",
+    "TokenPools",
+    "SelectionStrategy",
+    "TokenLoadTracker",
+    "AdmissionQueue",
+    "AdmissionRejected",
+    "ClientQuotas",
+    "QuotaExceeded",
+    "ModelRouter",
+    "TokenCircuitBreakers",
     "LoadBalancer",
+    "TokenLease",
     "ConcurrencyManager",
+    "TokenRegistry",
+    "StatsAggregator",
+    "RequestLogWriter",
+    "LogRetentionService",
     "TokenManager",
+    "ATRefreshScheduler",
+    "TokenImporter",
+    "CreditSyncService",
+    "UnbanScheduler",
+    "ProjectProvisioner",
     "GenerationHandler"
 ]
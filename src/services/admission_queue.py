@@ -0,0 +1,125 @@
+"""Admission queue for Flow2API"""
+import asyncio
+import itertools
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+MODE_FIFO = "fifo"
+MODE_FAIR = "fair"
+
+
+class AdmissionRejected(Exception):
+    """Request not admitted: the queue is full or the wait ran out"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionQueue:
+    """Waiting room for requests while every matching token slot is taken
+
+    Waiters are kept in named queues; the load balancer uses one queue per
+    model, so every waiter in a queue can use the same tokens. It hands
+    each freed slot directly to the longest-waiting waiter that can use it,
+    so a request arriving later cannot take it first.
+
+    In "fifo" mode all waiters of a queue are served in arrival order. In
+    "fair" mode each client (API key) has its own line within a queue and
+    the lines are served round-robin, `weight` grants per turn (default 1).
+    """
+
+    def __init__(self, max_queue: int = 100, max_wait_seconds: float = 30, mode: str = MODE_FIFO):
+        self.max_queue = max(max_queue, 0)
+        self.max_wait_seconds = max(max_wait_seconds, 0)
+        self.mode = mode if mode in (MODE_FIFO, MODE_FAIR) else MODE_FIFO
+
+        # queue -> client -> (arrival seq, future resolved with a reserved token_id)
+        self._queues: Dict[str, "OrderedDict[str, Deque[Tuple[int, asyncio.Future]]]"] = {}
+        self._depth: Dict[str, int] = {}
+        self._weights: Dict[str, int] = {}
+        self._served: Dict[Tuple[str, str], int] = {}  # (queue, client) -> grants in the current turn
+        self._seq = itertools.count()
+
+        # Counters
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_queue > 0 and self.max_wait_seconds > 0
+
+    def set_weight(self, client: str, weight: int):
+        """Grants per round-robin turn for a client in fair mode"""
+        self._weights[client] = max(int(weight), 1)
+
+    def depth(self, queue: str) -> int:
+        return self._depth.get(queue, 0)
+
+    def is_full(self, queue: str) -> bool:
+        return self.depth(queue) >= self.max_queue
+
+    def waiting_queues(self) -> List[str]:
+        """Names of the queues with waiters"""
+        return [queue for queue, depth in self._depth.items() if depth]
+
+    def enqueue(self, queue: str, client: str) -> asyncio.Future:
+        """Add a waiter; the caller must discard() it if it stops waiting unserved"""
+        key = client if self.mode == MODE_FAIR else ""
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(queue, OrderedDict()).setdefault(key, deque()).append((next(self._seq), future))
+        self._depth[queue] = self.depth(queue) + 1
+        return future
+
+    def discard(self, queue: str, client: str, future: asyncio.Future):
+        """Remove a waiter that timed out or was cancelled"""
+        key = client if self.mode == MODE_FAIR else ""
+        clients = self._queues.get(queue)
+        waiters = clients.get(key) if clients else None
+        entry = next((entry for entry in waiters if entry[1] is future), None) if waiters else None
+        if entry is None:
+            return
+        waiters.remove(entry)
+        self._depth[queue] -= 1
+        if not waiters:
+            del clients[key]
+            self._served.pop((queue, key), None)
+
+    def peek_seq(self, queue: str) -> int:
+        """Arrival number of the waiter next_waiter() would return"""
+        waiters = next(iter(self._queues[queue].values()))
+        return waiters[0][0]
+
+    def next_waiter(self, queue: str) -> Optional[asyncio.Future]:
+        """Pop the waiter to serve next"""
+        clients = self._queues.get(queue)
+        if not clients:
+            return None
+
+        key, waiters = next(iter(clients.items()))
+        _, future = waiters.popleft()
+        self._depth[queue] -= 1
+
+        served = self._served.get((queue, key), 0) + 1
+        if not waiters:
+            del clients[key]
+            self._served.pop((queue, key), None)
+        elif served >= self._weights.get(key, 1):
+            clients.move_to_end(key)
+            self._served.pop((queue, key), None)
+        else:
+            self._served[(queue, key)] = served
+        return future
+
+    def get_stats(self) -> dict:
+        """Get queue depths and counters"""
+        return {
+            "mode": self.mode,
+            "depth": {queue: depth for queue, depth in self._depth.items() if depth},
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout
+        }
@@ -0,0 +1,175 @@
+"""Proactive AT refresh scheduler for Flow2API"""
+import asyncio
+import heapq
+import random
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from ..core.logger import debug_logger
+from .token_registry import TokenRuntime
+
+
+class ATRefreshScheduler:
+    """Refreshes access tokens in the background before they expire
+
+    Active tokens sit in a min-heap keyed on their refresh time:
+    at_expires - lead_seconds - random(0, jitter_seconds). Tokens without an
+    AT or without a known expiry are due immediately. The lead time is larger
+    than the one-hour window in which TokenManager.is_at_valid refreshes on
+    the request path, so requests normally only ever see valid ATs.
+
+    The heap is kept in sync through a TokenRegistry listener: a new expiry
+    reschedules the token, disabling or deleting it unschedules it. Stale
+    heap entries are skipped lazily when popped. A token is never refreshed
+    twice within retry_seconds, even if its new AT expires within the lead.
+    """
+
+    def __init__(
+        self,
+        token_manager,
+        lead_seconds: int = 5400,
+        jitter_seconds: int = 600,
+        max_parallel: int = 4,
+        retry_seconds: int = 300
+    ):
+        self.token_manager = token_manager
+        self.lead_seconds = lead_seconds
+        self.jitter_seconds = max(jitter_seconds, 0)
+        self.retry_seconds = max(retry_seconds, 1)
+
+        self._heap: List[Tuple[float, int]] = []  # (due, token_id)
+        self._due: Dict[int, float] = {}  # token_id -> current due time
+        self._expiry: Dict[int, float] = {}  # token_id -> at_expires the due time was computed from
+        self._last_refresh: Dict[int, float] = {}  # token_id -> start of the last refresh
+        self._inflight: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore = asyncio.Semaphore(max(max_parallel, 1))
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters
+        self.refreshed = 0
+        self.failed = 0
+
+        registry = token_manager.registry
+        registry.add_listener(self._on_token_changed)
+        for runtime in registry.active_runtime():
+            self._on_token_changed(runtime.id, runtime)
+
+    # ========== Scheduling ==========
+
+    def _schedule(self, token_id: int, due: float):
+        self._due[token_id] = due
+        heapq.heappush(self._heap, (due, token_id))
+        if self._heap[0][1] == token_id:
+            # New earliest entry: let the loop recompute its sleep
+            self._wakeup.set()
+
+    def _unschedule(self, token_id: int):
+        self._due.pop(token_id, None)
+        self._expiry.pop(token_id, None)
+        self._last_refresh.pop(token_id, None)
+
+    def _on_token_changed(self, token_id: int, runtime: Optional[TokenRuntime]):
+        """Registry listener"""
+        if runtime is None or not runtime.is_active:
+            self._unschedule(token_id)
+            return
+
+        expiry = runtime.at_expires if runtime.has_at else 0.0
+        if self._expiry.get(token_id) == expiry and token_id in self._due:
+            return  # Unrelated field changed (use_count, credits, ...)
+        self._expiry[token_id] = expiry
+
+        if expiry:
+            due = expiry - self.lead_seconds - random.uniform(0, self.jitter_seconds)
+        else:
+            due = time.time()
+        due = max(due, self._last_refresh.get(token_id, 0.0) + self.retry_seconds)
+        self._schedule(token_id, due)
+
+    def get_stats(self) -> dict:
+        """Get scheduler counters"""
+        next_due = min(self._due.values()) if self._due else None
+        return {
+            "scheduled": len(self._due),
+            "inflight": len(self._inflight),
+            "next_refresh_in": max(next_due - time.time(), 0) if next_due is not None else None,
+            "refreshed": self.refreshed,
+            "failed": self.failed
+        }
+
+    # ========== Refresh ==========
+
+    async def _refresh(self, token_id: int):
+        try:
+            async with self._semaphore:
+                runtime = self.token_manager.registry.runtime(token_id)
+                if runtime is None or not runtime.is_active:
+                    return
+
+                debug_logger.log_info(f"[AT_SCHEDULER] Token {token_id}: 提前刷新AT")
+                self._last_refresh[token_id] = time.time()
+                success = await self.token_manager.refresh_at(token_id)
+
+            if success:
+                self.refreshed += 1
+            else:
+                self.failed += 1
+        except Exception as e:
+            self.failed += 1
+            debug_logger.log_error(f"[AT_SCHEDULER] Token {token_id}: refresh error - {e}")
+        finally:
+            self._inflight.discard(token_id)
+
+        # A new expiry has already rescheduled the token through the listener;
+        # otherwise (failure, or unchanged expiry) schedule the next attempt
+        runtime = self.token_manager.registry.runtime(token_id)
+        if runtime is not None and runtime.is_active and token_id not in self._due:
+            self._expiry.pop(token_id, None)
+            self._on_token_changed(token_id, runtime)
+
+    def _start_refresh(self, token_id: int):
+        if token_id in self._inflight:
+            return
+        self._inflight.add(token_id)
+        task = asyncio.create_task(self._refresh(token_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _scheduler_loop(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+
+            while self._heap and self._heap[0][0] <= now:
+                due, token_id = heapq.heappop(self._heap)
+                if self._due.get(token_id) != due:
+                    continue  # Rescheduled or unscheduled since this entry was pushed
+                del self._due[token_id]
+                self._start_refresh(token_id)
+
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        """Start the scheduler loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._scheduler_loop())
+
+    async def stop(self):
+        """Stop the scheduler loop and cancel running refreshes"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
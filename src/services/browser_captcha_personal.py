@@ -59,7 +59,7 @@ class BrowserCaptchaService:
         try:
             proxy_url = None
             if self.db:
-                captcha_config = await self.db.get_captcha_config()
+                captcha_config = (await self.db.get_config_snapshot()).captcha
                 if captcha_config.browser_proxy_enabled and captcha_config.browser_proxy_url:
                     proxy_url = captcha_config.browser_proxy_url
 
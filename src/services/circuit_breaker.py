@@ -0,0 +1,222 @@
+"""Per-token circuit breakers for Flow2API"""
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from ..core.logger import debug_logger
+
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class _Circuit:
+    __slots__ = ("state", "outcomes", "errors", "open_until", "open_seconds",
+                 "probes_in_flight", "probe_successes", "failed_probes", "timer")
+
+    def __init__(self):
+        self.state = STATE_CLOSED
+        self.outcomes: Deque[Tuple[float, bool]] = deque()  # (time, success) within the window
+        self.errors = 0
+        self.open_until = 0.0
+        self.open_seconds = 0.0
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.failed_probes = 0  # consecutive half-open rounds that failed
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class TokenCircuitBreakers:
+    """In-memory circuit breaker per token (closed / open / half-open)
+
+    closed: every generation outcome goes into a sliding window of
+    `window_seconds`. With at least `min_requests` outcomes and an error
+    rate of `error_rate_threshold` or more, the circuit opens.
+
+    open: the token gets no traffic for `open_seconds`, doubled after each
+    failed half-open round up to `max_open_seconds`.
+
+    half-open: up to `half_open_probes` generations run at once as probes.
+    When `half_open_probes` probes succeed, the circuit closes with an empty
+    window; a failed probe opens it again. After `ban_after_failed_probes`
+    failed rounds in a row (0 = never), `on_give_up` is called with the
+    token ID (the token manager bans the token).
+
+    Listeners are called with the token ID whenever its availability may
+    have changed; TokenPools keeps open tokens out of the ready pools.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = 60,
+        min_requests: int = 5,
+        error_rate_threshold: float = 0.5,
+        open_seconds: float = 30,
+        max_open_seconds: float = 600,
+        half_open_probes: int = 1,
+        ban_after_failed_probes: int = 0,
+        on_give_up: Optional[Callable[[int], None]] = None
+    ):
+        self.window_seconds = max(window_seconds, 1)
+        self.min_requests = max(min_requests, 1)
+        self.error_rate_threshold = error_rate_threshold
+        self.open_seconds = max(open_seconds, 1)
+        self.max_open_seconds = max(max_open_seconds, self.open_seconds)
+        self.half_open_probes = max(half_open_probes, 1)
+        self.ban_after_failed_probes = max(ban_after_failed_probes, 0)
+        self.on_give_up = on_give_up
+
+        self._circuits: Dict[int, _Circuit] = {}
+        self._listeners: List[Callable[[int], None]] = []
+
+        # Counters
+        self.opened = 0
+        self.closed = 0
+
+    def add_listener(self, listener: Callable[[int], None]):
+        """Register a callback run with the token ID when its availability may have changed"""
+        self._listeners.append(listener)
+
+    def _notify(self, token_id: int):
+        for listener in self._listeners:
+            listener(token_id)
+
+    # ========== Queries ==========
+
+    def state(self, token_id: int) -> str:
+        circuit = self._circuits.get(token_id)
+        return circuit.state if circuit else STATE_CLOSED
+
+    def is_available(self, token_id: int) -> bool:
+        """True if the token may take a new generation"""
+        circuit = self._circuits.get(token_id)
+        if circuit is None or circuit.state == STATE_CLOSED:
+            return True
+        if circuit.state == STATE_HALF_OPEN:
+            return circuit.probes_in_flight < self.half_open_probes
+        return False
+
+    # ========== Outcomes ==========
+
+    def started(self, token_id: int):
+        """A generation was handed to the token (counts half-open probes)"""
+        circuit = self._circuits.get(token_id)
+        if circuit is not None and circuit.state == STATE_HALF_OPEN:
+            circuit.probes_in_flight += 1
+            if circuit.probes_in_flight >= self.half_open_probes:
+                self._notify(token_id)
+
+    def finished(self, token_id: int, success: Optional[bool]):
+        """A generation on the token ended; success=None if it never reached upstream"""
+        circuit = self._circuits.get(token_id)
+        if circuit is not None and circuit.state == STATE_HALF_OPEN:
+            self._finish_probe(token_id, circuit, success)
+            return
+        if success is None or (circuit is not None and circuit.state == STATE_OPEN):
+            # Started before the circuit opened: already accounted for
+            return
+
+        if circuit is None:
+            circuit = self._circuits[token_id] = _Circuit()
+
+        now = time.time()
+        circuit.outcomes.append((now, success))
+        if not success:
+            circuit.errors += 1
+        cutoff = now - self.window_seconds
+        while circuit.outcomes and circuit.outcomes[0][0] < cutoff:
+            _, ok = circuit.outcomes.popleft()
+            if not ok:
+                circuit.errors -= 1
+
+        total = len(circuit.outcomes)
+        if circuit.errors and total >= self.min_requests and circuit.errors / total >= self.error_rate_threshold:
+            debug_logger.log_warning(
+                f"[CIRCUIT] Token {token_id} 错误率 {circuit.errors}/{total}, 熔断 {self.open_seconds:.0f}s"
+            )
+            self._open(token_id, circuit, self.open_seconds)
+
+    def _finish_probe(self, token_id: int, circuit: _Circuit, success: Optional[bool]):
+        circuit.probes_in_flight = max(circuit.probes_in_flight - 1, 0)
+        if success is None:
+            self._notify(token_id)
+            return
+
+        if not success:
+            circuit.failed_probes += 1
+            if self.ban_after_failed_probes and circuit.failed_probes >= self.ban_after_failed_probes:
+                debug_logger.log_warning(f"[CIRCUIT] Token {token_id} 连续 {circuit.failed_probes} 轮探测失败, 禁用Token")
+                self.forget(token_id)
+                if self.on_give_up is not None:
+                    self.on_give_up(token_id)
+                return
+            open_seconds = min(circuit.open_seconds * 2, self.max_open_seconds)
+            debug_logger.log_warning(f"[CIRCUIT] Token {token_id} 探测失败, 继续熔断 {open_seconds:.0f}s")
+            self._open(token_id, circuit, open_seconds)
+            return
+
+        circuit.probe_successes += 1
+        if circuit.probe_successes >= self.half_open_probes:
+            debug_logger.log_info(f"[CIRCUIT] Token {token_id} 探测成功, 恢复")
+            self._cancel_timer(circuit)
+            self._circuits[token_id] = _Circuit()
+            self.closed += 1
+        self._notify(token_id)
+
+    # ========== Transitions ==========
+
+    @staticmethod
+    def _cancel_timer(circuit: _Circuit):
+        if circuit.timer is not None:
+            circuit.timer.cancel()
+            circuit.timer = None
+
+    def _open(self, token_id: int, circuit: _Circuit, open_seconds: float):
+        self._cancel_timer(circuit)
+        circuit.state = STATE_OPEN
+        circuit.open_seconds = open_seconds
+        circuit.open_until = time.time() + open_seconds
+        circuit.outcomes.clear()
+        circuit.errors = 0
+        circuit.timer = asyncio.get_running_loop().call_later(open_seconds, self._half_open, token_id)
+        self.opened += 1
+        self._notify(token_id)
+
+    def _half_open(self, token_id: int):
+        circuit = self._circuits.get(token_id)
+        if circuit is None or circuit.state != STATE_OPEN:
+            return
+        circuit.timer = None
+        circuit.state = STATE_HALF_OPEN
+        circuit.probes_in_flight = 0
+        circuit.probe_successes = 0
+        debug_logger.log_info(f"[CIRCUIT] Token {token_id} 半开, 允许 {self.half_open_probes} 个探测请求")
+        self._notify(token_id)
+
+    def reset(self, token_id: int):
+        """Close the circuit (e.g. the token was re-enabled by hand)"""
+        if token_id in self._circuits:
+            self.forget(token_id)
+            self._notify(token_id)
+
+    def forget(self, token_id: int):
+        """Drop the circuit of a token"""
+        circuit = self._circuits.pop(token_id, None)
+        if circuit is not None:
+            self._cancel_timer(circuit)
+
+    def get_stats(self) -> dict:
+        """Open and half-open tokens and transition counters"""
+        now = time.time()
+        return {
+            "open": {
+                token_id: round(max(circuit.open_until - now, 0))
+                for token_id, circuit in self._circuits.items() if circuit.state == STATE_OPEN
+            },
+            "half_open": [
+                token_id for token_id, circuit in self._circuits.items() if circuit.state == STATE_HALF_OPEN
+            ],
+            "opened": self.opened,
+            "closed": self.closed
+        }
@@ -0,0 +1,159 @@
+"""Per-API-key quotas for Flow2API"""
+import math
+import time
+from typing import Dict, Optional
+from .admission_queue import AdmissionRejected
+
+
+class QuotaExceeded(AdmissionRejected):
+    """Request not admitted: the caller's rate or in-flight quota, or the global cap, is used up"""
+
+
+class _Limits:
+    __slots__ = ("rate_per_second", "burst", "max_in_flight")
+
+    def __init__(self, rate_per_second: float, burst: float, max_in_flight: int):
+        self.rate_per_second = max(rate_per_second, 0.0)
+        self.burst = max(burst, 1.0)
+        self.max_in_flight = max(max_in_flight, 0)
+
+
+class _ClientState:
+    __slots__ = ("limits", "tokens", "refilled_at", "in_flight")
+
+    def __init__(self, limits: _Limits, now: float):
+        self.limits = limits
+        self.tokens = limits.burst  # Token bucket, starts full
+        self.refilled_at = now
+        self.in_flight = 0
+
+
+class QuotaLease:
+    """An admitted request; release() once it is over (further calls are no-ops)"""
+
+    __slots__ = ("quotas", "client", "started_at", "released")
+
+    def __init__(self, quotas: "ClientQuotas", client: str, started_at: float):
+        self.quotas = quotas
+        self.client = client
+        self.started_at = started_at
+        self.released = False
+
+    def __del__(self):
+        # Safety net: a lease handed to a streaming response that never started is still given back
+        if not self.released:
+            self.release()
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        self.quotas._release(self)
+
+
+class ClientQuotas:
+    """Quotas per downstream caller (API key), checked before a token is selected
+
+    Each key has a token bucket (`rate_per_second` refill, `burst`
+    capacity; rate 0 = no rate limit) and a cap on its requests in flight
+    (`max_in_flight`, 0 = none). `global_max_in_flight` caps the requests
+    in flight over all keys (0 = none). `overrides` gives single keys other
+    limits: {api_key: {"rate_per_second": .., "burst": .., "max_in_flight": ..}}.
+
+    Checks are in-memory and O(1); a request that is refused does not use
+    up a bucket token. The Retry-After estimate comes from the bucket
+    refill time or from the average request duration.
+    """
+
+    def __init__(
+        self,
+        rate_per_second: float = 0,
+        burst: float = 10,
+        max_in_flight: int = 0,
+        global_max_in_flight: int = 0,
+        overrides: Optional[Dict[str, dict]] = None
+    ):
+        self.default_limits = _Limits(rate_per_second, burst, max_in_flight)
+        self.global_max_in_flight = max(global_max_in_flight, 0)
+        self._overrides: Dict[str, _Limits] = {
+            client: _Limits(
+                limits.get("rate_per_second", rate_per_second),
+                limits.get("burst", burst),
+                limits.get("max_in_flight", max_in_flight)
+            )
+            for client, limits in (overrides or {}).items()
+        }
+        self._clients: Dict[str, _ClientState] = {}
+        self.in_flight = 0
+        self._mean_duration = 10.0  # EWMA of request durations (s), for Retry-After
+
+        # Counters
+        self.admitted = 0
+        self.rejected_rate = 0
+        self.rejected_in_flight = 0
+        self.rejected_global = 0
+
+    def _state(self, client: str, now: float) -> _ClientState:
+        state = self._clients.get(client)
+        if state is None:
+            state = self._clients[client] = _ClientState(self._overrides.get(client, self.default_limits), now)
+        return state
+
+    def _in_flight_retry_after(self, in_flight: int) -> int:
+        """Seconds until one of `in_flight` requests likely finishes"""
+        return min(max(math.ceil(self._mean_duration / max(in_flight, 1)), 1), 600)
+
+    def acquire(self, client: str) -> QuotaLease:
+        """
+        Admit a request of `client` or raise QuotaExceeded
+
+        Returns:
+            Lease to release when the request is over
+        """
+        now = time.time()
+        state = self._state(client, now)
+        limits = state.limits
+
+        if self.global_max_in_flight and self.in_flight >= self.global_max_in_flight:
+            self.rejected_global += 1
+            raise QuotaExceeded("global in-flight limit reached", self._in_flight_retry_after(self.in_flight))
+        if limits.max_in_flight and state.in_flight >= limits.max_in_flight:
+            self.rejected_in_flight += 1
+            raise QuotaExceeded("API key in-flight limit reached", self._in_flight_retry_after(state.in_flight))
+        if limits.rate_per_second:
+            state.tokens = min(state.tokens + (now - state.refilled_at) * limits.rate_per_second, limits.burst)
+            state.refilled_at = now
+            if state.tokens < 1:
+                self.rejected_rate += 1
+                raise QuotaExceeded(
+                    "API key rate limit reached",
+                    min(max(math.ceil((1 - state.tokens) / limits.rate_per_second), 1), 600)
+                )
+            state.tokens -= 1
+
+        state.in_flight += 1
+        self.in_flight += 1
+        self.admitted += 1
+        return QuotaLease(self, client, now)
+
+    def _release(self, lease: QuotaLease):
+        """QuotaLease.release()"""
+        self.in_flight = max(self.in_flight - 1, 0)
+        state = self._clients.get(lease.client)
+        if state is not None:
+            state.in_flight = max(state.in_flight - 1, 0)
+        self._mean_duration += (time.time() - lease.started_at - self._mean_duration) * 0.1
+
+    def get_stats(self) -> dict:
+        """In-flight requests (per key, keys shortened) and counters"""
+        return {
+            "in_flight": self.in_flight,
+            "global_max_in_flight": self.global_max_in_flight,
+            "clients": {
+                f"{client[:6]}…": state.in_flight for client, state in self._clients.items() if state.in_flight
+            },
+            "admitted": self.admitted,
+            "rejected_rate": self.rejected_rate,
+            "rejected_in_flight": self.rejected_in_flight,
+            "rejected_global": self.rejected_global
+        }
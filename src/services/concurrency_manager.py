@@ -1,190 +1,466 @@
 """Concurrency manager for token-based rate limiting"""
 import asyncio
-from typing import Dict, Optional
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
 from ..core.logger import debug_logger
 
 
-class ConcurrencyManager:
-    """Manages concurrent request limits for each token"""
-
-    def __init__(self):
-        """Initialize concurrency manager"""
-        self._image_concurrency: Dict[int, int] = {}  # token_id -> remaining image concurrency
-        self._video_concurrency: Dict[int, int] = {}  # token_id -> remaining video concurrency
-        self._lock = asyncio.Lock()  # Protect concurrent access
-
-    async def initialize(self, tokens: list):
-        """
-        Initialize concurrency counters from token list
-
-        Args:
-            tokens: List of Token objects with image_concurrency and video_concurrency fields
-        """
-        async with self._lock:
-            for token in tokens:
-                if token.image_concurrency and token.image_concurrency > 0:
-                    self._image_concurrency[token.id] = token.image_concurrency
-                if token.video_concurrency and token.video_concurrency > 0:
-                    self._video_concurrency[token.id] = token.video_concurrency
-
-            debug_logger.log_info(f"Concurrency manager initialized with {len(tokens)} tokens")
-
-    async def can_use_image(self, token_id: int) -> bool:
-        """
-        Check if token can be used for image generation
+KIND_IMAGE = "image"
+KIND_VIDEO = "video"
+
+
+class TokenSemaphore:
+    """Counting semaphore for one token and kind, resizable while slots are held
+
+    Waiters are served in arrival order and a released slot is handed
+    straight to the first waiter. Shrinking the limit below the slots in
+    use lets the running generations finish; new ones wait until the count
+    is back under the limit.
+
+    `ceiling` is the configured limit; with adaptive limits, `limit` follows
+    `estimate` (AIMD state kept by ConcurrencyManager.record) below it.
+    """
+
+    __slots__ = ("limit", "ceiling", "estimate", "latency_floor", "decreased_at", "in_use", "waiting", "_waiters")
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.ceiling = limit
+        self.estimate = float(limit)
+        self.latency_floor = 0.0  # Fastest recent successful generation (s), drifts up slowly
+        self.decreased_at = 0.0
+        self.in_use = 0
+        self.waiting = 0  # Waiters still pending; cancelled ones are dropped lazily from the deque
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def remaining(self) -> int:
+        return max(self.limit - self.in_use, 0)
+
+    def try_acquire(self) -> bool:
+        if self.in_use >= self.limit or self.waiting:
+            return False
+        self.in_use += 1
+        return True
+
+    def release(self):
+        self.in_use = max(self.in_use - 1, 0)
+        self._wake()
+
+    def resize(self, limit: int):
+        self.limit = limit
+        self._wake()
+
+    def _wake(self):
+        waiters = self._waiters
+        while waiters and self.in_use < self.limit:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                self.in_use += 1
+                self.waiting -= 1
+                waiter.set_result(True)
+
+    def wake_all(self) -> int:
+        """Grant every waiter (the token no longer has a limit), returns how many were granted"""
+        granted = 0
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                granted += 1
+        self.waiting = 0
+        return granted
+
+    def add_waiter(self) -> asyncio.Future:
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.waiting += 1
+        return waiter
+
+    def expire_waiter(self, waiter: asyncio.Future):
+        """Resolve a pending waiter with False (timeout)"""
+        if not waiter.done():
+            waiter.set_result(False)
+            self.waiting -= 1
+            self._prune()
+
+    def cancel_waiter(self, waiter: asyncio.Future):
+        """Drop a waiter whose task was cancelled while it was pending"""
+        if not waiter.done():
+            waiter.cancel()
+        if waiter.cancelled():
+            self.waiting -= 1
+            self._prune()
+
+    def _prune(self):
+        # Resolved waiters stay in the deque until they reach the head (O(1) timeouts)
+        waiters = self._waiters
+        while waiters and waiters[0].done():
+            waiters.popleft()
+
+
+class ConcurrencySlot:
+    """Async context manager holding one slot: `async with manager.slot("image", token_id):`"""
+
+    __slots__ = ("manager", "kind", "token_id", "timeout", "acquired")
+
+    def __init__(self, manager: "ConcurrencyManager", kind: str, token_id: int, timeout: Optional[float]):
+        self.manager = manager
+        self.kind = kind
+        self.token_id = token_id
+        self.timeout = timeout
+        self.acquired = False
+
+    async def __aenter__(self) -> "ConcurrencySlot":
+        if not await self.manager.acquire(self.kind, self.token_id, self.timeout):
+            raise asyncio.TimeoutError(f"no {self.kind} slot for token {self.token_id}")
+        self.acquired = True
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.acquired:
+            self.acquired = False
+            self.manager.release(self.kind, self.token_id)
 
-        Args:
-            token_id: Token ID
-
-        Returns:
-            True if token has available image concurrency, False if concurrency is 0
-        """
-        async with self._lock:
-            # If not in dict, it means no limit (-1)
-            if token_id not in self._image_concurrency:
-                return True
-
-            remaining = self._image_concurrency[token_id]
-            if remaining <= 0:
-                debug_logger.log_info(f"Token {token_id} image concurrency exhausted (remaining: {remaining})")
-                return False
 
+class ConcurrencyManager:
+    """Manages concurrent request limits for each token
+
+    Each token has one TokenSemaphore per kind (image / video); tokens
+    without a limit have none and every acquire succeeds. All operations
+    run synchronously on the event loop, so no lock is needed: taking a
+    slot cannot be interleaved with another task's check. Only acquire()
+    with a timeout awaits, to wait for a slot.
+
+    Limits follow the token registry (on_token_changed) and can be changed
+    with reset_token(); a new limit applies at once, including to waiters.
+    Slots taken while a token has no limit are still counted, so a limit
+    added later starts from the generations already running.
+
+    With `adaptive`, the configured limit is a ceiling and the effective
+    limit is learned per token and kind (AIMD) from the outcomes passed to
+    record(): +`increase_step` per limit's worth of fast successes while
+    the token is saturated, times `decrease_factor` on a 429 or timeout
+    (once per burst: requests started before the last decrease are not
+    counted again). A success slower than `latency_tolerance` times the
+    token's fastest recent one holds the limit. Tokens without a configured
+    limit are not adapted.
+    """
+
+    def __init__(
+        self,
+        adaptive: bool = False,
+        min_limit: int = 1,
+        increase_step: float = 1.0,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0
+    ):
+        """Initialize concurrency manager"""
+        self.adaptive = adaptive
+        self.min_limit = max(min_limit, 1)
+        self.increase_step = max(increase_step, 0.0)
+        self.decrease_factor = min(max(decrease_factor, 0.0), 1.0)
+        self.latency_tolerance = max(latency_tolerance, 1.0)
+        self._semaphores: Dict[str, Dict[int, TokenSemaphore]] = {KIND_IMAGE: {}, KIND_VIDEO: {}}
+        # Slots in use on tokens without a limit (carried into a semaphore when one is set)
+        self._unlimited_in_use: Dict[str, Dict[int, int]] = {KIND_IMAGE: {}, KIND_VIDEO: {}}
+        self._listeners: List[Callable[[int], None]] = []
+
+        # Counters
+        self.increases = 0
+        self.decreases = 0
+
+    def add_listener(self, listener: Callable[[int], None]):
+        """Register a callback run with the token ID after its counters change"""
+        self._listeners.append(listener)
+
+    def _notify(self, token_id: int):
+        for listener in self._listeners:
+            listener(token_id)
+
+    # ========== Slots ==========
+
+    def has_capacity(self, kind: str, token_id: int) -> bool:
+        """True if a slot of `kind` is free right now"""
+        semaphore = self._semaphores[kind].get(token_id)
+        return semaphore is None or (semaphore.in_use < semaphore.limit and not semaphore.waiting)
+
+    def try_acquire(self, kind: str, token_id: int) -> bool:
+        """Take a slot without waiting (atomic: no await between check and take)"""
+        semaphore = self._semaphores[kind].get(token_id)
+        if semaphore is None:
+            # No limit
+            in_use = self._unlimited_in_use[kind]
+            in_use[token_id] = in_use.get(token_id, 0) + 1
             return True
+        if not semaphore.try_acquire():
+            return False
+        self._notify(token_id)
+        return True
 
-    async def can_use_video(self, token_id: int) -> bool:
+    async def acquire(self, kind: str, token_id: int, timeout: Optional[float] = None) -> bool:
         """
-        Check if token can be used for video generation
-
-        Args:
-            token_id: Token ID
+        Take a slot, waiting up to `timeout` seconds for one (None = no limit, 0 = no wait)
 
         Returns:
-            True if token has available video concurrency, False if concurrency is 0
+            True if acquired, False if the wait timed out
         """
-        async with self._lock:
-            # If not in dict, it means no limit (-1)
-            if token_id not in self._video_concurrency:
-                return True
-
-            remaining = self._video_concurrency[token_id]
-            if remaining <= 0:
-                debug_logger.log_info(f"Token {token_id} video concurrency exhausted (remaining: {remaining})")
-                return False
-
+        if self.try_acquire(kind, token_id):
             return True
-
-    async def acquire_image(self, token_id: int) -> bool:
+        if timeout is not None and timeout <= 0:
+            return False
+
+        semaphore = self._semaphores[kind][token_id]
+        waiter = semaphore.add_waiter()
+        timer = None
+        if timeout is not None:
+            timer = asyncio.get_running_loop().call_later(timeout, semaphore.expire_waiter, waiter)
+        try:
+            acquired = await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as the task was cancelled
+                if waiter.result():
+                    self.release(kind, token_id)
+            else:
+                semaphore.cancel_waiter(waiter)
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+        if acquired:
+            self._notify(token_id)
+        return acquired
+
+    def release(self, kind: str, token_id: int):
+        """Give back a slot (usable from finally blocks of cancelled tasks)"""
+        semaphore = self._semaphores[kind].get(token_id)
+        if semaphore is not None:
+            semaphore.release()
+            self._notify(token_id)
+            return
+        in_use = self._unlimited_in_use[kind]
+        remaining = in_use.get(token_id, 0) - 1
+        if remaining > 0:
+            in_use[token_id] = remaining
+        else:
+            in_use.pop(token_id, None)
+
+    def slot(self, kind: str, token_id: int, timeout: Optional[float] = None) -> ConcurrencySlot:
+        """Slot lease for `async with`, raises asyncio.TimeoutError if none frees up in time"""
+        return ConcurrencySlot(self, kind, token_id, timeout)
+
+    def remaining(self, kind: str, token_id: int) -> Optional[int]:
+        """Free slots of `kind`, None if no limit"""
+        semaphore = self._semaphores[kind].get(token_id)
+        return semaphore.remaining if semaphore is not None else None
+
+    def effective_limit(self, kind: str, token_id: int) -> Optional[int]:
+        """Current limit of `kind` (below the configured one when adapted down), None if no limit"""
+        semaphore = self._semaphores[kind].get(token_id)
+        return semaphore.limit if semaphore is not None else None
+
+    # ========== Adaptive limits ==========
+
+    def record(
+        self,
+        kind: str,
+        token_id: int,
+        latency: float,
+        success: bool,
+        overloaded: bool = False,
+        started_at: Optional[float] = None
+    ):
         """
-        Acquire image concurrency slot
+        Feed the outcome of a generation to the adaptive limit (call before releasing its slot)
 
         Args:
+            kind: "image" or "video"
             token_id: Token ID
-
-        Returns:
-            True if acquired, False if not available
+            latency: Seconds the slot was held
+            success: Generation succeeded
+            overloaded: Failed with a 429 or a timeout
+            started_at: When the slot was taken (time.time())
         """
-        async with self._lock:
-            if token_id not in self._image_concurrency:
-                # No limit
-                return True
-
-            if self._image_concurrency[token_id] <= 0:
-                return False
-
-            self._image_concurrency[token_id] -= 1
-            debug_logger.log_info(f"Token {token_id} acquired image slot (remaining: {self._image_concurrency[token_id]})")
-            return True
+        if not self.adaptive:
+            return
+        semaphore = self._semaphores[kind].get(token_id)
+        if semaphore is None:
+            return
+
+        if overloaded:
+            if started_at is not None and started_at < semaphore.decreased_at:
+                # Part of the burst that already cut the limit
+                return
+            semaphore.estimate = max(semaphore.estimate * self.decrease_factor, float(self.min_limit))
+            semaphore.decreased_at = time.time()
+        elif success:
+            floor = semaphore.latency_floor
+            semaphore.latency_floor = latency if not floor or latency < floor else floor + (latency - floor) * 0.01
+            if floor and latency > floor * self.latency_tolerance:
+                # Slower than usual: hold
+                return
+            if semaphore.in_use < semaphore.limit or semaphore.estimate >= semaphore.ceiling:
+                # Not saturated (no evidence more would work) or already at the ceiling
+                return
+            semaphore.estimate = min(semaphore.estimate + self.increase_step / semaphore.estimate, float(semaphore.ceiling))
+        else:
+            return
+        self._apply(kind, token_id, semaphore)
+
+    def _apply(self, kind: str, token_id: int, semaphore: TokenSemaphore):
+        limit = min(max(int(semaphore.estimate), self.min_limit), semaphore.ceiling)
+        if limit == semaphore.limit:
+            return
+        if limit > semaphore.limit:
+            self.increases += 1
+        else:
+            self.decreases += 1
+        debug_logger.log_info(
+            f"[CONCURRENCY] Token {token_id} {kind} 并发上限 {semaphore.limit} -> {limit} (配置 {semaphore.ceiling})"
+        )
+        semaphore.resize(limit)
+        self._notify(token_id)
+
+    # ========== Limits ==========
+
+    def _resize(self, kind: str, token_id: int, limit: Optional[int]):
+        semaphores = self._semaphores[kind]
+        semaphore = semaphores.get(token_id)
+        if limit is None or limit <= 0:
+            if semaphore is not None:
+                del semaphores[token_id]
+                # Running generations (and the waiters granted now) release into the unlimited count
+                in_use = semaphore.in_use + semaphore.wake_all()
+                if in_use:
+                    self._unlimited_in_use[kind][token_id] = in_use
+        elif semaphore is None:
+            semaphore = semaphores[token_id] = TokenSemaphore(limit)
+            semaphore.in_use = self._unlimited_in_use[kind].pop(token_id, 0)
+        elif semaphore.ceiling != limit:
+            semaphore.ceiling = limit
+            # A lower ceiling applies at once; a higher one is grown into when adaptive
+            semaphore.estimate = min(semaphore.estimate, float(limit)) if self.adaptive else float(limit)
+            semaphore.resize(min(max(int(semaphore.estimate), self.min_limit), limit))
+
+    def set_limits(self, token_id: int, image_concurrency: Optional[int], video_concurrency: Optional[int]):
+        """Apply new limits to a token (-1 / None for no limit); slots in use are kept"""
+        self._resize(KIND_IMAGE, token_id, image_concurrency)
+        self._resize(KIND_VIDEO, token_id, video_concurrency)
+        self._notify(token_id)
+
+    def on_token_changed(self, token_id: int, runtime):
+        """TokenRegistry listener: follow concurrency limit changes"""
+        if runtime is None:
+            self.set_limits(token_id, None, None)
+            return
+        image = self._semaphores[KIND_IMAGE].get(token_id)
+        video = self._semaphores[KIND_VIDEO].get(token_id)
+        image_limit = runtime.image_concurrency if runtime.image_concurrency and runtime.image_concurrency > 0 else None
+        video_limit = runtime.video_concurrency if runtime.video_concurrency and runtime.video_concurrency > 0 else None
+        if (image.ceiling if image else None) != image_limit or (video.ceiling if video else None) != video_limit:
+            debug_logger.log_info(f"Token {token_id} concurrency resized (image: {image_limit}, video: {video_limit})")
+            self.set_limits(token_id, image_limit, video_limit)
 
-    async def acquire_video(self, token_id: int) -> bool:
+    async def initialize(self, tokens: list):
         """
-        Acquire video concurrency slot
+        Initialize concurrency counters from token list
 
         Args:
-            token_id: Token ID
-
-        Returns:
-            True if acquired, False if not available
+            tokens: List of Token objects with image_concurrency and video_concurrency fields
         """
-        async with self._lock:
-            if token_id not in self._video_concurrency:
-                # No limit
-                return True
-
-            if self._video_concurrency[token_id] <= 0:
-                return False
-
-            self._video_concurrency[token_id] -= 1
-            debug_logger.log_info(f"Token {token_id} acquired video slot (remaining: {self._video_concurrency[token_id]})")
-            return True
+        for token in tokens:
+            self.set_limits(token.id, token.image_concurrency, token.video_concurrency)
 
-    async def release_image(self, token_id: int):
-        """
-        Release image concurrency slot
+        debug_logger.log_info(f"Concurrency manager initialized with {len(tokens)} tokens")
 
-        Args:
-            token_id: Token ID
+    async def reset_token(self, token_id: int, image_concurrency: int = -1, video_concurrency: int = -1):
         """
-        async with self._lock:
-            if token_id in self._image_concurrency:
-                self._image_concurrency[token_id] += 1
-                debug_logger.log_info(f"Token {token_id} released image slot (remaining: {self._image_concurrency[token_id]})")
+        Change the concurrency limits of a token
 
-    async def release_video(self, token_id: int):
-        """
-        Release video concurrency slot
+        Slots in use stay taken; waiters are granted as soon as the new
+        limit allows.
 
         Args:
             token_id: Token ID
+            image_concurrency: New image concurrency limit (-1 for no limit)
+            video_concurrency: New video concurrency limit (-1 for no limit)
         """
-        async with self._lock:
-            if token_id in self._video_concurrency:
-                self._video_concurrency[token_id] += 1
-                debug_logger.log_info(f"Token {token_id} released video slot (remaining: {self._video_concurrency[token_id]})")
+        self.set_limits(token_id, image_concurrency, video_concurrency)
+        debug_logger.log_info(f"Token {token_id} concurrency reset (image: {image_concurrency}, video: {video_concurrency})")
+
+    def get_stats(self) -> dict:
+        """Limited tokens, slots in use, waiters and adapted-down tokens per kind"""
+        stats = {
+            kind: {
+                "limited_tokens": len(semaphores),
+                "in_use": sum(semaphore.in_use for semaphore in semaphores.values())
+                + sum(self._unlimited_in_use[kind].values()),
+                "waiting": sum(semaphore.waiting for semaphore in semaphores.values()),
+                "below_ceiling": sum(1 for semaphore in semaphores.values() if semaphore.limit < semaphore.ceiling)
+            }
+            for kind, semaphores in self._semaphores.items()
+        }
+        stats["adaptive"] = self.adaptive
+        stats["increases"] = self.increases
+        stats["decreases"] = self.decreases
+        return stats
+
+    # ========== Per-kind shortcuts ==========
+
+    def has_image_capacity(self, token_id: int) -> bool:
+        """Non-blocking can_use_image (for the load balancer's pools)"""
+        return self.has_capacity(KIND_IMAGE, token_id)
+
+    def has_video_capacity(self, token_id: int) -> bool:
+        """Non-blocking can_use_video (for the load balancer's pools)"""
+        return self.has_capacity(KIND_VIDEO, token_id)
+
+    def try_acquire_image(self, token_id: int) -> bool:
+        """Take an image slot without waiting"""
+        return self.try_acquire(KIND_IMAGE, token_id)
+
+    def try_acquire_video(self, token_id: int) -> bool:
+        """Take a video slot without waiting"""
+        return self.try_acquire(KIND_VIDEO, token_id)
+
+    def release_image_nowait(self, token_id: int):
+        """Give back an image slot"""
+        self.release(KIND_IMAGE, token_id)
+
+    def release_video_nowait(self, token_id: int):
+        """Give back a video slot"""
+        self.release(KIND_VIDEO, token_id)
 
-    async def get_image_remaining(self, token_id: int) -> Optional[int]:
-        """
-        Get remaining image concurrency for token
+    async def can_use_image(self, token_id: int) -> bool:
+        """True if token has available image concurrency"""
+        return self.has_capacity(KIND_IMAGE, token_id)
 
-        Args:
-            token_id: Token ID
+    async def can_use_video(self, token_id: int) -> bool:
+        """True if token has available video concurrency"""
+        return self.has_capacity(KIND_VIDEO, token_id)
 
-        Returns:
-            Remaining count or None if no limit
-        """
-        async with self._lock:
-            return self._image_concurrency.get(token_id)
+    async def acquire_image(self, token_id: int, timeout: Optional[float] = 0) -> bool:
+        """Acquire an image slot, waiting up to `timeout` seconds (default: no wait)"""
+        return await self.acquire(KIND_IMAGE, token_id, timeout)
 
-    async def get_video_remaining(self, token_id: int) -> Optional[int]:
-        """
-        Get remaining video concurrency for token
+    async def acquire_video(self, token_id: int, timeout: Optional[float] = 0) -> bool:
+        """Acquire a video slot, waiting up to `timeout` seconds (default: no wait)"""
+        return await self.acquire(KIND_VIDEO, token_id, timeout)
 
-        Args:
-            token_id: Token ID
+    async def release_image(self, token_id: int):
+        """Release image concurrency slot"""
+        self.release(KIND_IMAGE, token_id)
 
-        Returns:
-            Remaining count or None if no limit
-        """
-        async with self._lock:
-            return self._video_concurrency.get(token_id)
+    async def release_video(self, token_id: int):
+        """Release video concurrency slot"""
+        self.release(KIND_VIDEO, token_id)
 
-    async def reset_token(self, token_id: int, image_concurrency: int = -1, video_concurrency: int = -1):
-        """
-        Reset concurrency counters for a token
+    async def get_image_remaining(self, token_id: int) -> Optional[int]:
+        """Remaining image concurrency for token, None if no limit"""
+        return self.remaining(KIND_IMAGE, token_id)
 
-        Args:
-            token_id: Token ID
-            image_concurrency: New image concurrency limit (-1 for no limit)
-            video_concurrency: New video concurrency limit (-1 for no limit)
-        """
-        async with self._lock:
-            if image_concurrency > 0:
-                self._image_concurrency[token_id] = image_concurrency
-            elif token_id in self._image_concurrency:
-                del self._image_concurrency[token_id]
-
-            if video_concurrency > 0:
-                self._video_concurrency[token_id] = video_concurrency
-            elif token_id in self._video_concurrency:
-                del self._video_concurrency[token_id]
-
-            debug_logger.log_info(f"Token {token_id} concurrency reset (image: {image_concurrency}, video: {video_concurrency})")
+    async def get_video_remaining(self, token_id: int) -> Optional[int]:
+        """Remaining video concurrency for token, None if no limit"""
+        return self.remaining(KIND_VIDEO, token_id)
@@ -0,0 +1,136 @@
+"""Bulk credit sync for Flow2API"""
+import asyncio
+import time
+from typing import List, Optional
+from ..core.logger import debug_logger
+
+
+class CreditSyncService:
+    """Keeps Token.credits current for all active tokens
+
+    A sync pass fans FlowClient.get_credits out over the active tokens with
+    at most `max_parallel` calls in flight and at most `rate_per_second`
+    calls started per second, then writes every result with one batched
+    UPDATE in one transaction. Tokens whose AT is about to expire are
+    refreshed first (single-flight, see TokenManager.is_at_valid).
+
+    Passes run every `interval_seconds` in the background, and on demand
+    through sync_all() (admin "refresh all"). Concurrent passes are merged:
+    a caller arriving during a pass waits for it and gets its result.
+    """
+
+    def __init__(
+        self,
+        token_manager,
+        interval_seconds: int = 600,
+        max_parallel: int = 8,
+        rate_per_second: float = 5
+    ):
+        self.token_manager = token_manager
+        self.interval_seconds = max(interval_seconds, 60)
+        self.max_parallel = max(max_parallel, 1)
+        self.min_spacing = 1 / rate_per_second if rate_per_second > 0 else 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._current: Optional[asyncio.Future] = None
+
+    async def sync_all(self) -> dict:
+        """Sync credits of all active tokens, returning per-token timings"""
+        if self._current is None:
+            self._current = asyncio.ensure_future(self._sync_all())
+            self._current.add_done_callback(lambda _: setattr(self, "_current", None))
+        return await asyncio.shield(self._current)
+
+    async def _sync_all(self) -> dict:
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        slot_lock = asyncio.Lock()
+        next_slot = [time.monotonic()]
+
+        async def wait_for_slot():
+            # Space call starts at least min_spacing apart
+            async with slot_lock:
+                now = time.monotonic()
+                delay = next_slot[0] - now
+                next_slot[0] = max(now, next_slot[0]) + self.min_spacing
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        async def sync_one(token_id: int) -> dict:
+            async with semaphore:
+                await wait_for_slot()
+                return await self._fetch_credits(token_id)
+
+        token_ids = [rt.id for rt in self.token_manager.get_active_runtime()]
+        results: List[dict] = await asyncio.gather(*(sync_one(tid) for tid in token_ids))
+
+        updates = [
+            (r["token_id"], r["credits"], r["user_paygate_tier"])
+            for r in results if r["error"] is None
+        ]
+        await self.token_manager.apply_credits(updates)
+
+        failed = len(results) - len(updates)
+        total_ms = (time.perf_counter() - started) * 1000
+        debug_logger.log_info(
+            f"[CREDIT_SYNC] 同步完成: {len(updates)} 成功, {failed} 失败, 耗时 {total_ms:.0f}ms"
+        )
+        return {
+            "total": len(results),
+            "updated": len(updates),
+            "failed": failed,
+            "elapsed_ms": round(total_ms, 1),
+            "results": results
+        }
+
+    async def _fetch_credits(self, token_id: int) -> dict:
+        started = time.perf_counter()
+        result = {
+            "token_id": token_id,
+            "email": None,
+            "credits": None,
+            "user_paygate_tier": None,
+            "elapsed_ms": 0.0,
+            "error": None
+        }
+        try:
+            token = await self.token_manager.get_token(token_id)
+            if token is None:
+                raise ValueError("Token not found")
+            result["email"] = token.email
+            if not await self.token_manager.is_at_valid(token_id):
+                raise ValueError("AT无效且刷新失败")
+            # Re-read: the AT may just have been refreshed
+            token = await self.token_manager.get_token(token_id)
+            credits_result = await self.token_manager.flow_client.get_credits(token.at)
+            result["credits"] = credits_result.get("credits", 0)
+            result["user_paygate_tier"] = credits_result.get("userPaygateTier")
+        except Exception as e:
+            result["error"] = str(e)
+            debug_logger.log_error(f"[CREDIT_SYNC] Token {token_id}: {str(e)}")
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    async def start(self):
+        """Start the background sync task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self):
+        """Stop the background sync task"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _sync_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(self.interval_seconds)
+                await self.sync_all()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                debug_logger.log_error(f"[CREDIT_SYNC] Sync pass failed: {e}")
@@ -5,10 +5,32 @@ import random
 import base64
 from typing import Dict, Any, Optional, List
 from curl_cffi.requests import AsyncSession
+from curl_cffi.requests.exceptions import ConnectTimeout, Timeout
 from ..core.logger import debug_logger
 from ..core.config import config
 
 
+class FlowAPIError(Exception):
+    """Flow API request failed
+
+    status_code: HTTP status of the response (None if none was received)
+    error_status: Google API error status from the response body (e.g. RESOURCE_EXHAUSTED)
+    timed_out: the upstream did not answer within flow_timeout
+    """
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        error_status: Optional[str] = None,
+        timed_out: bool = False
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error_status = error_status
+        self.timed_out = timed_out
+
+
 class FlowClient:
     """VideoFX API Client"""
 
@@ -71,6 +93,7 @@ class FlowClient:
             )
 
         start_time = time.time()
+        response = None
 
         try:
             async with AsyncSession() as session:
@@ -109,15 +132,28 @@ class FlowClient:
         except Exception as e:
             duration_ms = (time.time() - start_time) * 1000
             error_msg = str(e)
+            status_code = response.status_code if response is not None else None
+            error_status = None
+            if status_code is not None and status_code >= 400:
+                try:
+                    error = response.json().get("error")
+                    error_status = error.get("status") if isinstance(error, dict) else None
+                except Exception:
+                    pass
 
             if config.debug_enabled:
                 debug_logger.log_error(
                     error_message=error_msg,
-                    status_code=getattr(e, 'status_code', None),
+                    status_code=status_code,
                     response_text=getattr(e, 'response_text', None)
                 )
 
-            raise Exception(f"Flow API request failed: {error_msg}")
+            raise FlowAPIError(
+                f"Flow API request failed: {error_msg}",
+                status_code=status_code,
+                error_status=error_status,
+                timed_out=isinstance(e, Timeout) and not isinstance(e, ConnectTimeout)
+            ) from e
 
     # ========== Authentication (Using ST) ==========
 
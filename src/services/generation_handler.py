@@ -8,6 +8,9 @@ from ..core.logger import debug_logger
 from ..core.config import config
 from ..core.models import Task, RequestLog
 from .file_cache import FileCache
+from .flow_client import FlowAPIError
+from .request_log_writer import RequestLogWriter
+from .load_balancer import TokenLease
 
 
 # Model configuration
@@ -320,12 +323,14 @@ MODEL_CONFIG = {
 class GenerationHandler:
     """统一GenerateProcess器"""
 
-    def __init__(self, flow_client, token_manager, load_balancer, db, concurrency_manager, proxy_manager):
+    def __init__(self, flow_client, token_manager, load_balancer, db, concurrency_manager, proxy_manager,
+                 request_log_writer: Optional[RequestLogWriter] = None):
         self.flow_client = flow_client
         self.token_manager = token_manager
         self.load_balancer = load_balancer
         self.db = db
         self.concurrency_manager = concurrency_manager
+        self.request_log_writer = request_log_writer or RequestLogWriter(db)
         self.file_cache = FileCache(
             cache_dir="tmp",
             default_timeout=config.cache_timeout,
@@ -348,12 +353,40 @@ class GenerationHandler:
         )
         return token_obj is not None
 
+    async def reserve_token(self, model: str, client: str = "") -> Optional[TokenLease]:
+        """为流式Generate预先占用Token (所有Token并发已满时排队等待)
+
+        在返回流式Response之前调用, 以便排队超时或队列已满时能返回429.
+
+        Args:
+            model: Model名称
+            client: 客户端标识 (API key), 用于公平排队
+
+        Returns:
+            TokenLease, 无可用Token时返回None
+
+        Raises:
+            AdmissionRejected: 队列已满或等待超时
+        """
+        model_config = MODEL_CONFIG.get(model)
+        if not model_config:
+            return None
+        is_image = model_config["type"] == "image"
+        return await self.load_balancer.acquire_token(
+            for_image_generation=is_image,
+            for_video_generation=not is_image,
+            model=model,
+            wait=True,
+            client=client
+        )
+
     async def handle_generation(
         self,
         model: str,
         prompt: str,
         images: Optional[List[bytes]] = None,
-        stream: bool = False
+        stream: bool = False,
+        lease: Optional[TokenLease] = None
     ) -> AsyncGenerator:
         """统一Generate入口
 
@@ -362,6 +395,7 @@ class GenerationHandler:
             prompt: 提示词
             images: Image列表 (bytes格式)
             stream: 是否流式输出
+            lease: reserve_token() 预先占用的Token (可选), 由本方法释放
         """
         start_time = time.time()
         token = None
@@ -404,24 +438,44 @@ class GenerationHandler:
                 role="assistant"
             )
 
+        # I2V: 首尾帧Model - 需要1-2张Image (验证在选择Token之前, 请求错误不计入Token的结果)
+        if model_config.get("video_type") == "i2v":
+            image_count = len(images) if images else 0
+            min_images = model_config.get("min_images", 0)
+            max_images = model_config.get("max_images", 0)
+            if image_count < min_images or image_count > max_images:
+                error_msg = f"❌ 首尾帧Model需要 {min_images}-{max_images} 张Image,当前提供了 {image_count} 张"
+                if lease is not None:
+                    lease.release(None)
+                if stream:
+                    yield self._create_stream_chunk(f"{error_msg}\n")
+                yield self._create_error_response(error_msg)
+                return
+
         # 2. 选择Token
         debug_logger.log_info(f"[GENERATION] 正在选择可用Token...")
 
-        if generation_type == "image":
-            token = await self.load_balancer.select_token(for_image_generation=True, model=model)
-        else:
-            token = await self.load_balancer.select_token(for_video_generation=True, model=model)
+        # Selection and concurrency slot are taken together; the lease is released in finally
+        if lease is None:
+            if generation_type == "image":
+                lease = await self.load_balancer.acquire_token(for_image_generation=True, model=model)
+            else:
+                lease = await self.load_balancer.acquire_token(for_video_generation=True, model=model)
 
-        if not token:
-            error_msg = self._get_no_token_error_message(generation_type)
+        if not lease:
+            error_msg = self._get_no_token_error_message(generation_type, model)
             debug_logger.log_error(f"[GENERATION] {error_msg}")
             if stream:
                 yield self._create_stream_chunk(f"❌ {error_msg}\n")
             yield self._create_error_response(error_msg)
             return
 
+        token = lease.token
         debug_logger.log_info(f"[GENERATION] 已选择Token: {token.id} ({token.email})")
 
+        # True / False once the generation reached an outcome; None if it was cancelled or aborted
+        outcome = None
+        overloaded = False
         try:
             # 3. 确保AT有效
             debug_logger.log_info(f"[GENERATION] CheckToken AT有效性...")
@@ -433,6 +487,7 @@ class GenerationHandler:
                 debug_logger.log_error(f"[GENERATION] {error_msg}")
                 if stream:
                     yield self._create_stream_chunk(f"❌ {error_msg}\n")
+                # No outcome: nothing reached upstream (a failed refresh already disabled the token)
                 yield self._create_error_response(error_msg)
                 return
 
@@ -465,6 +520,7 @@ class GenerationHandler:
 
             # 重置Error计数 (RequestSuccess时清空连续Error计数)
             await self.token_manager.record_success(token.id)
+            outcome = True
 
             debug_logger.log_info(f"[GENERATION] ✅ GenerateSuccessComplete")
 
@@ -494,6 +550,7 @@ class GenerationHandler:
             )
 
         except Exception as e:
+            outcome = False
             error_msg = f"GenerateFailed: {str(e)}"
             debug_logger.log_error(f"[GENERATION] ❌ {error_msg}")
             if stream:
@@ -501,6 +558,8 @@ class GenerationHandler:
             if token:
                 # 记录Error（所有Error统一Process，不再特殊Process429）
                 await self.token_manager.record_error(token.id)
+                # 429 / 超时: 降低该Token的自适应并发上限
+                overloaded = self._is_overload_error(e)
             yield self._create_error_response(error_msg)
 
             # 记录Failed日志
@@ -514,8 +573,22 @@ class GenerationHandler:
                 duration
             )
 
-    def _get_no_token_error_message(self, generation_type: str) -> str:
+        finally:
+            lease.release(outcome, overloaded)
+
+    @staticmethod
+    def _is_overload_error(error: Exception) -> bool:
+        """Flow API answered 429 / RESOURCE_EXHAUSTED or did not answer in time: the token got more than it can handle"""
+        if not isinstance(error, FlowAPIError):
+            return False
+        return error.status_code == 429 or error.error_status == "RESOURCE_EXHAUSTED" or error.timed_out
+
+    def _get_no_token_error_message(self, generation_type: str, model: Optional[str] = None) -> str:
         """Get无可用Token时的详细Error信息"""
+        router = self.load_balancer.router
+        tiers = router.tiers(model) if router else None
+        if tiers:
+            return f"没有可用的Token支持Model {model} (需要 {', '.join(tiers)} 账号)。符合条件的Token都处于禁用、冷却或已过期Status。"
         if generation_type == "image":
             return "没有可用的Token进行ImageGenerate。所有Token都处于禁用、冷却、锁定或已过期Status。"
         else:
@@ -530,95 +603,83 @@ class GenerationHandler:
         images: Optional[List[bytes]],
         stream: bool
     ) -> AsyncGenerator:
-        """ProcessImageGenerate (同步返回)"""
+        """ProcessImageGenerate (同步返回, 并发槽位由TokenLease持有)"""
 
-        # Get并发槽位
-        if self.concurrency_manager:
-            if not await self.concurrency_manager.acquire_image(token.id):
-                yield self._create_error_response("Image并发限制已达上限")
-                return
-
-        try:
-            # 上传Image (如果有)
-            image_inputs = []
-            if images and len(images) > 0:
-                if stream:
-                    yield self._create_stream_chunk(f"上传 {len(images)} 张Reference image片...\n")
-
-                # 支持多图输入
-                for idx, image_bytes in enumerate(images):
-                    media_id = await self.flow_client.upload_image(
-                        token.at,
-                        image_bytes,
-                        model_config["aspect_ratio"]
-                    )
-                    image_inputs.append({
-                        "name": media_id,
-                        "imageInputType": "IMAGE_INPUT_TYPE_REFERENCE"
-                    })
-                    if stream:
-                        yield self._create_stream_chunk(f"已上传第 {idx + 1}/{len(images)} 张Image\n")
-
-            # 调用GenerateAPI
+        # 上传Image (如果有)
+        image_inputs = []
+        if images and len(images) > 0:
             if stream:
-                yield self._create_stream_chunk("正在GenerateImage...\n")
+                yield self._create_stream_chunk(f"上传 {len(images)} 张Reference image片...\n")
+
+            # 支持多图输入
+            for idx, image_bytes in enumerate(images):
+                media_id = await self.flow_client.upload_image(
+                    token.at,
+                    image_bytes,
+                    model_config["aspect_ratio"]
+                )
+                image_inputs.append({
+                    "name": media_id,
+                    "imageInputType": "IMAGE_INPUT_TYPE_REFERENCE"
+                })
+                if stream:
+                    yield self._create_stream_chunk(f"已上传第 {idx + 1}/{len(images)} 张Image\n")
 
-            result = await self.flow_client.generate_image(
-                at=token.at,
-                project_id=project_id,
-                prompt=prompt,
-                model_name=model_config["model_name"],
-                aspect_ratio=model_config["aspect_ratio"],
-                image_inputs=image_inputs
-            )
+        # 调用GenerateAPI
+        if stream:
+            yield self._create_stream_chunk("正在GenerateImage...\n")
+
+        result = await self.flow_client.generate_image(
+            at=token.at,
+            project_id=project_id,
+            prompt=prompt,
+            model_name=model_config["model_name"],
+            aspect_ratio=model_config["aspect_ratio"],
+            image_inputs=image_inputs
+        )
 
-            # 提取URL
-            media = result.get("media", [])
-            if not media:
-                yield self._create_error_response("GenerateResult为空")
-                return
+        # 提取URL
+        media = result.get("media", [])
+        if not media:
+            # Raised: an upstream failure, reported on the lease like any other
+            raise Exception("GenerateResult为空")
 
-            image_url = media[0]["image"]["generatedImage"]["fifeUrl"]
+        image_url = media[0]["image"]["generatedImage"]["fifeUrl"]
 
-            # CacheImage (如果启用)
-            local_url = image_url
-            if config.cache_enabled:
-                try:
-                    if stream:
-                        yield self._create_stream_chunk("CacheImage中...\n")
-                    cached_filename = await self.file_cache.download_and_cache(image_url, "image")
-                    local_url = f"{self._get_base_url()}/tmp/{cached_filename}"
-                    if stream:
-                        yield self._create_stream_chunk("✅ ImageCacheSuccess,准备返回Cache地址...\n")
-                except Exception as e:
-                    debug_logger.log_error(f"Failed to cache image: {str(e)}")
-                    # CacheFailed不影响Result返回,使用原始URL
-                    local_url = image_url
-                    if stream:
-                        yield self._create_stream_chunk(f"⚠️ CacheFailed: {str(e)}\n正在返回源链接...\n")
-            else:
+        # CacheImage (如果启用)
+        local_url = image_url
+        if config.cache_enabled:
+            try:
                 if stream:
-                    yield self._create_stream_chunk("Cache已关闭,正在返回源链接...\n")
-
-            # 返回Result
-            # 存储URL用于日志记录
-            self._last_generated_url = local_url
-
+                    yield self._create_stream_chunk("CacheImage中...\n")
+                cached_filename = await self.file_cache.download_and_cache(image_url, "image")
+                local_url = f"{self._get_base_url()}/tmp/{cached_filename}"
+                if stream:
+                    yield self._create_stream_chunk("✅ ImageCacheSuccess,准备返回Cache地址...\n")
+            except Exception as e:
+                debug_logger.log_error(f"Failed to cache image: {str(e)}")
+                # CacheFailed不影响Result返回,使用原始URL
+                local_url = image_url
+                if stream:
+                    yield self._create_stream_chunk(f"⚠️ CacheFailed: {str(e)}\n正在返回源链接...\n")
+        else:
             if stream:
-                yield self._create_stream_chunk(
-                    f"![Generated Image]({local_url})",
-                    finish_reason="stop"
-                )
-            else:
-                yield self._create_completion_response(
-                    local_url,  # 直接传URL,让方法内部格式化
-                    media_type="image"
-                )
+                yield self._create_stream_chunk("Cache已关闭,正在返回源链接...\n")
 
-        finally:
-            # 释放并发槽位
-            if self.concurrency_manager:
-                await self.concurrency_manager.release_image(token.id)
+        # 返回Result
+        # 存储URL用于日志记录
+        self._last_generated_url = local_url
+
+        if stream:
+            yield self._create_stream_chunk(
+                f"![Generated Image]({local_url})",
+                finish_reason="stop"
+            )
+        else:
+            yield self._create_completion_response(
+                local_url,  # 直接传URL,让方法内部格式化
+                media_type="image"
+            )
 
     async def _handle_video_generation(
         self,
@@ -629,177 +690,155 @@ class GenerationHandler:
         images: Optional[List[bytes]],
         stream: bool
     ) -> AsyncGenerator:
-        """ProcessVideoGenerate (异步Poll)"""
-
-        # Get并发槽位
-        if self.concurrency_manager:
-            if not await self.concurrency_manager.acquire_video(token.id):
-                yield self._create_error_response("Video并发限制已达上限")
-                return
-
-        try:
-            # GetModel类型和Config
-            video_type = model_config.get("video_type")
-            supports_images = model_config.get("supports_images", False)
-            min_images = model_config.get("min_images", 0)
-            max_images = model_config.get("max_images", 0)
-
-            # Image数量
-            image_count = len(images) if images else 0
+        """ProcessVideoGenerate (异步Poll, 并发槽位由TokenLease持有)"""
 
-            # ========== 验证和ProcessImage ==========
+        # GetModel类型和Config
+        video_type = model_config.get("video_type")
+        supports_images = model_config.get("supports_images", False)
 
-            # T2V: 文生Video - 不支持Image
-            if video_type == "t2v":
-                if image_count > 0:
-                    if stream:
-                        yield self._create_stream_chunk("⚠️ 文生VideoModel不支持上传Image,将忽略Image仅使用文本提示词Generate\n")
-                    debug_logger.log_warning(f"[T2V] Model {model_config['model_key']} 不支持Image,已忽略 {image_count} 张Image")
-                images = None  # 清空Image
-                image_count = 0
-
-            # I2V: 首尾帧Model - 需要1-2张Image
-            elif video_type == "i2v":
-                if image_count < min_images or image_count > max_images:
-                    error_msg = f"❌ 首尾帧Model需要 {min_images}-{max_images} 张Image,当前提供了 {image_count} 张"
-                    if stream:
-                        yield self._create_stream_chunk(f"{error_msg}\n")
-                    yield self._create_error_response(error_msg)
-                    return
-
-            # R2V: 多图Generate - 支持多张Image,不限制数量
-            elif video_type == "r2v":
-                # 不再限制最大Image数量
-                pass
-
-            # ========== 上传Image ==========
-            start_media_id = None
-            end_media_id = None
-            reference_images = []
-
-            # I2V: 首尾帧Process
-            if video_type == "i2v" and images:
-                if image_count == 1:
-                    # 只有1张图: 仅作为首帧
-                    if stream:
-                        yield self._create_stream_chunk("上传首帧Image...\n")
-                    start_media_id = await self.flow_client.upload_image(
-                        token.at, images[0], model_config["aspect_ratio"]
-                    )
-                    debug_logger.log_info(f"[I2V] 仅上传首帧: {start_media_id}")
+        # Image数量
+        image_count = len(images) if images else 0
 
-                elif image_count == 2:
-                    # 2张图: 首帧+尾帧
-                    if stream:
-                        yield self._create_stream_chunk("上传首帧和尾帧Image...\n")
-                    start_media_id = await self.flow_client.upload_image(
-                        token.at, images[0], model_config["aspect_ratio"]
-                    )
-                    end_media_id = await self.flow_client.upload_image(
-                        token.at, images[1], model_config["aspect_ratio"]
-                    )
-                    debug_logger.log_info(f"[I2V] 上传首尾帧: {start_media_id}, {end_media_id}")
+        # ========== 验证和ProcessImage ==========
 
-            # R2V: 多图Process
-            elif video_type == "r2v" and images:
+        # T2V: 文生Video - 不支持Image
+        if video_type == "t2v":
+            if image_count > 0:
                 if stream:
-                    yield self._create_stream_chunk(f"上传 {image_count} 张Reference image片...\n")
+                    yield self._create_stream_chunk("⚠️ 文生VideoModel不支持上传Image,将忽略Image仅使用文本提示词Generate\n")
+                debug_logger.log_warning(f"[T2V] Model {model_config['model_key']} 不支持Image,已忽略 {image_count} 张Image")
+            images = None  # 清空Image
+            image_count = 0
+
+        # I2V: 首尾帧Model - 需要1-2张Image (数量已在 handle_generation 中验证)
+
+        # R2V: 多图Generate - 支持多张Image,不限制数量
+        elif video_type == "r2v":
+            # 不再限制最大Image数量
+            pass
+
+        # ========== 上传Image ==========
+        start_media_id = None
+        end_media_id = None
+        reference_images = []
+
+        # I2V: 首尾帧Process
+        if video_type == "i2v" and images:
+            if image_count == 1:
+                # 只有1张图: 仅作为首帧
+                if stream:
+                    yield self._create_stream_chunk("上传首帧Image...\n")
+                start_media_id = await self.flow_client.upload_image(
+                    token.at, images[0], model_config["aspect_ratio"]
+                )
+                debug_logger.log_info(f"[I2V] 仅上传首帧: {start_media_id}")
 
-                for idx, img in enumerate(images):  # 上传所有Image,不限制数量
-                    media_id = await self.flow_client.upload_image(
-                        token.at, img, model_config["aspect_ratio"]
-                    )
-                    reference_images.append({
-                        "imageUsageType": "IMAGE_USAGE_TYPE_ASSET",
-                        "mediaId": media_id
-                    })
-                debug_logger.log_info(f"[R2V] 上传了 {len(reference_images)} 张Reference image片")
+            elif image_count == 2:
+                # 2张图: 首帧+尾帧
+                if stream:
+                    yield self._create_stream_chunk("上传首帧和尾帧Image...\n")
+                start_media_id = await self.flow_client.upload_image(
+                    token.at, images[0], model_config["aspect_ratio"]
+                )
+                end_media_id = await self.flow_client.upload_image(
+                    token.at, images[1], model_config["aspect_ratio"]
+                )
+                debug_logger.log_info(f"[I2V] 上传首尾帧: {start_media_id}, {end_media_id}")
 
-            # ========== 调用GenerateAPI ==========
+        # R2V: 多图Process
+        elif video_type == "r2v" and images:
             if stream:
-                yield self._create_stream_chunk("提交VideoGenerateTask...\n")
-
-            # I2V: 首尾帧Generate
-            if video_type == "i2v" and start_media_id:
-                if end_media_id:
-                    # 有首尾帧
-                    result = await self.flow_client.generate_video_start_end(
-                        at=token.at,
-                        project_id=project_id,
-                        prompt=prompt,
-                        model_key=model_config["model_key"],
-                        aspect_ratio=model_config["aspect_ratio"],
-                        start_media_id=start_media_id,
-                        end_media_id=end_media_id,
-                        user_paygate_tier=token.user_paygate_tier or "PAYGATE_TIER_ONE"
-                    )
-                else:
-                    # 只有首帧
-                    result = await self.flow_client.generate_video_start_image(
-                        at=token.at,
-                        project_id=project_id,
-                        prompt=prompt,
-                        model_key=model_config["model_key"],
-                        aspect_ratio=model_config["aspect_ratio"],
-                        start_media_id=start_media_id,
-                        user_paygate_tier=token.user_paygate_tier or "PAYGATE_TIER_ONE"
-                    )
+                yield self._create_stream_chunk(f"上传 {image_count} 张Reference image片...\n")
+
+            for idx, img in enumerate(images):  # 上传所有Image,不限制数量
+                media_id = await self.flow_client.upload_image(
+                    token.at, img, model_config["aspect_ratio"]
+                )
+                reference_images.append({
+                    "imageUsageType": "IMAGE_USAGE_TYPE_ASSET",
+                    "mediaId": media_id
+                })
+            debug_logger.log_info(f"[R2V] 上传了 {len(reference_images)} 张Reference image片")
+
+        # ========== 调用GenerateAPI ==========
+        if stream:
+            yield self._create_stream_chunk("提交VideoGenerateTask...\n")
 
-            # R2V: 多图Generate
-            elif video_type == "r2v" and reference_images:
-                result = await self.flow_client.generate_video_reference_images(
+        # I2V: 首尾帧Generate
+        if video_type == "i2v" and start_media_id:
+            if end_media_id:
+                # 有首尾帧
+                result = await self.flow_client.generate_video_start_end(
                     at=token.at,
                     project_id=project_id,
                     prompt=prompt,
                     model_key=model_config["model_key"],
                     aspect_ratio=model_config["aspect_ratio"],
-                    reference_images=reference_images,
+                    start_media_id=start_media_id,
+                    end_media_id=end_media_id,
                     user_paygate_tier=token.user_paygate_tier or "PAYGATE_TIER_ONE"
                 )
-
-            # T2V 或 R2V无图: 纯文本Generate
             else:
-                result = await self.flow_client.generate_video_text(
+                # 只有首帧
+                result = await self.flow_client.generate_video_start_image(
                     at=token.at,
                     project_id=project_id,
                     prompt=prompt,
                     model_key=model_config["model_key"],
                     aspect_ratio=model_config["aspect_ratio"],
+                    start_media_id=start_media_id,
                     user_paygate_tier=token.user_paygate_tier or "PAYGATE_TIER_ONE"
                 )
 
-            # Gettask_id和operations
-            operations = result.get("operations", [])
-            if not operations:
-                yield self._create_error_response("GenerateTask创建Failed")
-                return
-
-            operation = operations[0]
-            task_id = operation["operation"]["name"]
-            scene_id = operation.get("sceneId")
+        # R2V: 多图Generate
+        elif video_type == "r2v" and reference_images:
+            result = await self.flow_client.generate_video_reference_images(
+                at=token.at,
+                project_id=project_id,
+                prompt=prompt,
+                model_key=model_config["model_key"],
+                aspect_ratio=model_config["aspect_ratio"],
+                reference_images=reference_images,
+                user_paygate_tier=token.user_paygate_tier or "PAYGATE_TIER_ONE"
+            )
 
-            # 保存Task到数据库
-            task = Task(
-                task_id=task_id,
-                token_id=token.id,
-                model=model_config["model_key"],
+        # T2V 或 R2V无图: 纯文本Generate
+        else:
+            result = await self.flow_client.generate_video_text(
+                at=token.at,
+                project_id=project_id,
                 prompt=prompt,
-                status="processing",
-                scene_id=scene_id
+                model_key=model_config["model_key"],
+                aspect_ratio=model_config["aspect_ratio"],
+                user_paygate_tier=token.user_paygate_tier or "PAYGATE_TIER_ONE"
             )
-            await self.db.create_task(task)
 
-            # PollResult
-            if stream:
-                yield self._create_stream_chunk(f"VideoGenerate中...\n")
+        # Gettask_id和operations
+        operations = result.get("operations", [])
+        if not operations:
+            raise Exception("GenerateTask创建Failed")
+
+        operation = operations[0]
+        task_id = operation["operation"]["name"]
+        scene_id = operation.get("sceneId")
+
+        # 保存Task到数据库
+        task = Task(
+            task_id=task_id,
+            token_id=token.id,
+            model=model_config["model_key"],
+            prompt=prompt,
+            status="processing",
+            scene_id=scene_id
+        )
+        await self.db.create_task(task)
 
-            async for chunk in self._poll_video_result(token, operations, stream):
-                yield chunk
+        # PollResult
+        if stream:
+            yield self._create_stream_chunk(f"VideoGenerate中...\n")
 
-        finally:
-            # 释放并发槽位
-            if self.concurrency_manager:
-                await self.concurrency_manager.release_video(token.id)
+        async for chunk in self._poll_video_result(token, operations, stream):
+            yield chunk
 
     async def _poll_video_result(
         self,
@@ -811,6 +850,7 @@ class GenerationHandler:
 
         max_attempts = config.max_poll_attempts
         poll_interval = config.poll_interval
+        failure = None
 
         for attempt in range(max_attempts):
             await asyncio.sleep(poll_interval)
@@ -839,8 +879,8 @@ class GenerationHandler:
                     video_url = video_info.get("fifeUrl")
 
                     if not video_url:
-                        yield self._create_error_response("VideoURL为空")
-                        return
+                        failure = "VideoURL为空"
+                        break
 
                     # CacheVideo (如果启用)
                     local_url = video_url
@@ -890,15 +930,19 @@ class GenerationHandler:
 
                 elif status.startswith("MEDIA_GENERATION_STATUS_ERROR"):
                     # Failed
-                    yield self._create_error_response(f"VideoGenerateFailed: {status}")
-                    return
+                    failure = f"VideoGenerateFailed: {status}"
+                    break
 
             except Exception as e:
                 debug_logger.log_error(f"Poll error: {str(e)}")
                 continue
 
+        # Raised outside the poll loop (which retries its own errors): counted as a failure of the token
+        if failure:
+            raise Exception(failure)
+
         # Timeout
-        yield self._create_error_response(f"VideoGenerateTimeout (已Poll{max_attempts}次)")
+        raise Exception(f"VideoGenerateTimeout (已Poll{max_attempts}次)")
 
     # ========== Response格式化 ==========
 
@@ -1001,7 +1045,7 @@ class GenerationHandler:
         status_code: int,
         duration: float
     ):
-        """记录Request到数据库"""
+        """记录Request到数据库（写入队列，由后台任务批量写入）"""
         try:
             log = RequestLog(
                 token_id=token_id,
@@ -1011,7 +1055,7 @@ class GenerationHandler:
                 status_code=status_code,
                 duration=duration
             )
-            await self.db.add_request_log(log)
+            await self.request_log_writer.submit(log)
         except Exception as e:
             # 日志记录Failed不影响主流程
             debug_logger.log_error(f"Failed to log request: {e}")
@@ -1,17 +1,323 @@
 """Load balancing module for Flow2API"""
-import random
-from typing import Optional
+import asyncio
+import math
+import time
+from typing import Dict, Optional, Tuple
+from ..core.config import config
 from ..core.models import Token
+from .admission_queue import AdmissionQueue, AdmissionRejected
+from .circuit_breaker import TokenCircuitBreakers
 from .concurrency_manager import ConcurrencyManager
+from .model_router import ModelRouter
+from .token_pools import TokenPools, KIND_IMAGE, KIND_VIDEO, KIND_ANY
+from .selection_strategies import STRATEGIES, DEFAULT_STRATEGY, SelectionStrategy, TokenLoadTracker
 from ..core.logger import debug_logger
 
 
+# Kinds with concurrency slots to wait for
+KINDS_WAITING = (KIND_IMAGE, KIND_VIDEO)
+
+
+class TokenLease:
+    """A selected token with its concurrency slot already taken
+
+    Returned by LoadBalancer.acquire_token(). The holder must call
+    release() exactly once the generation is over, whether it succeeded,
+    failed or was cancelled (from a finally block); further calls are no-ops.
+    Only a generation that reached an outcome reports one: release(None)
+    (cancelled, client gone, never reached upstream) just gives the slot back.
+    """
+
+    __slots__ = ("load_balancer", "token", "kind", "model", "acquired_at", "released")
+
+    def __init__(self, load_balancer: "LoadBalancer", token: Token, kind: str, model: Optional[str] = None):
+        self.load_balancer = load_balancer
+        self.token = token
+        self.kind = kind
+        self.model = model
+        self.acquired_at = time.time()
+        self.released = False
+
+    def __del__(self):
+        # Safety net: a lease handed to a streaming response that never started (client gone) gives
+        # its slot back without an outcome, so breakers, routing and adaptive limits are left alone
+        if not self.released:
+            self.release(None)
+
+    def release(self, success: Optional[bool] = None, overloaded: bool = False):
+        """Give the slot back and report the generation
+
+        success: True / False once the generation reached an outcome, None if it did not
+        overloaded: failed with a 429 or a timeout
+        """
+        if self.released:
+            return
+        self.released = True
+        self.load_balancer._release(self, success, overloaded)
+
+
 class LoadBalancer:
-    """Token load balancer with random selection"""
+    """Token load balancer with pluggable selection strategies
+
+    Selection reads the live TokenPools index (ready tokens per kind and
+    paygate tier), so picking a token does not depend on the pool size.
+    Among the ready tokens, the strategy configured for the model type
+    (config.image_selection_strategy / video_selection_strategy) picks one,
+    using the outstanding requests and latency reported through
+    record_start() / record_finish().
+
+    acquire_token() chooses a token and takes its concurrency slot with no
+    await in between, so concurrent requests never pick the same last slot.
+    select_token() only peeks (availability checks).
+
+    With a ModelRouter, the `model` argument narrows the ready pool to the
+    paygate tiers able to serve the model and skips tokens cooling down
+    after repeated failures of that model; a cooldown ending serves the
+    requests waiting for the model.
+
+    With wait=True and an AdmissionQueue, a request finding every matching
+    slot taken waits for one instead of failing: each freed slot is handed
+    to the longest-waiting request able to use it (one queue per model). A
+    full queue or a wait longer than max_wait_seconds raises
+    AdmissionRejected with a Retry-After estimate.
 
-    def __init__(self, token_manager, concurrency_manager: Optional[ConcurrencyManager] = None):
+    With TokenCircuitBreakers, tokens whose circuit is open are left out of
+    the ready pools, and a half-open token takes only as many generations
+    as it has probes. Lease outcomes feed the breakers, so none of this
+    reads the database.
+    """
+
+    # Stale tokens refreshed inline when no token with a fresh AT is ready
+    MAX_INLINE_REFRESH = 3
+
+    def __init__(
+        self,
+        token_manager,
+        concurrency_manager: Optional[ConcurrencyManager] = None,
+        admission: Optional[AdmissionQueue] = None,
+        router: Optional[ModelRouter] = None,
+        breakers: Optional[TokenCircuitBreakers] = None
+    ):
         self.token_manager = token_manager
         self.concurrency_manager = concurrency_manager
+        self.breakers = breakers
+        self.pools = TokenPools(token_manager.registry, concurrency_manager, breakers=breakers)
+        self.load = TokenLoadTracker()
+        self.admission = admission or AdmissionQueue(max_queue=0)
+        self.router = router
+        self._routes: Dict[str, Tuple[str, Optional[str]]] = {}  # admission queue -> (kind, model)
+        self._dispatch_scheduled = False
+
+        token_manager.registry.add_listener(self._on_token_changed)
+        if concurrency_manager is not None:
+            concurrency_manager.add_listener(lambda token_id: self._schedule_dispatch())
+        if breakers is not None:
+            breakers.add_listener(lambda token_id: self._schedule_dispatch())
+        if router is not None:
+            router.add_listener(lambda token_id: self._schedule_dispatch())
+
+    def _on_token_changed(self, token_id: int, runtime):
+        """Registry listener"""
+        if runtime is None:
+            self.load.forget(token_id)
+            if self.router is not None:
+                self.router.forget(token_id)
+            if self.breakers is not None:
+                self.breakers.forget(token_id)
+        self._schedule_dispatch()
+
+    def get_strategy(self, kind: str) -> SelectionStrategy:
+        """Strategy configured for a kind of generation"""
+        if kind == KIND_IMAGE:
+            name = config.image_selection_strategy
+        elif kind == KIND_VIDEO:
+            name = config.video_selection_strategy
+        else:
+            name = DEFAULT_STRATEGY
+        return STRATEGIES.get(name) or STRATEGIES[DEFAULT_STRATEGY]
+
+    def record_start(self, token_id: int):
+        """A generation started on the token"""
+        self.load.started(token_id)
+
+    def record_finish(self, token_id: int, latency: float, success: bool):
+        """A generation on the token ended after `latency` seconds"""
+        self.load.finished(token_id, latency, success)
+
+    # ========== Slots ==========
+
+    def _reserve(self, kind: str, token_id: int) -> bool:
+        if self.concurrency_manager is not None and kind != KIND_ANY:
+            if not self.concurrency_manager.try_acquire(kind, token_id):
+                return False
+        if self.breakers is not None:
+            self.breakers.started(token_id)
+        return True
+
+    def _release_slot(self, kind: str, token_id: int):
+        if self.concurrency_manager is not None and kind != KIND_ANY:
+            self.concurrency_manager.release(kind, token_id)
+
+    def _unreserve(self, kind: str, token_id: int):
+        """Undo _reserve() for a generation that never started"""
+        self._release_slot(kind, token_id)
+        if self.breakers is not None:
+            self.breakers.finished(token_id, None)
+
+    def _abandon(self, lease: TokenLease):
+        """Lease released without an outcome: only the slot and the in-flight count are given back"""
+        self._unreserve(lease.kind, lease.token.id)
+        self.load.finished(lease.token.id, 0.0, False)
+
+    def _release(self, lease: TokenLease, success: Optional[bool], overloaded: bool = False):
+        """TokenLease.release()"""
+        if success is None:
+            self._abandon(lease)
+            return
+        latency = time.time() - lease.acquired_at
+        if self.concurrency_manager is not None and lease.kind != KIND_ANY:
+            # Before the slot is given back: the adaptive limit looks at slots in use
+            self.concurrency_manager.record(
+                lease.kind, lease.token.id, latency, success, overloaded, lease.acquired_at
+            )
+        self._release_slot(lease.kind, lease.token.id)
+        if self.breakers is not None:
+            self.breakers.finished(lease.token.id, success)
+        self.record_finish(lease.token.id, latency, success)
+        if self.router is not None:
+            self.router.record(lease.model, lease.token.id, success)
+
+    # ========== Admission ==========
+
+    @staticmethod
+    def _queue_name(kind: str, model: Optional[str]) -> str:
+        return model or kind
+
+    def _schedule_dispatch(self):
+        """Hand freed slots to waiters (deferred: listeners run inside acquire/release)"""
+        if self._dispatch_scheduled or not self.admission.waiting_queues():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside the event loop (e.g. a lease finalized by GC): no waiter can be served from here
+            return
+        self._dispatch_scheduled = True
+        loop.call_soon(self._dispatch)
+
+    def _dispatch(self):
+        blocked = set()
+        while True:
+            queues = [queue for queue in self.admission.waiting_queues() if queue not in blocked]
+            if not queues:
+                break
+            # Longest-waiting request first, among the queues a free token can still serve
+            queue = min(queues, key=self.admission.peek_seq)
+            kind, model = self._routes[queue]
+            token_id = self._choose(kind, model)
+            if token_id is None or not self._reserve(kind, token_id):
+                blocked.add(queue)
+                continue
+            self.admission.next_waiter(queue).set_result(token_id)
+            self.admission.admitted += 1
+        # Cleared last: slots taken above notify listeners again
+        self._dispatch_scheduled = False
+
+    def _retry_after(self, queue: str) -> int:
+        """Seconds until the queue ahead has likely drained"""
+        in_flight = max(sum(self.load.outstanding.values()), 1)
+        seconds = (self.admission.depth(queue) + 1) * self.load.mean_latency() / in_flight
+        return min(max(math.ceil(seconds), 1), 600)
+
+    async def _wait_for_slot(self, kind: str, model: Optional[str], client: str) -> Optional[int]:
+        """Queue for the next freed slot, returns the reserved token_id"""
+        tiers = exclude = None
+        if self.router is not None:
+            tiers = self.router.tiers(model)
+            exclude = self.router.excluded(model)
+        if not self.pools.has_busy(kind, tiers, exclude):
+            # Nothing will free up: no usable token at all
+            return None
+        queue = self._queue_name(kind, model)
+        if self.admission.is_full(queue):
+            self.admission.rejected_full += 1
+            raise AdmissionRejected("admission queue full", self._retry_after(queue))
+
+        debug_logger.log_info(f"[LOAD_BALANCER] 所有Token并发已满, 排队等待 (队列 {queue}: {self.admission.depth(queue)})")
+        self._routes[queue] = (kind, model)
+        waiter = self.admission.enqueue(queue, client)
+        self._schedule_dispatch()
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), self.admission.max_wait_seconds)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Served just as we stopped waiting
+                if isinstance(e, asyncio.TimeoutError):
+                    return waiter.result()
+                self._unreserve(kind, waiter.result())
+            else:
+                waiter.cancel()
+                self.admission.discard(queue, client, waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.admission.rejected_timeout += 1
+                raise AdmissionRejected("admission wait timed out", self._retry_after(queue)) from None
+            raise
+
+    # ========== Selection ==========
+
+    @staticmethod
+    def _kind(for_image_generation: bool, for_video_generation: bool) -> str:
+        if for_image_generation:
+            return KIND_IMAGE
+        if for_video_generation:
+            return KIND_VIDEO
+        return KIND_ANY
+
+    def _choose(self, kind: str, model: Optional[str]) -> Optional[int]:
+        """Ready token for the model, picked by the configured strategy"""
+        tiers = exclude = None
+        if self.router is not None:
+            tiers = self.router.tiers(model)
+            exclude = self.router.excluded(model)
+        return self.get_strategy(kind).choose(
+            self.pools, kind, self.load, self.token_manager.registry, tiers=tiers, exclude=exclude
+        )
+
+    def _routable(self, model: Optional[str], token_id: int) -> bool:
+        if self.router is None or not model:
+            return True
+        tiers = self.router.tiers(model)
+        runtime = self.token_manager.registry.runtime(token_id)
+        if tiers is not None and (runtime is None or runtime.tier not in tiers):
+            return False
+        return token_id not in self.router.excluded(model)
+
+    async def _pick(self, kind: str, reserve: bool, model: Optional[str] = None) -> Optional[int]:
+        """Choose a ready token; with `reserve`, its slot is taken before returning"""
+        strategy = self.get_strategy(kind)
+        token_id = self._choose(kind, model)
+        if token_id is not None and reserve and not self._reserve(kind, token_id):
+            token_id = None
+
+        if token_id is None:
+            # Nothing ready with a fresh AT: refresh a stale one inline (AT refresh normally runs in the background)
+            for _ in range(self.MAX_INLINE_REFRESH):
+                candidate = self.pools.choose_stale(kind)
+                if candidate is None:
+                    break
+                if not self._routable(model, candidate):
+                    continue
+                debug_logger.log_info(f"[LOAD_BALANCER] 无可用Token, 尝试刷新Token {candidate} 的AT")
+                if not await self.token_manager.is_at_valid(candidate):
+                    continue
+                # Re-check after the await: the slot may have been taken meanwhile
+                if self.pools.is_ready(kind, candidate) and (not reserve or self._reserve(kind, candidate)):
+                    token_id = candidate
+                    break
+
+        if token_id is not None:
+            debug_logger.log_info(f"[LOAD_BALANCER] 策略 {strategy.name} 选择Token {token_id}")
+        return token_id
 
     async def select_token(
         self,
@@ -20,70 +326,77 @@ class LoadBalancer:
         model: Optional[str] = None
     ) -> Optional[Token]:
         """
-        Select a token using random load balancing
+        Select a token using the strategy configured for the model type
+
+        No concurrency slot is taken; use acquire_token() to run a generation.
 
         Args:
             for_image_generation: If True, only select tokens with image_enabled=True
             for_video_generation: If True, only select tokens with video_enabled=True
-            model: Model name (used to filter tokens for specific models)
+            model: Model name (routes to the tokens able to serve it)
 
         Returns:
             Selected token or None if no available tokens
         """
         debug_logger.log_info(f"[LOAD_BALANCER] Starting token selection (image_gen={for_image_generation}, video_gen={for_video_generation}, model={model})")
 
-        active_tokens = await self.token_manager.get_active_tokens()
-        debug_logger.log_info(f"[LOAD_BALANCER] Retrieved {len(active_tokens)} active tokens")
-
-        if not active_tokens:
-            debug_logger.log_info(f"[LOAD_BALANCER] ❌ No active tokens available")
+        token_id = await self._pick(self._kind(for_image_generation, for_video_generation), False, model)
+        if token_id is None:
+            debug_logger.log_info(f"[LOAD_BALANCER] ❌ 没有可用的Token (image_gen={for_image_generation}, video_gen={for_video_generation})")
             return None
 
-        # Filter tokens based on generation type
-        available_tokens = []
-        filtered_reasons = {}  # 记录过滤原因
-
-        for token in active_tokens:
-            # Check if token has valid AT (not expired)
-            if not await self.token_manager.is_at_valid(token.id):
-                filtered_reasons[token.id] = "AT无效或已过期"
-                continue
-
-            # Filter for image generation
-            if for_image_generation:
-                if not token.image_enabled:
-                    filtered_reasons[token.id] = "image_gen已禁用"
-                    continue
-
-                # Check concurrency limit
-                if self.concurrency_manager and not await self.concurrency_manager.can_use_image(token.id):
-                    filtered_reasons[token.id] = "图片并发已满"
-                    continue
+        selected = await self.token_manager.get_token(token_id)
+        if not selected:
+            return None
+        debug_logger.log_info(f"[LOAD_BALANCER] ✅ 已选择Token {selected.id} ({selected.email}) - 余额: {selected.credits}")
+        return selected
 
-            # Filter for video generation
-            if for_video_generation:
-                if not token.video_enabled:
-                    filtered_reasons[token.id] = "video_gen已禁用"
-                    continue
+    async def acquire_token(
+        self,
+        for_image_generation: bool = False,
+        for_video_generation: bool = False,
+        model: Optional[str] = None,
+        wait: bool = False,
+        client: str = ""
+    ) -> Optional[TokenLease]:
+        """
+        Select a token and take its concurrency slot in one step
 
-                # Check concurrency limit
-                if self.concurrency_manager and not await self.concurrency_manager.can_use_video(token.id):
-                    filtered_reasons[token.id] = "视频并发已满"
-                    continue
+        Args:
+            for_image_generation: If True, only select tokens with image_enabled=True
+            for_video_generation: If True, only select tokens with video_enabled=True
+            model: Model name (routes to the tokens able to serve it)
+            wait: Queue for a slot when all matching tokens are busy
+            client: Client identity (API key) for fair queueing
 
-            available_tokens.append(token)
+        Returns:
+            Lease on the selected token (release it when done) or None if no available tokens
 
-        # 输出过滤信息
-        if filtered_reasons:
-            debug_logger.log_info(f"[LOAD_BALANCER] 已过滤Token:")
-            for token_id, reason in filtered_reasons.items():
-                debug_logger.log_info(f"[LOAD_BALANCER]   - Token {token_id}: {reason}")
+        Raises:
+            AdmissionRejected: wait=True and the queue is full or the wait timed out
+        """
+        debug_logger.log_info(f"[LOAD_BALANCER] Starting token acquisition (image_gen={for_image_generation}, video_gen={for_video_generation}, model={model})")
 
-        if not available_tokens:
+        kind = self._kind(for_image_generation, for_video_generation)
+        # Do not overtake requests already waiting for this model
+        waiting = self.admission.depth(self._queue_name(kind, model))
+        token_id = None if waiting else await self._pick(kind, True, model)
+        if token_id is None and wait and kind in KINDS_WAITING and self.admission.enabled:
+            token_id = await self._wait_for_slot(kind, model, client)
+        if token_id is None:
             debug_logger.log_info(f"[LOAD_BALANCER] ❌ 没有可用的Token (image_gen={for_image_generation}, video_gen={for_video_generation})")
             return None
 
-        # Random selection
-        selected = random.choice(available_tokens)
-        debug_logger.log_info(f"[LOAD_BALANCER] ✅ 已选择Token {selected.id} ({selected.email}) - 余额: {selected.credits}")
-        return selected
+        self.record_start(token_id)
+        selected = None
+        try:
+            selected = await self.token_manager.get_token(token_id)
+        finally:
+            if not selected:
+                self._unreserve(kind, token_id)
+                self.record_finish(token_id, 0.0, False)
+        if not selected:
+            return None
+
+        debug_logger.log_info(f"[LOAD_BALANCER] ✅ 已占用Token {selected.id} ({selected.email}) - 余额: {selected.credits}")
+        return TokenLease(self, selected, kind, model)
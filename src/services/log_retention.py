@@ -0,0 +1,63 @@
+"""Request log retention for Flow2API"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from ..core.database import Database
+from ..core.logger import debug_logger
+
+
+class LogRetentionService:
+    """Rolls request logs into daily partitions and expires old partitions
+
+    Every `interval_seconds` the service:
+    1. Moves logs from before today (UTC) out of request_logs into
+       request_logs_pYYYYMMDD tables, so the live table only holds today
+    2. Drops partitions older than `retention_days` (one DROP TABLE each)
+    3. Runs PRAGMA incremental_vacuum so freed pages go back to the filesystem
+    """
+
+    def __init__(self, db: Database, retention_days: int = 30, interval_seconds: int = 3600):
+        self.db = db
+        self.retention_days = max(retention_days, 1)
+        self.interval_seconds = max(interval_seconds, 60)
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> dict:
+        """Run one roll / expire / vacuum pass"""
+        today = datetime.now(timezone.utc).date()
+
+        moved = await self.db.roll_request_logs(before_day=today)
+        dropped = await self.db.drop_log_partitions(before_day=today - timedelta(days=self.retention_days))
+        freed_pages = await self.db.incremental_vacuum()
+
+        if moved or dropped or freed_pages:
+            debug_logger.log_info(
+                f"[LOG_RETENTION] 归档 {moved} 条日志, 删除分区 {len(dropped)} 个, 回收 {freed_pages} 页"
+            )
+        return {"moved": moved, "dropped": dropped, "freed_pages": freed_pages}
+
+    async def start(self):
+        """Start the background retention task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._retention_loop())
+
+    async def stop(self):
+        """Stop the background retention task"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _retention_loop(self):
+        while True:
+            try:
+                await self.run_once()
+                await asyncio.sleep(self.interval_seconds)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                debug_logger.log_error(f"[LOG_RETENTION] Retention pass failed: {e}")
+                await asyncio.sleep(self.interval_seconds)
@@ -0,0 +1,125 @@
+"""Per-model token routing for Flow2API"""
+import asyncio
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from ..core.logger import debug_logger
+
+
+# Paygate tier of Google AI Ultra subscriptions, the only one serving veo "ultra" models
+ULTRA_TIERS = ("PAYGATE_TIER_TWO",)
+
+
+class ModelRouter:
+    """Decides which tokens may serve each MODEL_CONFIG model
+
+    Two rules narrow the ready pool before a strategy picks:
+    - paygate tier: models whose model_key contains "ultra" (including the
+      "relaxed" variants) need ULTRA_TIERS; any model can be given an
+      explicit tier list through `tier_overrides`. Tokens whose tier is
+      unknown are not routed to tier-restricted models.
+    - learned failures: after `failure_threshold` consecutive failed
+      generations of one model on one token, that token is skipped for
+      that model for `cooldown_seconds`. A success resets the count.
+
+    Listeners are called with the token ID when its cooldown ends, so
+    requests waiting for that model can be handed the token.
+    """
+
+    def __init__(
+        self,
+        model_config: Dict[str, dict],
+        tier_overrides: Optional[Dict[str, Iterable[str]]] = None,
+        failure_threshold: int = 3,
+        cooldown_seconds: int = 1800
+    ):
+        self.failure_threshold = max(failure_threshold, 1)
+        self.cooldown_seconds = max(cooldown_seconds, 0)
+
+        tier_overrides = tier_overrides or {}
+        self._tiers: Dict[str, Optional[Tuple[str, ...]]] = {}
+        for model, model_config_entry in model_config.items():
+            if model in tier_overrides:
+                self._tiers[model] = tuple(tier_overrides[model]) or None
+            elif "ultra" in model_config_entry.get("model_key", ""):
+                self._tiers[model] = ULTRA_TIERS
+            else:
+                self._tiers[model] = None
+
+        self._failures: Dict[Tuple[str, int], int] = {}  # (model, token_id) -> consecutive failures
+        self._cooldown: Dict[str, Dict[int, float]] = {}  # model -> token_id -> skipped until
+        self._listeners: List[Callable[[int], None]] = []
+
+    def add_listener(self, listener: Callable[[int], None]):
+        """Register a callback run with the token ID when one of its cooldowns ends"""
+        self._listeners.append(listener)
+
+    def tiers(self, model: Optional[str]) -> Optional[Tuple[str, ...]]:
+        """Paygate tiers allowed to serve the model (None = any)"""
+        return self._tiers.get(model) if model else None
+
+    def excluded(self, model: Optional[str], now: Optional[float] = None) -> Set[int]:
+        """Tokens cooling down for the model"""
+        cooldown = self._cooldown.get(model) if model else None
+        if not cooldown:
+            return set()
+        now = time.time() if now is None else now
+        for token_id in [tid for tid, until in cooldown.items() if until <= now]:
+            del cooldown[token_id]
+        return set(cooldown)
+
+    def record(self, model: Optional[str], token_id: int, success: Optional[bool]):
+        """Report the outcome of one generation of `model` on the token (None: aborted, ignored)"""
+        if not model or success is None:
+            return
+        key = (model, token_id)
+        if success:
+            self._failures.pop(key, None)
+            cooldown = self._cooldown.get(model)
+            if cooldown:
+                cooldown.pop(token_id, None)
+            return
+
+        failures = self._failures.get(key, 0) + 1
+        if failures < self.failure_threshold or not self.cooldown_seconds:
+            self._failures[key] = failures
+            return
+
+        self._failures.pop(key, None)
+        until = time.time() + self.cooldown_seconds
+        self._cooldown.setdefault(model, {})[token_id] = until
+        try:
+            asyncio.get_running_loop().call_later(self.cooldown_seconds, self._cooldown_ended, model, token_id, until)
+        except RuntimeError:
+            # No event loop: the cooldown still expires on the next excluded() call
+            pass
+        debug_logger.log_warning(
+            f"[MODEL_ROUTER] Token {token_id} 连续 {failures} 次 {model} 失败, 暂停该Model路由 {self.cooldown_seconds}s"
+        )
+
+    def _cooldown_ended(self, model: str, token_id: int, until: float):
+        cooldown = self._cooldown.get(model, {})
+        if cooldown.get(token_id, until) != until:
+            # Cooling down again after a later failure: that cooldown has its own timer
+            return
+        cooldown.pop(token_id, None)
+        for listener in self._listeners:
+            listener(token_id)
+
+    def forget(self, token_id: int):
+        """Drop state of a deleted token"""
+        for key in [key for key in self._failures if key[1] == token_id]:
+            del self._failures[key]
+        for cooldown in self._cooldown.values():
+            cooldown.pop(token_id, None)
+
+    def get_stats(self) -> dict:
+        """Tier-restricted models and tokens cooling down per model"""
+        now = time.time()
+        return {
+            "tier_restricted": {model: list(tiers) for model, tiers in self._tiers.items() if tiers},
+            "cooldown": {
+                model: len([until for until in cooldown.values() if until > now])
+                for model, cooldown in self._cooldown.items()
+                if any(until > now for until in cooldown.values())
+            }
+        }
@@ -0,0 +1,232 @@
+"""Pre-provisioned Flow project pool for Flow2API"""
+import asyncio
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Optional
+from ..core.models import Project
+from ..core.logger import debug_logger
+from .token_registry import TokenRuntime
+
+
+class ProjectProvisioner:
+    """Keeps a warm pool of pre-created Flow projects per token
+
+    Every active token gets up to `pool_size` spare projects, created in the
+    background (at most `max_parallel` create_project calls at a time) and
+    stored in the projects table. Generations run in the token's current
+    project; once it has started `max_generations` generations it is retired
+    (projects.is_active = 0, the Flow project itself is kept) and the token
+    rotates to a spare one. The request path therefore only calls
+    create_project when a token's pool is empty.
+
+    Generation counters are kept in memory and written in one batch per
+    pass, like the token statistics.
+    """
+
+    def __init__(
+        self,
+        token_manager,
+        pool_size: int = 2,
+        max_generations: int = 200,
+        max_parallel: int = 4,
+        interval_seconds: int = 60
+    ):
+        self.token_manager = token_manager
+        self.pool_size = max(pool_size, 0)
+        self.max_generations = max(max_generations, 1)
+        self.max_parallel = max(max_parallel, 1)
+        self.interval_seconds = max(interval_seconds, 1)
+
+        self._pool: Dict[int, Deque[Project]] = {}  # token_id -> spare projects, oldest first
+        self._generations: Dict[str, int] = {}  # project_id -> generations started
+        self._pending: Dict[str, int] = {}  # project_id -> generations not yet written
+        self._rotation_locks: Dict[int, asyncio.Lock] = {}
+        self._retry_at: Dict[int, float] = {}  # token_id -> no top-up before (after a failure)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters
+        self.provisioned = 0
+        self.rotated = 0
+        self.cold_creates = 0
+
+        token_manager.registry.add_listener(self._on_token_changed)
+
+    # ========== Pool state ==========
+
+    async def load(self):
+        """Load spare projects and generation counters from the database"""
+        registry = self.token_manager.registry
+        self._pool = {}
+        for project in await self.token_manager.db.get_active_projects():
+            self._generations[project.project_id] = project.generation_count
+            token = registry.get(project.token_id)
+            if token and token.current_project_id != project.project_id:
+                self._pool.setdefault(project.token_id, deque()).append(project)
+
+    def _needs_top_up(self, token_id: int) -> bool:
+        return len(self._pool.get(token_id, ())) < self.pool_size
+
+    def _on_token_changed(self, token_id: int, runtime: Optional[TokenRuntime]):
+        """Registry listener"""
+        if runtime is None:
+            self._pool.pop(token_id, None)
+            self._rotation_locks.pop(token_id, None)
+        elif (runtime.is_active and self._needs_top_up(token_id)
+              and self._retry_at.get(token_id, 0) <= time.time()):
+            self._wakeup.set()
+
+    def get_stats(self) -> dict:
+        """Get pool counters"""
+        return {
+            "spare_projects": sum(len(pool) for pool in self._pool.values()),
+            "provisioned": self.provisioned,
+            "rotated": self.rotated,
+            "cold_creates": self.cold_creates
+        }
+
+    # ========== Request path ==========
+
+    def _record_generation(self, project_id: str):
+        self._generations[project_id] = self._generations.get(project_id, 0) + 1
+        self._pending[project_id] = self._pending.get(project_id, 0) + 1
+
+    def _usable(self, project_id: Optional[str]) -> bool:
+        return bool(project_id) and self._generations.get(project_id, 0) < self.max_generations
+
+    async def acquire(self, token_id: int) -> str:
+        """Get the project to run one generation in, rotating if needed
+
+        Returns:
+            project_id
+        """
+        token = self.token_manager.registry.get(token_id)
+        if not token:
+            raise ValueError("Token not found")
+
+        if not self._usable(token.current_project_id):
+            lock = self._rotation_locks.setdefault(token_id, asyncio.Lock())
+            async with lock:
+                token = self.token_manager.registry.get(token_id)
+                if not token:
+                    raise ValueError("Token not found")
+                if not self._usable(token.current_project_id):
+                    await self._rotate(token)
+                    token = self.token_manager.registry.get(token_id)
+
+        self._record_generation(token.current_project_id)
+        return token.current_project_id
+
+    async def _rotate(self, token):
+        pool = self._pool.get(token.id)
+        if pool:
+            project = pool.popleft()
+        else:
+            debug_logger.log_warning(f"[PROJECT_POOL] Token {token.id}: 无可用预建Project,同步创建")
+            project = await self._create_project(token)
+            self.cold_creates += 1
+
+        await self.token_manager._update_token(
+            token.id,
+            current_project_id=project.project_id,
+            current_project_name=project.project_name
+        )
+
+        if token.current_project_id:
+            await self.token_manager.db.retire_project(token.current_project_id)
+            self._generations.pop(token.current_project_id, None)
+            debug_logger.log_info(
+                f"[PROJECT_POOL] Token {token.id}: 轮换Project {token.current_project_id} -> {project.project_id}"
+            )
+        self.rotated += 1
+        self._wakeup.set()
+
+    # ========== Provisioning ==========
+
+    async def _create_project(self, token) -> Project:
+        project_name = datetime.now().strftime("%b %d - %H:%M")
+        try:
+            project_id = await self.token_manager.flow_client.create_project(token.st, project_name)
+        except Exception as e:
+            raise ValueError(f"Failed to create project: {str(e)}")
+
+        project = Project(
+            project_id=project_id,
+            token_id=token.id,
+            project_name=project_name
+        )
+        await self.token_manager.db.add_project(project)
+        self._generations[project_id] = 0
+        return project
+
+    async def _top_up(self, token_id: int):
+        while self._needs_top_up(token_id):
+            token = self.token_manager.registry.get(token_id)
+            if not token or not token.is_active:
+                return
+            try:
+                project = await self._create_project(token)
+            except Exception as e:
+                debug_logger.log_error(f"[PROJECT_POOL] Token {token_id}: {str(e)}")
+                self._retry_at[token_id] = time.time() + self.interval_seconds
+                return
+            if self.token_manager.registry.runtime(token_id) is None:
+                # Token deleted meanwhile
+                await self.token_manager.db.delete_project(project.project_id)
+                return
+            self._pool.setdefault(token_id, deque()).append(project)
+            self.provisioned += 1
+            debug_logger.log_info(f"[PROJECT_POOL] Token {token_id}: 预建Project {project.project_name}")
+
+    async def run_once(self):
+        """Write generation counters and top up every short pool"""
+        if self._pending:
+            counts, self._pending = list(self._pending.items()), {}
+            await self.token_manager.db.add_project_generations(counts)
+
+        now = time.time()
+        token_ids = [
+            rt.id for rt in self.token_manager.get_active_runtime()
+            if self._needs_top_up(rt.id) and self._retry_at.get(rt.id, 0) <= now
+        ]
+        semaphore = asyncio.Semaphore(self.max_parallel)
+
+        async def top_up(token_id: int):
+            async with semaphore:
+                await self._top_up(token_id)
+
+        await asyncio.gather(*(top_up(token_id) for token_id in token_ids))
+
+    async def _provision_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.run_once()
+            except Exception as e:
+                debug_logger.log_error(f"[PROJECT_POOL] Provisioning pass failed: {e}")
+
+    async def start(self):
+        """Load the pool and start background provisioning"""
+        if self._task is None:
+            await self.load()
+            self._wakeup.set()
+            self._task = asyncio.create_task(self._provision_loop())
+
+    async def stop(self):
+        """Stop background provisioning and write pending generation counters"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._pending:
+            counts, self._pending = list(self._pending.items()), {}
+            await self.token_manager.db.add_project_generations(counts)
@@ -10,9 +10,9 @@ class ProxyManager:
         self.db = db
 
     async def get_proxy_url(self) -> Optional[str]:
-        """Get proxy URL if enabled, otherwise return None"""
-        config = await self.db.get_proxy_config()
-        if config and config.enabled and config.proxy_url:
+        """Get proxy URL if enabled, otherwise return None (reads the config snapshot)"""
+        config = (await self.db.get_config_snapshot()).proxy
+        if config.enabled and config.proxy_url:
             return config.proxy_url
         return None
 
@@ -21,5 +21,5 @@ class ProxyManager:
         await self.db.update_proxy_config(enabled, proxy_url)
 
     async def get_proxy_config(self) -> ProxyConfig:
-        """Get proxy configuration"""
-        return await self.db.get_proxy_config()
+        """Get proxy configuration (from the config snapshot)"""
+        return (await self.db.get_config_snapshot()).proxy
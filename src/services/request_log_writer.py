@@ -0,0 +1,131 @@
+"""Asynchronous batched request log writer for Flow2API"""
+import asyncio
+from datetime import datetime, timezone
+from typing import List, Optional
+from ..core.database import Database
+from ..core.models import RequestLog
+from ..core.logger import debug_logger
+
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_BLOCK = "block"
+
+
+class RequestLogWriter:
+    """Bounded in-memory queue of request logs drained by a background task
+
+    submit() only enqueues; the writer task takes everything queued (up to
+    `batch_size`) and inserts it with one executemany in one transaction.
+    When the queue is full the overflow policy decides what happens:
+    - drop_oldest: evict the oldest queued log (counted in `dropped`)
+    - block: wait for the writer to make room
+
+    Until start() is called (and after stop()) logs are written immediately.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        max_queue_size: int = 10000,
+        batch_size: int = 200,
+        overflow_policy: str = OVERFLOW_DROP_OLDEST
+    ):
+        if overflow_policy not in (OVERFLOW_DROP_OLDEST, OVERFLOW_BLOCK):
+            raise ValueError(f"Unknown request log overflow policy: {overflow_policy}")
+
+        self.db = db
+        self.batch_size = max(batch_size, 1)
+        self.overflow_policy = overflow_policy
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(max_queue_size, 1))
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Counters
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def get_stats(self) -> dict:
+        """Get queue counters"""
+        return {
+            "queued": self._queue.qsize(),
+            "max_queue_size": self._queue.maxsize,
+            "overflow_policy": self.overflow_policy,
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed
+        }
+
+    async def submit(self, log: RequestLog):
+        """Queue a request log for writing"""
+        if log.created_at is None:
+            # Stamp at submit time so queueing delay does not skew the log time
+            log.created_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        self.submitted += 1
+
+        if not self.running or self._stopping:
+            await self._write_batch([log])
+            return
+
+        if self.overflow_policy == OVERFLOW_BLOCK:
+            await self._queue.put(log)
+            return
+
+        if self._queue.full():
+            try:
+                self._queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self._queue.put_nowait(log)
+
+    async def _write_batch(self, batch: List[RequestLog]):
+        try:
+            await self.db.add_request_logs(batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            debug_logger.log_error(f"[REQUEST_LOG] Failed to write {len(batch)} request logs: {e}")
+
+    async def _writer_loop(self):
+        stopping = False
+        while not stopping:
+            log = await self._queue.get()
+            if log is None:
+                break
+
+            batch = [log]
+            while len(batch) < self.batch_size:
+                try:
+                    log = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if log is None:
+                    stopping = True
+                    break
+                batch.append(log)
+
+            await self._write_batch(batch)
+
+    async def start(self):
+        """Start the background writer task"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._writer_loop())
+
+    async def stop(self):
+        """Write everything still queued and stop the writer task"""
+        if self._task is not None:
+            # The sentinel is queued behind pending logs, so they are all written first.
+            # Logs submitted from now on bypass the queue and cannot evict it.
+            self._stopping = True
+            await self._queue.put(None)
+            await self._task
+            self._task = None
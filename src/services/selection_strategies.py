@@ -0,0 +1,171 @@
+"""Token selection strategies for Flow2API"""
+import random
+from typing import Dict, Optional
+from .token_pools import TokenPools
+from .token_registry import TokenRegistry
+
+
+class TokenLoadTracker:
+    """Outstanding requests and latency EWMA per token
+
+    The load balancer reports every generation it hands out (started) and
+    its end (finished). Only successful generations update the latency
+    EWMA, so a token failing fast does not look fast.
+    """
+
+    def __init__(self, alpha: float = 0.3, default_latency: float = 30.0):
+        self.alpha = alpha
+        self.default_latency = default_latency
+        self.outstanding: Dict[int, int] = {}
+        self.ewma_latency: Dict[int, float] = {}
+
+    def started(self, token_id: int):
+        self.outstanding[token_id] = self.outstanding.get(token_id, 0) + 1
+
+    def finished(self, token_id: int, latency: float, success: bool = True):
+        remaining = self.outstanding.get(token_id, 0) - 1
+        if remaining > 0:
+            self.outstanding[token_id] = remaining
+        else:
+            self.outstanding.pop(token_id, None)
+
+        if success:
+            previous = self.ewma_latency.get(token_id)
+            self.ewma_latency[token_id] = (
+                latency if previous is None else self.alpha * latency + (1 - self.alpha) * previous
+            )
+
+    def latency(self, token_id: int) -> float:
+        """Latency EWMA, or the default for tokens without samples yet"""
+        return self.ewma_latency.get(token_id, self.default_latency)
+
+    def mean_latency(self) -> float:
+        """Mean latency EWMA over all tokens with samples"""
+        if not self.ewma_latency:
+            return self.default_latency
+        return sum(self.ewma_latency.values()) / len(self.ewma_latency)
+
+    def forget(self, token_id: int):
+        self.outstanding.pop(token_id, None)
+        self.ewma_latency.pop(token_id, None)
+
+
+class SelectionStrategy:
+    """Picks one ready token for a request
+
+    Strategies only choose among the TokenPools ready set; availability
+    (active, enabled, AT, concurrency) is decided by the pools. `tiers`
+    and `exclude` narrow it further for model routing.
+    """
+
+    name = ""
+
+    def choose(
+        self,
+        pools: TokenPools,
+        kind: str,
+        load: TokenLoadTracker,
+        registry: TokenRegistry,
+        tiers=None,
+        exclude=None,
+        rng=random
+    ) -> Optional[int]:
+        raise NotImplementedError
+
+
+class RandomStrategy(SelectionStrategy):
+    """Uniform random choice (O(1))"""
+
+    name = "random"
+
+    def choose(self, pools, kind, load, registry, tiers=None, exclude=None, rng=random):
+        return pools.choose(kind, tiers, rng=rng, exclude=exclude)
+
+
+class LeastOutstandingStrategy(SelectionStrategy):
+    """Token with the fewest requests in flight, ties broken at random (O(N))"""
+
+    name = "least_outstanding"
+
+    def choose(self, pools, kind, load, registry, tiers=None, exclude=None, rng=random):
+        best = None
+        best_count = None
+        ties = 0
+        for token_id in pools.ready_ids(kind, tiers, exclude):
+            count = load.outstanding.get(token_id, 0)
+            if best_count is None or count < best_count:
+                best, best_count, ties = token_id, count, 1
+            elif count == best_count:
+                # Reservoir sampling over the tied tokens
+                ties += 1
+                if rng.randrange(ties) == 0:
+                    best = token_id
+        return best
+
+
+class CreditsWeightedStrategy(SelectionStrategy):
+    """Random choice weighted by remaining credits; uniform if no candidate has any (O(N))"""
+
+    name = "credits_weighted"
+
+    def choose(self, pools, kind, load, registry, tiers=None, exclude=None, rng=random):
+        ids = pools.ready_ids(kind, tiers, exclude)
+        if not ids:
+            return None
+        weights = []
+        for token_id in ids:
+            runtime = registry.runtime(token_id)
+            weights.append(max(runtime.credits or 0, 0) if runtime else 0)
+        if not any(weights):
+            # Every candidate is out of credits: uniform choice
+            return rng.choice(ids)
+        return rng.choices(ids, weights=weights)[0]
+
+
+class EwmaLatencyStrategy(SelectionStrategy):
+    """Random choice weighted by expected speed: 1 / (latency EWMA * (outstanding + 1)) (O(N))"""
+
+    name = "ewma_latency"
+
+    def choose(self, pools, kind, load, registry, tiers=None, exclude=None, rng=random):
+        ids = pools.ready_ids(kind, tiers, exclude)
+        if not ids:
+            return None
+        weights = [
+            1.0 / (max(load.latency(token_id), 0.001) * (load.outstanding.get(token_id, 0) + 1))
+            for token_id in ids
+        ]
+        return rng.choices(ids, weights=weights)[0]
+
+
+class PowerOfTwoChoicesStrategy(SelectionStrategy):
+    """Two random ready tokens, the less loaded one wins (O(1))
+
+    Load is the expected wait: latency EWMA * (outstanding + 1).
+    """
+
+    name = "p2c"
+
+    def choose(self, pools, kind, load, registry, tiers=None, exclude=None, rng=random):
+        first = pools.choose(kind, tiers, rng=rng, exclude=exclude)
+        if first is None:
+            return None
+        second = pools.choose(kind, tiers, rng=rng, exclude=exclude)
+
+        def cost(token_id: int) -> float:
+            return load.latency(token_id) * (load.outstanding.get(token_id, 0) + 1)
+
+        return second if cost(second) < cost(first) else first
+
+
+STRATEGIES: Dict[str, SelectionStrategy] = {
+    strategy.name: strategy
+    for strategy in (
+        RandomStrategy(),
+        LeastOutstandingStrategy(),
+        CreditsWeightedStrategy(),
+        EwmaLatencyStrategy(),
+        PowerOfTwoChoicesStrategy(),
+    )
+}
+DEFAULT_STRATEGY = RandomStrategy.name
@@ -0,0 +1,155 @@
+"""Write-behind token usage statistics for Flow2API"""
+import asyncio
+from datetime import datetime
+from typing import Dict, Optional
+from ..core.database import Database
+from ..core.logger import debug_logger
+
+
+class PendingTokenStats:
+    """Counters accumulated for one token since the last flush"""
+
+    __slots__ = (
+        "image", "video", "error", "use_count",
+        "consecutive_reset", "consecutive_errors", "last_used_at"
+    )
+
+    def __init__(self):
+        self.image = 0
+        self.video = 0
+        self.error = 0
+        self.use_count = 0
+        # True once a success was seen: the stored consecutive count is
+        # replaced by consecutive_errors instead of being incremented
+        self.consecutive_reset = False
+        self.consecutive_errors = 0
+        self.last_used_at: Optional[datetime] = None
+
+    def merge(self, newer: "PendingTokenStats"):
+        """Fold counters recorded after this batch into it (used to requeue a failed flush)"""
+        self.image += newer.image
+        self.video += newer.video
+        self.error += newer.error
+        self.use_count += newer.use_count
+        if newer.consecutive_reset:
+            self.consecutive_reset = True
+            self.consecutive_errors = newer.consecutive_errors
+        else:
+            self.consecutive_errors += newer.consecutive_errors
+        if newer.last_used_at:
+            self.last_used_at = newer.last_used_at
+
+
+class StatsAggregator:
+    """Accumulates per-token counters in memory and flushes them in batches
+
+    Counters are flushed in a single transaction every `flush_interval_ms`
+    milliseconds, or earlier once `flush_max_events` events are pending.
+    Until start() is called (and after stop()) every event is flushed
+    immediately, so the aggregator is safe to use without a running loop.
+    """
+
+    def __init__(self, db: Database, flush_interval_ms: int = 1000, flush_max_events: int = 100):
+        self.db = db
+        self.flush_interval = max(flush_interval_ms, 1) / 1000
+        self.flush_max_events = max(flush_max_events, 1)
+
+        self._pending: Dict[int, PendingTokenStats] = {}
+        self._pending_events = 0
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def _entry(self, token_id: int) -> PendingTokenStats:
+        entry = self._pending.get(token_id)
+        if entry is None:
+            entry = self._pending[token_id] = PendingTokenStats()
+        return entry
+
+    async def _event_recorded(self):
+        self._pending_events += 1
+        if not self.running:
+            await self.flush()
+        elif self._pending_events >= self.flush_max_events:
+            self._wakeup.set()
+
+    # ========== Events ==========
+
+    async def record_usage(self, token_id: int, is_video: bool = False, used_at: Optional[datetime] = None):
+        """Record a finished generation"""
+        entry = self._entry(token_id)
+        if is_video:
+            entry.video += 1
+        else:
+            entry.image += 1
+        entry.use_count += 1
+        entry.last_used_at = used_at or datetime.now()
+        await self._event_recorded()
+
+    async def record_success(self, token_id: int):
+        """Record a successful request (resets the consecutive error count)"""
+        entry = self._entry(token_id)
+        entry.consecutive_reset = True
+        entry.consecutive_errors = 0
+        await self._event_recorded()
+
+    async def record_error(self, token_id: int):
+        """Record a failed request"""
+        entry = self._entry(token_id)
+        entry.error += 1
+        entry.consecutive_errors += 1
+        await self._event_recorded()
+
+    # ========== Flushing ==========
+
+    async def flush(self):
+        """Write all pending counters in one transaction"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            batch = self._pending
+            self._pending = {}
+            self._pending_events = 0
+
+            try:
+                await self.db.apply_token_stats(batch)
+            except Exception as e:
+                debug_logger.log_error(f"[STATS] Failed to flush stats for {len(batch)} tokens: {e}")
+                # Requeue so the counters are retried on the next flush
+                for token_id, newer in self._pending.items():
+                    if token_id in batch:
+                        batch[token_id].merge(newer)
+                    else:
+                        batch[token_id] = newer
+                self._pending = batch
+
+    async def _flush_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def start(self):
+        """Start the background flush loop"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the flush loop and flush remaining counters"""
+        if self._task is not None:
+            # Let the loop finish its current flush instead of cancelling it mid-transaction
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
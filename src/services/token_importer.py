@@ -0,0 +1,224 @@
+"""Bulk token import pipeline for Flow2API"""
+import asyncio
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional
+from ..core.models import Token, Project
+from ..core.logger import debug_logger
+
+
+class _ImportItem:
+    """Upstream results for one import item"""
+
+    def __init__(self, index: int, item):
+        self.index = index
+        self.item = item
+        self.email: Optional[str] = None
+        self.name: str = ""
+        self.at: Optional[str] = None
+        self.at_expires: Optional[datetime] = None
+        self.is_expired = False
+        self.existing_id: Optional[int] = None
+        self.credits = 0
+        self.user_paygate_tier: Optional[str] = None
+        self.project_id: Optional[str] = None
+        self.project_name: Optional[str] = None
+        self.error: Optional[str] = None
+
+
+class TokenImporter:
+    """Imports many session tokens with bounded upstream concurrency
+
+    Items are processed in two phases:
+    1. Upstream (concurrent, at most `max_parallel` items at a time): ST to AT
+       for every item; for emails that are not registered yet, also credits
+       and project creation. Existing tokens are found through the registry
+       email index.
+    2. Write: all inserts and updates in one database transaction, then the
+       registry is updated.
+
+    Items sharing an email are applied in input order, like a sequential
+    import: the first one adds (or updates) the token, later ones update it.
+
+    run() yields progress events for streaming:
+    - {"type": "item", "index", "email", "status": "ready" | "error", "message"}
+      as each item finishes phase 1 (completion order)
+    - {"type": "done", "added", "updated", "errors", "message"} at the end
+    """
+
+    def __init__(self, token_manager, max_parallel: int = 8):
+        self.token_manager = token_manager
+        self.max_parallel = max(max_parallel, 1)
+
+    async def run(self, items: list) -> AsyncIterator[dict]:
+        """Import ImportTokenItem-like objects, yielding progress events"""
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        # email -> item that creates the token (claimed without awaiting in between)
+        creators: Dict[str, _ImportItem] = {}
+        results = [_ImportItem(idx, item) for idx, item in enumerate(items)]
+
+        async def process(entry: _ImportItem) -> _ImportItem:
+            async with semaphore:
+                try:
+                    await self._resolve(entry, creators)
+                except Exception as e:
+                    entry.error = str(e)
+            return entry
+
+        total = len(results)
+        tasks = [asyncio.create_task(process(entry)) for entry in results]
+        try:
+            for done_count, next_done in enumerate(asyncio.as_completed(tasks), 1):
+                entry = await next_done
+                yield {
+                    "type": "item",
+                    "index": entry.index,
+                    "email": entry.email,
+                    "status": "error" if entry.error else "ready",
+                    "message": entry.error,
+                    "completed": done_count,
+                    "total": total
+                }
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        yield await self._write(results)
+
+    async def _resolve(self, entry: _ImportItem, creators: Dict[str, _ImportItem]):
+        st = entry.item.session_token
+        if not st:
+            raise ValueError("Missing session_token")
+
+        flow_client = self.token_manager.flow_client
+        result = await flow_client.st_to_at(st)
+        entry.at = result["access_token"]
+        user_info = result.get("user", {})
+        entry.email = user_info.get("email")
+        if not entry.email:
+            raise ValueError("Cannot get email info")
+        entry.name = user_info.get("name", entry.email.split("@")[0])
+
+        expires = result.get("expires")
+        if expires:
+            try:
+                entry.at_expires = datetime.fromisoformat(expires.replace('Z', '+00:00'))
+                entry.is_expired = entry.at_expires <= datetime.now(timezone.utc)
+            except:
+                pass
+
+        existing = self.token_manager.registry.get_by_email(entry.email)
+        if existing:
+            entry.existing_id = existing.id
+            return
+        if entry.email in creators:
+            return  # Another item of this batch creates the token
+        creators[entry.email] = entry
+
+        try:
+            credits_result = await flow_client.get_credits(entry.at)
+            entry.credits = credits_result.get("credits", 0)
+            entry.user_paygate_tier = credits_result.get("userPaygateTier")
+        except:
+            pass
+
+        entry.project_name = datetime.now().strftime("%b %d - %H:%M")
+        try:
+            entry.project_id = await flow_client.create_project(st, entry.project_name)
+        except Exception as e:
+            # Let a later item with the same email create the token instead
+            del creators[entry.email]
+            raise ValueError(f"Create project失败: {str(e)}")
+
+    @staticmethod
+    def _item_fields(entry: _ImportItem) -> dict:
+        item = entry.item
+        fields = {
+            "st": item.session_token,
+            "at": entry.at,
+            "at_expires": entry.at_expires,
+            "image_enabled": item.image_enabled,
+            "video_enabled": item.video_enabled,
+            "image_concurrency": item.image_concurrency,
+            "video_concurrency": item.video_concurrency
+        }
+        if entry.is_expired:
+            fields["is_active"] = False
+        return fields
+
+    async def _write(self, results: List[_ImportItem]) -> dict:
+        failed = [(e.index, e.error) for e in results if e.error]
+        ok = [e for e in results if not e.error]
+
+        # Group by email, input order; creators are only needed when no token exists
+        groups: Dict[str, List[_ImportItem]] = {}
+        for entry in ok:
+            groups.setdefault(entry.email, []).append(entry)
+
+        new_tokens = []
+        updates = []
+        added = updated = 0
+        for email, group in groups.items():
+            existing_id = next((e.existing_id for e in group if e.existing_id), None)
+            if existing_id is None:
+                registered = self.token_manager.registry.get_by_email(email)
+                existing_id = registered.id if registered else None
+
+            if existing_id is not None:
+                updates.extend((existing_id, self._item_fields(e)) for e in group)
+                updated += len(group)
+                continue
+
+            creator = next((e for e in group if e.project_id), None)
+            if creator is None:
+                failed.extend((e.index, "Token was not created") for e in group)
+                continue
+
+            # Later items of the group override the creator's item fields
+            fields = {}
+            for entry in group:
+                fields.update(self._item_fields(entry))
+            token = Token(
+                email=email,
+                name=creator.name,
+                is_active=fields.pop("is_active", True),
+                credits=creator.credits,
+                user_paygate_tier=creator.user_paygate_tier,
+                current_project_id=creator.project_id,
+                current_project_name=creator.project_name,
+                **fields
+            )
+            project = Project(
+                project_id=creator.project_id,
+                token_id=0,
+                project_name=creator.project_name,
+                tool_name="PINHOLE"
+            )
+            new_tokens.append((token, project))
+            added += 1
+            updated += len(group) - 1
+
+        try:
+            token_ids = await self.token_manager.db.import_tokens(new_tokens, updates)
+        except Exception as e:
+            debug_logger.log_error(f"[TOKEN_IMPORT] Write failed: {e}")
+            failed.extend((entry.index, str(e)) for entry in ok)
+            added = updated = 0
+        else:
+            registry = self.token_manager.registry
+            for token in await self.token_manager.db.get_tokens_by_ids(token_ids):
+                registry.put(token)
+            for token_id, fields in updates:
+                registry.update(token_id, **fields)
+
+        errors = [f"第{index+1}项: {message}" for index, message in sorted(failed)]
+        debug_logger.log_info(
+            f"[TOKEN_IMPORT] 导入完成: added {added}, updated {updated}, failed {len(errors)}"
+        )
+        return {
+            "type": "done",
+            "success": True,
+            "added": added,
+            "updated": updated,
+            "errors": errors if errors else None,
+            "message": f"Import completed: added {added} items, updated {updated} 个" + (f", {len(errors)} items failed" if errors else "")
+        }
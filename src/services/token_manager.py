@@ -1,50 +1,100 @@
 """Token manager for Flow2API with AT auto-refresh"""
 import asyncio
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List
+from typing import Dict, Optional, List, Set, Tuple
 from ..core.database import Database
 from ..core.models import Token, Project
 from ..core.logger import debug_logger
 from .flow_client import FlowClient
 from .proxy_manager import ProxyManager
+from .token_registry import TokenRegistry, TokenRuntime
+from .stats_aggregator import StatsAggregator
 
 
+# Ban reasons (Token.ban_reason); auto-unban durations are configured per reason
+BAN_RATE_LIMIT = "429_rate_limit"
+BAN_ERROR_THRESHOLD = "error_threshold"
+
 class TokenManager:
     """Token lifecycle manager with AT auto-refresh"""
 
-    def __init__(self, db: Database, flow_client: FlowClient):
+    def __init__(
+        self,
+        db: Database,
+        flow_client: FlowClient,
+        stats: Optional[StatsAggregator] = None,
+        max_refresh_parallel: int = 8
+    ):
         self.db = db
         self.flow_client = flow_client
-        self._lock = asyncio.Lock()
+        self.registry = TokenRegistry()
+        self.stats = stats or StatsAggregator(db)
+        # Set when a ProjectProvisioner manages projects (see ensure_project_exists)
+        self.project_provisioner = None
+        # Set when TokenCircuitBreakers isolate failing tokens (see record_error)
+        self.circuit_breakers = None
+        self._ban_tasks: Set[asyncio.Task] = set()
+        # AT refresh: one in-flight refresh per token, bounded across tokens
+        self._refreshing: Dict[int, asyncio.Future] = {}
+        self._refresh_semaphore = asyncio.Semaphore(max(max_refresh_parallel, 1))
+
+    async def load_tokens(self):
+        """Load all tokens into the in-memory registry (called at startup)"""
+        await self.registry.load(self.db)
+
+    async def _update_token(self, token_id: int, **fields):
+        """Write token fields through to the database and the registry"""
+        await self.db.update_token(token_id, **fields)
+        self.registry.update(token_id, **fields)
 
     # ========== Token CRUD ==========
 
     async def get_all_tokens(self) -> List[Token]:
         """Get all tokens"""
-        return await self.db.get_all_tokens()
+        return self.registry.all()
 
     async def get_active_tokens(self) -> List[Token]:
         """Get all active tokens"""
-        return await self.db.get_active_tokens()
+        return self.registry.active()
+
+    def get_active_runtime(self) -> List[TokenRuntime]:
+        """Get scheduling records of all active tokens (no Token models are built)"""
+        return self.registry.active_runtime()
 
     async def get_token(self, token_id: int) -> Optional[Token]:
         """Get token by ID"""
-        return await self.db.get_token(token_id)
+        return self.registry.get(token_id)
+
+    async def get_token_by_email(self, email: str) -> Optional[Token]:
+        """Get token by email"""
+        return self.registry.get_by_email(email)
 
     async def delete_token(self, token_id: int):
         """Delete token"""
         await self.db.delete_token(token_id)
+        self.registry.remove(token_id)
 
     async def enable_token(self, token_id: int):
         """Enable a token and reset error count"""
         # Enable the token
-        await self.db.update_token(token_id, is_active=True)
+        await self._update_token(token_id, is_active=True)
+        await self._clear_ban(token_id)
         # Reset error count when enabling (only reset total error_count, keep today_error_count)
         await self.db.reset_error_count(token_id)
+        if self.circuit_breakers is not None:
+            self.circuit_breakers.reset(token_id)
 
     async def disable_token(self, token_id: int):
-        """Disable a token"""
-        await self.db.update_token(token_id, is_active=False)
+        """Disable a token (no ban: it stays disabled until enabled again)"""
+        await self._clear_ban(token_id)
+        await self._update_token(token_id, is_active=False)
+
+    async def _clear_ban(self, token_id: int):
+        """Clear ban_reason / banned_at (update_token skips None values)"""
+        token = self.registry.get(token_id)
+        if token and (token.ban_reason or token.banned_at):
+            await self.db.clear_token_ban(token_id)
+            self.registry.clear(token_id, "ban_reason", "banned_at")
 
     # ========== Token添加 (支持Project创建) ==========
 
@@ -75,7 +125,7 @@ class TokenManager:
             Token object
         """
         # Step 1: 检查ST是否已存在
-        existing_token = await self.db.get_token_by_st(st)
+        existing_token = self.registry.get_by_st(st)
         if existing_token:
             raise ValueError(f"Token 已存在（邮箱: {existing_token.email}）")
 
@@ -117,6 +167,9 @@ class TokenManager:
                 # 如果没有提供project_name,生成一个
                 now = datetime.now()
                 project_name = now.strftime("%b %d - %H:%M")
+        elif self.project_provisioner is not None:
+            # The provisioner creates this token's projects in the background
+            project_name = None
         else:
             # 用户没有提供project_id,需要创建新项目
             if not project_name:
@@ -153,14 +206,18 @@ class TokenManager:
         token_id = await self.db.add_token(token)
         token.id = token_id
 
+        # Register the stored row (includes DB defaults such as created_at)
+        self.registry.put(await self.db.get_token(token_id))
+
         # Step 7: 保存Project到数据库
-        project = Project(
-            project_id=project_id,
-            token_id=token_id,
-            project_name=project_name,
-            tool_name="PINHOLE"
-        )
-        await self.db.add_project(project)
+        if project_id:
+            project = Project(
+                project_id=project_id,
+                token_id=token_id,
+                project_name=project_name,
+                tool_name="PINHOLE"
+            )
+            await self.db.add_project(project)
 
         debug_logger.log_info(f"[ADD_TOKEN] Token added successfully (ID: {token_id}, Email: {email})")
         return token
@@ -207,8 +264,9 @@ class TokenManager:
             update_fields["video_concurrency"] = video_concurrency
 
         # 检查token是否因429被禁用，如果是且未过期，则清空429状态
-        token = await self.db.get_token(token_id)
-        if token and token.ban_reason == "429_rate_limit":
+        clear_ban = False
+        token = self.registry.get(token_id)
+        if token and token.ban_reason == BAN_RATE_LIMIT:
             # 检查token是否过期
             is_expired = False
             if token.at_expires:
@@ -222,11 +280,12 @@ class TokenManager:
             # 如果未过期，清空429禁用状态
             if not is_expired:
                 debug_logger.log_info(f"[UPDATE_TOKEN] Token {token_id} 编辑保存，清空429禁用状态")
-                update_fields["ban_reason"] = None
-                update_fields["banned_at"] = None
+                clear_ban = True
 
         if update_fields:
-            await self.db.update_token(token_id, **update_fields)
+            await self._update_token(token_id, **update_fields)
+        if clear_ban:
+            await self._clear_ban(token_id)
 
     # ========== AT自动刷新逻辑 (核心) ==========
 
@@ -237,7 +296,7 @@ class TokenManager:
             True if AT is valid or refreshed successfully
             False if AT cannot be refreshed
         """
-        token = await self.db.get_token(token_id)
+        token = self.registry.get(token_id)
         if not token:
             return False
 
@@ -268,14 +327,41 @@ class TokenManager:
         # AT有效
         return True
 
+    async def refresh_at(self, token_id: int) -> bool:
+        """Refresh AT now (admin endpoint and background refresh scheduler)
+
+        Returns:
+            True if refresh successful, False otherwise
+        """
+        return await self._refresh_at(token_id)
+
     async def _refresh_at(self, token_id: int) -> bool:
-        """内部方法: Refresh AT
+        """内部方法: Refresh AT (single-flight per token)
+
+        Concurrent callers for the same token await one shared refresh, so
+        each burst costs a single st_to_at call. Different tokens refresh in
+        parallel, up to max_refresh_parallel at a time.
 
         Returns:
             True if refresh successful, False otherwise
         """
-        async with self._lock:
-            token = await self.db.get_token(token_id)
+        future = self._refreshing.get(token_id)
+        if future is None:
+            future = asyncio.ensure_future(self._do_refresh_at(token_id))
+            self._refreshing[token_id] = future
+
+            def _done(f: asyncio.Future):
+                if self._refreshing.get(token_id) is f:
+                    del self._refreshing[token_id]
+
+            future.add_done_callback(_done)
+
+        # Shielded: a cancelled caller must not cancel the refresh others await
+        return await asyncio.shield(future)
+
+    async def _do_refresh_at(self, token_id: int) -> bool:
+        async with self._refresh_semaphore:
+            token = self.registry.get(token_id)
             if not token:
                 return False
 
@@ -296,7 +382,7 @@ class TokenManager:
                         pass
 
                 # 更新数据库
-                await self.db.update_token(
+                await self._update_token(
                     token_id,
                     at=new_at,
                     at_expires=new_at_expires
@@ -308,7 +394,7 @@ class TokenManager:
                 # 同时刷新credits
                 try:
                     credits_result = await self.flow_client.get_credits(new_at)
-                    await self.db.update_token(
+                    await self._update_token(
                         token_id,
                         credits=credits_result.get("credits", 0)
                     )
@@ -326,10 +412,16 @@ class TokenManager:
     async def ensure_project_exists(self, token_id: int) -> str:
         """确保Token有可用的Project
 
+        With a ProjectProvisioner the project comes from the token's warm
+        pool (and is rotated once it has grown large).
+
         Returns:
             project_id
         """
-        token = await self.db.get_token(token_id)
+        if self.project_provisioner is not None:
+            return await self.project_provisioner.acquire(token_id)
+
+        token = self.registry.get(token_id)
         if not token:
             raise ValueError("Token not found")
 
@@ -346,7 +438,7 @@ class TokenManager:
             debug_logger.log_info(f"[PROJECT] Created project for token {token_id}: {project_name}")
 
             # 更新Token
-            await self.db.update_token(
+            await self._update_token(
                 token_id,
                 current_project_id=project_id,
                 current_project_name=project_name
@@ -368,28 +460,39 @@ class TokenManager:
     # ========== Token使用统计 ==========
 
     async def record_usage(self, token_id: int, is_video: bool = False):
-        """Record token usage"""
-        await self.db.update_token(token_id, use_count=1, last_used_at=datetime.now())
+        """Record token usage
 
-        if is_video:
-            await self.db.increment_token_stats(token_id, "video")
-        else:
-            await self.db.increment_token_stats(token_id, "image")
+        The registry is updated immediately; database counters are written
+        behind by the stats aggregator.
+        """
+        now = datetime.now()
+        # Counters only: no listener (pools, limits, routing) needs to hear about it
+        self.registry.add_usage(token_id, now)
+
+        await self.stats.record_usage(token_id, is_video=is_video, used_at=now)
 
     async def record_error(self, token_id: int):
-        """Record token error and auto-disable if threshold reached"""
-        await self.db.increment_token_stats(token_id, "error")
+        """Record token error and auto-disable if threshold reached
+
+        With circuit breakers the token is isolated in memory instead; it is
+        banned only when its half-open probes keep failing (on_give_up).
+        """
+        await self.stats.record_error(token_id)
+        if self.circuit_breakers is not None:
+            return
+        # The ban check below needs the exact consecutive count, so write errors through
+        await self.stats.flush()
 
         # Check if should auto-disable token (based on consecutive errors)
         stats = await self.db.get_token_stats(token_id)
-        admin_config = await self.db.get_admin_config()
+        admin_config = (await self.db.get_config_snapshot()).admin
 
         if stats and stats.consecutive_error_count >= admin_config.error_ban_threshold:
             debug_logger.log_warning(
                 f"[TOKEN_BAN] Token {token_id} consecutive error count ({stats.consecutive_error_count}) "
                 f"reached threshold ({admin_config.error_ban_threshold}), auto-disabling"
             )
-            await self.disable_token(token_id)
+            await self.ban_token(token_id, BAN_ERROR_THRESHOLD)
 
     async def record_success(self, token_id: int):
         """Record successful request (reset consecutive error count)
@@ -397,82 +500,51 @@ class TokenManager:
         This method resets error_count to 0, which is used for auto-disable threshold checking.
         Note: today_error_count and historical statistics are NOT reset.
         """
-        await self.db.reset_error_count(token_id)
+        await self.stats.record_success(token_id)
 
-    async def ban_token_for_429(self, token_id: int):
-        """因429错误立即禁用token
+    async def ban_token(self, token_id: int, reason: str):
+        """Disable a token with a ban reason
 
-        Args:
-            token_id: Token ID
+        The unban scheduler re-enables it once the duration configured for
+        `reason` has passed since banned_at.
         """
-        debug_logger.log_warning(f"[429_BAN] 禁用Token {token_id} (原因: 429 Rate Limit)")
-        await self.db.update_token(
+        await self._update_token(
             token_id,
             is_active=False,
-            ban_reason="429_rate_limit",
+            ban_reason=reason,
             banned_at=datetime.now(timezone.utc)
         )
 
-    async def auto_unban_429_tokens(self):
-        """Auto re-enable因429被禁用的token
-
-        规则:
-        - 距离禁用时间12小时后Auto re-enable
-        - 仅解禁未过期的token
-        - 仅解禁因429被禁用的token
-        """
-        all_tokens = await self.db.get_all_tokens()
-        now = datetime.now(timezone.utc)
+    def ban_failing_token(self, token_id: int):
+        """Ban a token whose circuit breaker gave up (called from synchronous code)"""
+        task = asyncio.get_running_loop().create_task(self.ban_token(token_id, BAN_ERROR_THRESHOLD))
+        self._ban_tasks.add(task)
+        task.add_done_callback(self._ban_tasks.discard)
 
-        for token in all_tokens:
-            # 跳过非429禁用的token
-            if token.ban_reason != "429_rate_limit":
-                continue
+    async def ban_token_for_429(self, token_id: int):
+        """因429错误立即禁用token
 
-            # 跳过未禁用的token
-            if token.is_active:
-                continue
+        Args:
+            token_id: Token ID
+        """
+        debug_logger.log_warning(f"[429_BAN] 禁用Token {token_id} (原因: 429 Rate Limit)")
+        await self.ban_token(token_id, BAN_RATE_LIMIT)
 
-            # 跳过没有禁用时间的token
-            if not token.banned_at:
-                continue
+    async def unban_token(self, token_id: int):
+        """Re-enable a banned token and reset its error count"""
+        await self.enable_token(token_id)
 
-            # 检查token是否已过期
-            if token.at_expires:
-                # 确保时区一致
-                if token.at_expires.tzinfo is None:
-                    at_expires_aware = token.at_expires.replace(tzinfo=timezone.utc)
-                else:
-                    at_expires_aware = token.at_expires
+    # ========== 余额刷新 ==========
 
-                # 如果已过期，跳过
-                if at_expires_aware <= now:
-                    debug_logger.log_info(f"[AUTO_UNBAN] Token {token.id} 已过期，跳过解禁")
-                    continue
-
-            # 确保banned_at时区一致
-            if token.banned_at.tzinfo is None:
-                banned_at_aware = token.banned_at.replace(tzinfo=timezone.utc)
-            else:
-                banned_at_aware = token.banned_at
-
-            # 检查是否已过12小时
-            time_since_ban = now - banned_at_aware
-            if time_since_ban.total_seconds() >= 12 * 3600:  # 12小时
-                debug_logger.log_info(
-                    f"[AUTO_UNBAN] 解禁Token {token.id} (禁用时间: {banned_at_aware}, "
-                    f"已过 {time_since_ban.total_seconds() / 3600:.1f} 小时)"
-                )
-                await self.db.update_token(
-                    token.id,
-                    is_active=True,
-                    ban_reason=None,
-                    banned_at=None
-                )
-                # 重置错误计数
-                await self.db.reset_error_count(token.id)
+    async def apply_credits(self, updates: List[Tuple[int, int, Optional[str]]]):
+        """Write synced credits for many tokens in one batch
 
-    # ========== 余额刷新 ==========
+        Args:
+            updates: (token_id, credits, user_paygate_tier) tuples
+        """
+        await self.db.update_token_credits(updates)
+        for token_id, credits, user_paygate_tier in updates:
+            self.registry.update(token_id, credits=credits, user_paygate_tier=user_paygate_tier)
 
     async def refresh_credits(self, token_id: int) -> int:
         """刷新Token余额
@@ -480,7 +552,7 @@ class TokenManager:
         Returns:
             credits
         """
-        token = await self.db.get_token(token_id)
+        token = self.registry.get(token_id)
         if not token:
             return 0
 
@@ -489,14 +561,14 @@ class TokenManager:
             return 0
 
         # 重新获取token (AT可能已刷新)
-        token = await self.db.get_token(token_id)
+        token = self.registry.get(token_id)
 
         try:
             result = await self.flow_client.get_credits(token.at)
             credits = result.get("credits", 0)
 
             # 更新数据库
-            await self.db.update_token(token_id, credits=credits)
+            await self._update_token(token_id, credits=credits)
 
             return credits
         except Exception as e:
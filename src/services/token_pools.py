@@ -0,0 +1,260 @@
+"""Capability-indexed token pools for Flow2API"""
+import heapq
+import random
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from .circuit_breaker import TokenCircuitBreakers, STATE_OPEN
+from .token_registry import TokenRegistry, TokenRuntime
+
+
+KIND_IMAGE = "image"
+KIND_VIDEO = "video"
+KIND_ANY = "any"
+KINDS = (KIND_IMAGE, KIND_VIDEO, KIND_ANY)
+
+
+class IndexedSet:
+    """Set with O(1) add, discard and uniform random choice"""
+
+    __slots__ = ("_items", "_index")
+
+    def __init__(self):
+        self._items: List[int] = []
+        self._index: Dict[int, int] = {}
+
+    def add(self, item: int):
+        if item not in self._index:
+            self._index[item] = len(self._items)
+            self._items.append(item)
+
+    def discard(self, item: int):
+        pos = self._index.pop(item, None)
+        if pos is None:
+            return
+        last = self._items.pop()
+        if pos < len(self._items):
+            self._items[pos] = last
+            self._index[last] = pos
+
+    def choice(self, rng=random) -> int:
+        return self._items[rng.randrange(len(self._items))]
+
+    def __getitem__(self, pos: int) -> int:
+        return self._items[pos]
+
+    def __contains__(self, item: int) -> bool:
+        return item in self._index
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+
+class TokenPools:
+    """Live sets of selectable token IDs per (kind, paygate tier)
+
+    A token is ready for a kind when it is active, enabled for that kind
+    (image / video; "any" needs neither), has a free concurrency slot for it
+    and its AT is valid for at least `at_lead_seconds` more. Tokens that
+    only miss the AT condition are kept in a separate stale set per kind,
+    so the balancer can refresh one inline when nothing is ready, and
+    tokens that only miss a free slot in a busy set per kind, so it knows
+    whether waiting for a slot can succeed. With circuit breakers, tokens
+    whose circuit is open are not usable, and half-open tokens with all
+    their probes in flight count as busy.
+
+    Membership is recomputed for one token at a time on events: registry
+    changes (enable, disable, ban, AT refresh, settings), concurrency slot
+    acquire/release and circuit breaker transitions. AT freshness running
+    out is handled by a min-heap of "fresh until" times, drained lazily
+    before each choice.
+    """
+
+    # Random draws before choose() falls back to scanning when tokens are excluded
+    EXCLUDE_SAMPLES = 8
+
+    def __init__(
+        self,
+        registry: TokenRegistry,
+        concurrency_manager=None,
+        at_lead_seconds: float = 3600,
+        breakers: Optional[TokenCircuitBreakers] = None
+    ):
+        self.registry = registry
+        self.concurrency_manager = concurrency_manager
+        self.breakers = breakers
+        self.at_lead_seconds = at_lead_seconds
+
+        self._ready: Dict[Tuple[str, Optional[str]], IndexedSet] = {}  # (kind, tier) -> token ids
+        self._stale: Dict[str, IndexedSet] = {kind: IndexedSet() for kind in KINDS}
+        self._busy: Dict[str, IndexedSet] = {kind: IndexedSet() for kind in KINDS}  # usable, but no free slot
+        self._memberships: Dict[int, Set[Tuple[str, Optional[str]]]] = {}
+        self._fresh_heap: List[Tuple[float, int]] = []  # (fresh until, token_id)
+        self._fresh_until: Dict[int, float] = {}
+
+        registry.add_listener(lambda token_id, runtime: self.update(token_id))
+        if concurrency_manager is not None:
+            concurrency_manager.add_listener(self.update)
+        if breakers is not None:
+            breakers.add_listener(self.update)
+        for runtime in registry.active_runtime():
+            self.update(runtime.id)
+
+    # ========== Membership ==========
+
+    def _has_capacity(self, kind: str, token_id: int) -> bool:
+        if self.concurrency_manager is None or kind == KIND_ANY:
+            return True
+        return self.concurrency_manager.has_capacity(kind, token_id)
+
+    @staticmethod
+    def _enabled(kind: str, runtime: TokenRuntime) -> bool:
+        if kind == KIND_IMAGE:
+            return runtime.image_enabled
+        if kind == KIND_VIDEO:
+            return runtime.video_enabled
+        return True
+
+    def update(self, token_id: int, now: Optional[float] = None):
+        """Recompute the pools a token belongs to"""
+        now = time.time() if now is None else now
+        runtime = self.registry.runtime(token_id)
+        fresh = runtime is not None and runtime.at_fresh(now, self.at_lead_seconds)
+        breakers = self.breakers
+        circuit_open = breakers is not None and breakers.state(token_id) == STATE_OPEN
+        circuit_allows = breakers is None or breakers.is_available(token_id)
+
+        wanted: Set[Tuple[str, Optional[str]]] = set()
+        for kind in KINDS:
+            usable = runtime is not None and runtime.is_active and self._enabled(kind, runtime) and not circuit_open
+            eligible = usable and circuit_allows and self._has_capacity(kind, token_id)
+            if usable and not eligible:
+                self._busy[kind].add(token_id)
+            else:
+                self._busy[kind].discard(token_id)
+            if eligible and fresh:
+                wanted.add((kind, runtime.tier))
+            if eligible and not fresh:
+                self._stale[kind].add(token_id)
+            else:
+                self._stale[kind].discard(token_id)
+
+        current = self._memberships.get(token_id, set())
+        for key in current - wanted:
+            self._ready[key].discard(token_id)
+        for key in wanted - current:
+            self._ready.setdefault(key, IndexedSet()).add(token_id)
+        if wanted:
+            self._memberships[token_id] = wanted
+        else:
+            self._memberships.pop(token_id, None)
+
+        if fresh:
+            fresh_until = runtime.at_expires - self.at_lead_seconds
+            if self._fresh_until.get(token_id) != fresh_until:
+                self._fresh_until[token_id] = fresh_until
+                heapq.heappush(self._fresh_heap, (fresh_until, token_id))
+        else:
+            self._fresh_until.pop(token_id, None)
+
+    def expire(self, now: Optional[float] = None):
+        """Move tokens whose AT is no longer fresh out of the ready pools"""
+        now = time.time() if now is None else now
+        heap = self._fresh_heap
+        while heap and heap[0][0] <= now:
+            fresh_until, token_id = heapq.heappop(heap)
+            if self._fresh_until.get(token_id) == fresh_until:
+                self.update(token_id, now)
+
+    # ========== Queries ==========
+
+    def _pools(self, kind: str, tiers: Optional[Iterable[Optional[str]]]) -> List[IndexedSet]:
+        if tiers is None:
+            return [pool for (k, _), pool in self._ready.items() if k == kind and pool]
+        return [pool for pool in (self._ready.get((kind, tier)) for tier in tiers) if pool]
+
+    def choose(
+        self,
+        kind: str,
+        tiers: Optional[Iterable[Optional[str]]] = None,
+        rng=random,
+        exclude: Optional[Set[int]] = None
+    ) -> Optional[int]:
+        """Pick a ready token uniformly at random, optionally limited to tiers and skipping `exclude`"""
+        self.expire()
+        pools = self._pools(kind, tiers)
+        total = sum(len(pool) for pool in pools)
+        if not total:
+            return None
+
+        for _ in range(self.EXCLUDE_SAMPLES if exclude else 1):
+            n = rng.randrange(total)
+            for pool in pools:
+                if n < len(pool):
+                    token_id = pool[n]
+                    break
+                n -= len(pool)
+            if not exclude or token_id not in exclude:
+                return token_id
+
+        # Mostly excluded: fall back to a scan
+        remaining = [token_id for pool in pools for token_id in pool if token_id not in exclude]
+        return rng.choice(remaining) if remaining else None
+
+    def choose_stale(self, kind: str, rng=random) -> Optional[int]:
+        """Pick a token that is only missing a fresh AT"""
+        self.expire()
+        stale = self._stale[kind]
+        return stale.choice(rng) if stale else None
+
+    def has_busy(
+        self,
+        kind: str,
+        tiers: Optional[Iterable[Optional[str]]] = None,
+        exclude: Optional[Set[int]] = None
+    ) -> bool:
+        """True if some usable token for `kind` (and tiers, not in `exclude`) only lacks a free concurrency slot"""
+        if tiers is None and not exclude:
+            return bool(self._busy[kind])
+        tiers = set(tiers) if tiers is not None else None
+        for token_id in self._busy[kind]:
+            if exclude and token_id in exclude:
+                continue
+            if tiers is None:
+                return True
+            runtime = self.registry.runtime(token_id)
+            if runtime is not None and runtime.tier in tiers:
+                return True
+        return False
+
+    def is_ready(self, kind: str, token_id: int) -> bool:
+        """True if the token is in a ready pool for `kind`"""
+        self.expire()
+        return any(key[0] == kind for key in self._memberships.get(token_id, ()))
+
+    def ready_ids(
+        self,
+        kind: str,
+        tiers: Optional[Iterable[Optional[str]]] = None,
+        exclude: Optional[Set[int]] = None
+    ) -> List[int]:
+        """All ready token IDs for `kind` (O(N), for strategies that compare tokens)"""
+        self.expire()
+        return [
+            token_id for pool in self._pools(kind, tiers) for token_id in pool
+            if not exclude or token_id not in exclude
+        ]
+
+    def get_stats(self) -> dict:
+        """Ready pool sizes per kind and tier"""
+        self.expire()
+        stats: Dict[str, Dict[str, int]] = {kind: {} for kind in KINDS}
+        for (kind, tier), pool in self._ready.items():
+            if pool:
+                stats[kind][tier or "unknown"] = len(pool)
+        for kind in KINDS:
+            stats[kind]["stale"] = len(self._stale[kind])
+            stats[kind]["busy"] = len(self._busy[kind])
+        return stats
@@ -0,0 +1,227 @@
+"""In-memory token registry for Flow2API"""
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+from ..core.models import Token
+from ..core.logger import debug_logger
+
+
+# Token field order used for the stored row tuples
+TOKEN_FIELDS = tuple(Token.model_fields)
+_FIELD_INDEX = {name: i for i, name in enumerate(TOKEN_FIELDS)}
+_ST = _FIELD_INDEX["st"]
+_EMAIL = _FIELD_INDEX["email"]
+_IS_ACTIVE = _FIELD_INDEX["is_active"]
+_CREATED_AT = _FIELD_INDEX["created_at"]
+_USE_COUNT = _FIELD_INDEX["use_count"]
+_LAST_USED_AT = _FIELD_INDEX["last_used_at"]
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    """POSIX timestamp of a (naive = UTC) datetime, 0.0 if unknown"""
+    if value is None:
+        return 0.0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class TokenRuntime:
+    """Scheduling fields of one token, as read by the load balancer
+
+    Records are replaced on update and never mutated in place.
+    """
+
+    __slots__ = (
+        "id", "is_active", "image_enabled", "video_enabled",
+        "has_at", "at_expires", "credits", "tier",
+        "image_concurrency", "video_concurrency"
+    )
+
+    def __init__(self, row: tuple):
+        get = row.__getitem__
+        self.id: int = get(_FIELD_INDEX["id"])
+        self.is_active: bool = get(_IS_ACTIVE)
+        self.image_enabled: bool = get(_FIELD_INDEX["image_enabled"])
+        self.video_enabled: bool = get(_FIELD_INDEX["video_enabled"])
+        self.has_at: bool = bool(get(_FIELD_INDEX["at"]))
+        self.at_expires: float = _timestamp(get(_FIELD_INDEX["at_expires"]))
+        self.credits: int = get(_FIELD_INDEX["credits"])
+        self.tier: Optional[str] = get(_FIELD_INDEX["user_paygate_tier"])
+        self.image_concurrency: int = get(_FIELD_INDEX["image_concurrency"])
+        self.video_concurrency: int = get(_FIELD_INDEX["video_concurrency"])
+
+    def at_fresh(self, now: float, lead_seconds: float = 3600) -> bool:
+        """True if the AT exists and is valid for at least `lead_seconds` more"""
+        return self.has_at and self.at_expires - now >= lead_seconds
+
+
+class TokenRegistry:
+    """In-memory token table kept in sync with SQLite (write-through)
+
+    The registry is loaded once at startup. Every token mutation made through
+    TokenManager is written to the database first and then applied here, so
+    token selection never has to query the database.
+
+    Tokens are stored compactly: one plain tuple per token (fields in
+    TOKEN_FIELDS order) plus a TokenRuntime record with the scheduling
+    fields. Token models are only built (without validation) when a caller
+    asks for one, so every returned Token is an independent snapshot.
+    Lookups by email go through an index (email -> token id).
+    """
+
+    def __init__(self):
+        self._rows: Dict[int, tuple] = {}
+        self._runtime: Dict[int, TokenRuntime] = {}
+        self._by_email: Dict[str, int] = {}
+        self._listeners: List[Callable[[int, Optional[TokenRuntime]], None]] = []
+
+    def add_listener(self, listener: Callable[[int, Optional[TokenRuntime]], None]):
+        """Register a callback run after every change
+
+        The callback receives (token_id, new TokenRuntime), or (token_id, None)
+        when the token was removed. It must not block.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, token_id: int, runtime: Optional[TokenRuntime]):
+        for listener in self._listeners:
+            try:
+                listener(token_id, runtime)
+            except Exception as e:
+                debug_logger.log_error(f"[TOKEN_REGISTRY] Listener failed for token {token_id}: {e}")
+
+    async def load(self, db):
+        """Load all tokens from the database
+
+        Args:
+            db: Database instance
+        """
+        tokens = await db.get_all_tokens()
+        for token_id in list(self._rows):
+            self.remove(token_id)
+        for token in tokens:
+            self.put(token)
+        debug_logger.log_info(f"[TOKEN_REGISTRY] Loaded {len(self._rows)} tokens")
+
+    @staticmethod
+    def _materialize(row: tuple) -> Token:
+        return Token.model_construct(**dict(zip(TOKEN_FIELDS, row)))
+
+    def _index_email(self, email: Optional[str], token_id: int):
+        if email and self._by_email.get(email) not in self._rows:
+            self._by_email[email] = token_id
+
+    def _unindex_email(self, email: Optional[str], token_id: int):
+        if email and self._by_email.get(email) == token_id:
+            del self._by_email[email]
+            # Emails are not unique in the database: fall back to another token
+            other = next((tid for tid, r in self._rows.items() if r[_EMAIL] == email), None)
+            if other is not None:
+                self._by_email[email] = other
+
+    def _store(self, row: tuple, notify: bool = True):
+        token_id = row[_FIELD_INDEX["id"]]
+        old = self._rows.get(token_id)
+        self._rows[token_id] = row
+        if old is None or old[_EMAIL] != row[_EMAIL]:
+            if old is not None:
+                self._unindex_email(old[_EMAIL], token_id)
+            self._index_email(row[_EMAIL], token_id)
+        if not notify:
+            # No scheduling field changed: the TokenRuntime record stays valid
+            return
+        runtime = TokenRuntime(row)
+        self._runtime[token_id] = runtime
+        self._notify(token_id, runtime)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # ========== Runtime records (load balancer) ==========
+
+    def runtime(self, token_id: int) -> Optional[TokenRuntime]:
+        """Get the scheduling record of a token"""
+        return self._runtime.get(token_id)
+
+    def active_runtime(self) -> List[TokenRuntime]:
+        """Get scheduling records of all active tokens"""
+        return [rt for rt in self._runtime.values() if rt.is_active]
+
+    # ========== Token views ==========
+
+    def get(self, token_id: int) -> Optional[Token]:
+        """Get token by ID"""
+        row = self._rows.get(token_id)
+        return self._materialize(row) if row else None
+
+    def get_by_st(self, st: str) -> Optional[Token]:
+        """Get token by ST"""
+        row = next((r for r in self._rows.values() if r[_ST] == st), None)
+        return self._materialize(row) if row else None
+
+    def get_by_email(self, email: str) -> Optional[Token]:
+        """Get token by email"""
+        row = self._rows.get(self._by_email.get(email))
+        return self._materialize(row) if row else None
+
+    def all(self) -> List[Token]:
+        """Get all tokens (newest first, same order as Database.get_all_tokens)"""
+        rows = sorted(
+            self._rows.values(),
+            key=lambda r: r[_CREATED_AT] or datetime.min,
+            reverse=True
+        )
+        return [self._materialize(row) for row in rows]
+
+    def active(self) -> List[Token]:
+        """Get all active tokens"""
+        return [self._materialize(row) for row in self._rows.values() if row[_IS_ACTIVE]]
+
+    # ========== Mutations ==========
+
+    def put(self, token: Token):
+        """Insert or replace a token"""
+        self._store(tuple(getattr(token, name) for name in TOKEN_FIELDS))
+
+    def update(self, token_id: int, **fields):
+        """Apply field updates to a token
+
+        Mirrors Database.update_token: fields whose value is None are skipped.
+        """
+        row = self._rows.get(token_id)
+        if row is None:
+            return
+
+        changes = {
+            _FIELD_INDEX[key]: value for key, value in fields.items()
+            if value is not None and key in _FIELD_INDEX
+        }
+        if changes:
+            self._store(tuple(changes.get(i, value) for i, value in enumerate(row)))
+
+    def add_usage(self, token_id: int, used_at: datetime):
+        """Count one use of a token without notifying listeners (no scheduling field changes)"""
+        row = self._rows.get(token_id)
+        if row is None:
+            return
+        row = list(row)
+        row[_USE_COUNT] = (row[_USE_COUNT] or 0) + 1
+        row[_LAST_USED_AT] = used_at
+        self._store(tuple(row), notify=False)
+
+    def clear(self, token_id: int, *names: str):
+        """Set fields to None (update() skips None values)"""
+        row = self._rows.get(token_id)
+        if row is None:
+            return
+
+        indexes = {_FIELD_INDEX[name] for name in names}
+        self._store(tuple(None if i in indexes else value for i, value in enumerate(row)))
+
+    def remove(self, token_id: int):
+        """Remove a token"""
+        row = self._rows.pop(token_id, None)
+        if row is not None:
+            self._unindex_email(row[_EMAIL], token_id)
+        if self._runtime.pop(token_id, None) is not None:
+            self._notify(token_id, None)
@@ -0,0 +1,139 @@
+"""Timer-driven auto-unban for Flow2API"""
+import asyncio
+import heapq
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from ..core.logger import debug_logger
+from .token_registry import TokenRuntime
+
+
+def _aware(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+class UnbanScheduler:
+    """Re-enables banned tokens at their exact release time
+
+    Each banned token (is_active = 0 with a ban_reason) sits in a min-heap
+    keyed on banned_at + durations[ban_reason]. Reasons without a positive
+    duration are never released automatically. The heap is rebuilt from the
+    database by start() and kept current through a TokenRegistry listener:
+    a new ban schedules the token, enabling or deleting it unschedules it.
+
+    As before, tokens whose AT has expired are not re-enabled.
+    """
+
+    def __init__(self, token_manager, durations: Dict[str, int]):
+        self.token_manager = token_manager
+        self.durations = {reason: seconds for reason, seconds in durations.items() if seconds > 0}
+
+        self._heap: List[Tuple[float, int]] = []  # (release_at, token_id)
+        self._release: Dict[int, float] = {}  # token_id -> current release time
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters
+        self.released = 0
+
+        token_manager.registry.add_listener(self._on_token_changed)
+
+    # ========== Scheduling ==========
+
+    def _schedule(self, token_id: int, release_at: float):
+        if self._release.get(token_id) == release_at:
+            return
+        self._release[token_id] = release_at
+        heapq.heappush(self._heap, (release_at, token_id))
+        if self._heap[0][1] == token_id:
+            self._wakeup.set()
+
+    def _schedule_token(self, token) -> bool:
+        duration = self.durations.get(token.ban_reason)
+        if not duration or not token.banned_at:
+            self._release.pop(token.id, None)
+            return False
+        self._schedule(token.id, _aware(token.banned_at).timestamp() + duration)
+        return True
+
+    def _on_token_changed(self, token_id: int, runtime: Optional[TokenRuntime]):
+        """Registry listener"""
+        if runtime is None or runtime.is_active:
+            self._release.pop(token_id, None)
+            return
+        token = self.token_manager.registry.get(token_id)
+        if token is not None:
+            self._schedule_token(token)
+
+    async def rebuild(self) -> int:
+        """Rebuild the heap from the database, returns number of scheduled tokens"""
+        self._heap = []
+        self._release = {}
+        scheduled = 0
+        for token in await self.token_manager.db.get_banned_tokens():
+            scheduled += self._schedule_token(token)
+        self._wakeup.set()
+        return scheduled
+
+    def get_stats(self) -> dict:
+        """Get scheduler counters"""
+        next_release = min(self._release.values()) if self._release else None
+        return {
+            "scheduled": len(self._release),
+            "next_release_in": max(next_release - time.time(), 0) if next_release is not None else None,
+            "released": self.released
+        }
+
+    # ========== Release ==========
+
+    async def _release_token(self, token_id: int):
+        token = self.token_manager.registry.get(token_id)
+        if token is None or token.is_active:
+            return
+
+        if token.at_expires and _aware(token.at_expires) <= datetime.now(timezone.utc):
+            debug_logger.log_info(f"[AUTO_UNBAN] Token {token_id} 已过期，跳过解禁")
+            return
+
+        debug_logger.log_info(
+            f"[AUTO_UNBAN] 解禁Token {token_id} (原因: {token.ban_reason}, 禁用时间: {token.banned_at})"
+        )
+        await self.token_manager.unban_token(token_id)
+        self.released += 1
+
+    async def _scheduler_loop(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+
+            while self._heap and self._heap[0][0] <= now:
+                release_at, token_id = heapq.heappop(self._heap)
+                if self._release.get(token_id) != release_at:
+                    continue  # Rescheduled or unscheduled since this entry was pushed
+                del self._release[token_id]
+                try:
+                    await self._release_token(token_id)
+                except Exception as e:
+                    debug_logger.log_error(f"[AUTO_UNBAN] Token {token_id}: unban failed - {e}")
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        """Rebuild from the database and start the scheduler loop"""
+        if self._task is None:
+            await self.rebuild()
+            self._task = asyncio.create_task(self._scheduler_loop())
+
+    async def stop(self):
+        """Stop the scheduler loop"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None